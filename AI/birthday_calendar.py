@@ -10,30 +10,37 @@ from aiogram import types
 from aiogram.types import Message
 import logging
 import traceback
-from config import model, LOG_FILE, ADMIN_ID, gigachat_model, groq_ai, chat_settings
+from config import model, ADMIN_ID, gigachat_model, groq_ai, chat_settings
 from features.chat_settings import save_chat_settings
+from core.json_store import JsonStateStore
+from core.message_log import message_log
 
 # Файл для хранения дней рождения
 BIRTHDAY_FILE = "birthdays.json"
 
-def load_birthdays() -> Dict:
-    """Загрузка дней рождения из файла"""
+def _read_birthdays() -> Dict:
     try:
-        with open(BIRTHDAY_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {}
+        data = _birthdays_store.read({})
     except json.JSONDecodeError:
         logging.error(f"Ошибка чтения файла {BIRTHDAY_FILE}")
         return {}
+    return data if isinstance(data, dict) else {}
+
+_birthdays: Optional[Dict] = None
+_birthdays_store = JsonStateStore(BIRTHDAY_FILE, lambda: _birthdays or {}, indent=2)
+
+def load_birthdays() -> Dict:
+    """Дни рождения всех чатов: читаются с диска один раз, дальше живут в памяти"""
+    global _birthdays
+    if _birthdays is None:
+        _birthdays = _read_birthdays()
+    return _birthdays
 
 def save_birthdays(birthdays: Dict) -> None:
-    """Сохранение дней рождения в файл"""
-    try:
-        with open(BIRTHDAY_FILE, 'w', encoding='utf-8') as f:
-            json.dump(birthdays, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        logging.error(f"Ошибка сохранения файла {BIRTHDAY_FILE}: {e}")
+    """Сохранение дней рождения (запись в файл отложенная)"""
+    global _birthdays
+    _birthdays = birthdays
+    _birthdays_store.mark_dirty()
 
 def get_chat_birthdays(chat_id: int) -> Dict:
     """Получение дней рождения для конкретного чата"""
@@ -89,16 +96,15 @@ def parse_birthday_date(text: str) -> Optional[Tuple[int, int]]:
 def get_user_messages_from_log(user_id: int, chat_id: int, limit: int = 100) -> List[str]:
     """Получение случайных сообщений пользователя из лога конкретного чата"""
     messages = []
+    user_id = str(user_id)
     try:
-        with open(LOG_FILE, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-            
         user_messages = []
-        for line in lines:
-            if f"Chat {chat_id}" in line and f"User {user_id}" in line and "]:" in line:
-                message_text = line.split("]:")[1].strip()
-                if message_text and len(message_text) > 10:
-                    user_messages.append(message_text)
+        for record in message_log.iter_chat(chat_id):
+            if record.user_id != user_id:
+                continue
+            message_text = record.text.strip()
+            if message_text and len(message_text) > 10:
+                user_messages.append(message_text)
         
         if len(user_messages) > limit:
             messages = random.sample(user_messages, limit)
@@ -235,7 +241,7 @@ async def check_birthdays_and_send_greetings(bot):
                             
                             logging.info(f"Поздравляем пользователя {user_id} в чате {chat_id}")
                             
-                            user_messages = get_user_messages_from_log(int(user_id), chat_id_int)
+                            user_messages = await asyncio.to_thread(get_user_messages_from_log, int(user_id), chat_id_int)
                             user_name = user_data.get('name', 'Неизвестный')
                             
                             if not user_messages:
@@ -401,7 +407,8 @@ async def handle_test_greeting_command(message: Message):
 
         user_id, user_data = user_info
 
-        user_messages = get_user_messages_from_log(
+        user_messages = await asyncio.to_thread(
+            get_user_messages_from_log,
             int(user_id),
             message.chat.id
         )
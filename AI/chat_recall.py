@@ -1,6 +1,6 @@
 # === AI/chat_recall.py — работа с памятью чата и фактчек ===
 #
-# Три функции на базе лога сообщений (LOG_FILE):
+# Три функции на базе лога сообщений (core.message_log):
 #  - "упупа когда мы говорили про X" — поиск эпизодов в истории чата + AI-сводка с датами
 #  - "упупа рассуди" (реплаем на спор или просто в чат) — вердикт по перепалке,
 #    промпт тот же, что у "чотам" (PROMPTS_MEDIA)
@@ -15,7 +15,8 @@ from datetime import datetime
 from aiogram import types
 from thefuzz import fuzz
 
-from config import LOG_FILE
+from core.message_log import message_log
+from core.recall_index import recall_index
 from prompts import PROMPTS_MEDIA
 from core.upupa_utils import normalize_upupa_command
 from AI.summarize import _generate_with_active_model
@@ -26,35 +27,19 @@ MATCH_THRESHOLD = 60   # минимальная схожесть (0-100) для
 MAX_EPISODES = 5       # сколько эпизодов показывать модели
 CONTEXT_WINDOW = 3     # сколько сообщений контекста брать вокруг совпадения
 MIN_HISTORY = 10       # меньше сообщений в логе — искать не в чем
-
-_LOG_RE = re.compile(
-    r"(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d+) - Chat (\-?\d+) \((.*?)\) - User (\d+) \((.*?)\) \[(.*?)\]: (.*)$"
-)
+RECALL_CANDIDATES = 300  # сколько BM25-кандидатов из индекса перебирать нечётким сравнением
 
 
 def _read_chat_log(chat_id: str) -> list[dict]:
     """Все сообщения чата из лога: [{dt, name, text}], в хронологическом порядке."""
     out = []
-    chat_id = str(chat_id)
     try:
-        with open(LOG_FILE, "r", encoding="utf-8") as f:
-            for line in f:
-                if chat_id not in line:
-                    continue
-                m = _LOG_RE.search(line)
-                if not m:
-                    continue
-                ts, log_chat_id, _chat, _uid, username, display, text = m.groups()
-                if log_chat_id != chat_id or not text.strip():
-                    continue
-                try:
-                    dt = datetime.strptime(ts, "%Y-%m-%dT%H:%M:%S.%f")
-                except ValueError:
-                    continue
-                name = (display or "").strip() or username
-                out.append({"dt": dt, "name": name, "text": text.strip()})
-    except FileNotFoundError:
-        pass
+        for record in message_log.iter_chat(chat_id):
+            text = record.text.strip()
+            if not text:
+                continue
+            name = (record.full_name or "").strip() or record.username
+            out.append({"dt": record.timestamp, "name": name, "text": text})
     except Exception as e:
         logging.error(f"[chat_recall] не смог прочитать лог: {e}")
     return out
@@ -62,12 +47,26 @@ def _read_chat_log(chat_id: str) -> list[dict]:
 
 # ================== "УПУПА КОГДА МЫ ГОВОРИЛИ ПРО" ==================
 
-def _find_episodes(messages: list[dict], query: str) -> list[list[dict]]:
-    """Ищет эпизоды обсуждения темы: топ совпадений + контекст вокруг каждого."""
+def _find_episodes(chat_id: str, query: str) -> list[list[dict]] | None:
+    """Ищет эпизоды обсуждения темы: топ совпадений + контекст вокруг каждого.
+
+    Кандидаты берутся из полнотекстового индекса (core.recall_index), нечётко
+    переранжируются только они. None — если истории чата слишком мало,
+    [] — если ничего не нашлось (в том числе когда индекс не отвечает).
+    """
+    try:
+        recall_index.ensure_chat(chat_id)
+        if recall_index.message_count(chat_id) < MIN_HISTORY:
+            return None
+        candidates = recall_index.candidates(chat_id, query, RECALL_CANDIDATES)
+    except Exception as e:
+        logging.error(f"[chat_recall] поиск по индексу не удался: {e}", exc_info=True)
+        return []
+
     query_l = query.lower()
     scored = []
-    for i, msg in enumerate(messages):
-        text_l = msg["text"].lower()
+    for i, text in candidates:
+        text_l = text.lower()
         if query_l in text_l:
             score = 100
         else:
@@ -87,12 +86,14 @@ def _find_episodes(messages: list[dict], query: str) -> list[list[dict]]:
         picked_idx.append(i)
 
     picked_idx.sort()
-    episodes = []
-    for i in picked_idx:
-        lo = max(0, i - CONTEXT_WINDOW)
-        hi = min(len(messages), i + CONTEXT_WINDOW + 1)
-        episodes.append(messages[lo:hi])
-    return episodes
+    try:
+        return [
+            recall_index.window(chat_id, max(0, i - CONTEXT_WINDOW), i + CONTEXT_WINDOW)
+            for i in picked_idx
+        ]
+    except Exception as e:
+        logging.error(f"[chat_recall] не смог прочитать эпизоды из индекса: {e}", exc_info=True)
+        return []
 
 
 def _extract_recall_topic(text: str) -> str:
@@ -112,12 +113,10 @@ async def process_recall_command(message: types.Message):
     chat_id = str(message.chat.id)
     status = await message.reply("Копаюсь в ваших грязных архивах...")
 
-    messages = await asyncio.to_thread(_read_chat_log, chat_id)
-    if len(messages) < MIN_HISTORY:
+    episodes = await asyncio.to_thread(_find_episodes, chat_id, topic)
+    if episodes is None:
         await status.edit_text("У меня еще слишком мало компромата на этот чат.")
         return
-
-    episodes = await asyncio.to_thread(_find_episodes, messages, topic)
     if not episodes:
         await status.edit_text(f"Хуй там. Про «{topic}» вы никогда не говорили. Или говорили так убого, что я не запомнил.")
         return
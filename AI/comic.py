@@ -17,7 +17,6 @@ from aiogram import types
 from aiogram.types import BufferedInputFile
 from PIL import Image, ImageDraw, ImageFont
 
-from config import LOG_FILE
 from AI.summarize import _get_chat_messages, _generate_with_active_model
 from AI.picgeneration import pollinations_generate
 
@@ -119,7 +118,7 @@ async def process_comic_command(message: types.Message):
 
     time_threshold = datetime.now() - timedelta(hours=COMIC_HOURS)
     messages, _users, chat_name = await asyncio.to_thread(
-        _get_chat_messages, LOG_FILE, chat_id, time_threshold
+        _get_chat_messages, chat_id, time_threshold
     )
     if not messages or len(messages) < MIN_MESSAGES:
         await status.edit_text(f"За последние {COMIC_HOURS} часов нихуя не произошло. Комикс про пустоту рисовать не буду.")
@@ -6,13 +6,20 @@ import re
 from aiogram import Router, F, Bot
 from aiogram.types import Message, PollAnswer
 from config import model, gigachat_model, groq_ai, chat_settings  # Импорт моделей и настроек
+from core.bounded import TTLDict
 
 dnd_router = Router()
 
+SESSION_TTL = 24 * 3600  # брошенная игра забывается через сутки тишины
+
+def _on_session_expired(chat_id, session):
+    poll_map.pop(session.current_poll_id, None)
+
 # Хранилище активных сессий: chat_id -> GameSession
-dnd_sessions = {}
+dnd_sessions = TTLDict(SESSION_TTL, max_size=500, refresh_on_access=True,
+                       name="dnd_sessions", on_evict=_on_session_expired)
 # Хранилище связи опроса с чатом: poll_id -> chat_id (нужно для PollAnswer)
-poll_map = {}
+poll_map = TTLDict(SESSION_TTL, name="dnd_polls")
 
 DND_SYSTEM_PROMPT = """
 Ты — Мастер Подземелий (Dungeon Master) в текстовой RPG.
@@ -1,14 +1,97 @@
-"""GigaChat conversation wrapper using the current API endpoint and request schema."""
+"""GigaChat conversation wrapper using the current API endpoint and request schema.
 
+All GigaChat callers share one long-lived client per credential (``get_client``):
+one OAuth token and one keep-alive connection pool instead of a fresh client,
+token exchange and TLS handshake for every model attempt. ``run_token_refresher``
+renews each pooled token TOKEN_REFRESH_LEAD seconds before it expires, so chat
+requests never wait for the token round-trip.
+"""
+
+import asyncio
 import logging
 import threading
+import time
 from typing import List, Optional
 
 from gigachat import GigaChat
+from gigachat.api import auth as gigachat_auth
 from gigachat.models import Chat, Messages, MessagesRole
 
+from core.model_telemetry import model_telemetry
+
 
 GIGACHAT_BASE_URL = "https://api.giga.chat/v1"
+GIGACHAT_TIMEOUT = 120
+GIGACHAT_MAX_CONNECTIONS = 16
+TOKEN_REFRESH_LEAD = 120.0      # renew this many seconds before expiry
+TOKEN_RETRY_DELAY = 30.0        # after a failed renewal
+
+_clients: dict[str, GigaChat] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(credentials: str) -> GigaChat:
+    """Return the shared client for these credentials, creating it on first use."""
+    with _clients_lock:
+        client = _clients.get(credentials)
+        if client is None:
+            client = _clients[credentials] = GigaChat(
+                credentials=credentials,
+                base_url=GIGACHAT_BASE_URL,
+                verify_ssl_certs=False,
+                timeout=GIGACHAT_TIMEOUT,
+                max_connections=GIGACHAT_MAX_CONNECTIONS,
+            )
+        return client
+
+
+def refresh_token(client: GigaChat) -> float:
+    """Renew the client's token if it expires within TOKEN_REFRESH_LEAD (blocking).
+
+    The new token is fetched first and then swapped in, so requests running
+    meanwhile keep using the old one, which is still valid. Returns the number
+    of seconds until the next renewal is due.
+    """
+    token = client._access_token
+    now_ms = time.time() * 1000
+    if token is None or token.expires_at - now_ms <= TOKEN_REFRESH_LEAD * 1000:
+        settings = client._settings
+        token = gigachat_auth.auth_sync(
+            client._auth_client,
+            url=settings.auth_url,
+            credentials=settings.credentials,
+            scope=settings.scope,
+        )
+        client._access_token = token
+        logging.info("GigaChat token renewed, expires in %.0fs", (token.expires_at - now_ms) / 1000)
+    return max((token.expires_at - now_ms) / 1000 - TOKEN_REFRESH_LEAD, 1.0)
+
+
+async def run_token_refresher():
+    """Keep every pooled client's token fresh (background task from main.py)."""
+    while True:
+        delay = TOKEN_REFRESH_LEAD
+        with _clients_lock:
+            clients = [client for client in _clients.values() if client._settings.credentials]
+        for client in clients:
+            try:
+                delay = min(delay, await asyncio.to_thread(refresh_token, client))
+            except Exception as exc:
+                logging.warning("GigaChat token renewal failed: %s", exc)
+                delay = min(delay, TOKEN_RETRY_DELAY)
+        await asyncio.sleep(delay)
+
+
+async def close_clients():
+    """Close the pooled clients' connections (bot shutdown)."""
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        try:
+            await client.aclose()
+        except Exception as exc:
+            logging.warning("GigaChat client close failed: %s", exc)
 
 
 class GigaChatResponse:
@@ -68,6 +151,67 @@ class GigaChatConversationWrapper:
             if key is not None:
                 self.last_used_model_by_chat[key] = model_name
 
+    @property
+    def client(self) -> GigaChat:
+        return get_client(self.api_key)
+
+    @staticmethod
+    def _payload(model_name: str, prompt: str, temperature: float, max_tokens: int) -> Chat:
+        return Chat(
+            model=model_name,
+            messages=[
+                Messages(
+                    role=MessagesRole.USER,
+                    content=prompt,
+                )
+            ],
+            temperature=temperature,
+            max_tokens=max_tokens,
+        )
+
+    def _succeeded(self, response, *, chat_id, model_name: str, prompt: str, depth: int,
+                   call_started: float, attempt_started: float) -> GigaChatResponse:
+        content = response.choices[0].message.content or ""
+        now = time.monotonic()
+        usage = getattr(response, "usage", None)
+        model_telemetry.record_attempt("gigachat", model_name, None, now - attempt_started)
+        model_telemetry.record_call(
+            "gigachat", model_name, None, now - call_started,
+            attempts=depth + 1, fallback_depth=depth,
+            prompt_chars=len(prompt), response_chars=len(content),
+            prompt_tokens=getattr(usage, "prompt_tokens", None),
+            completion_tokens=getattr(usage, "completion_tokens", None),
+        )
+        self._remember_success(chat_id, model_name)
+        logging.info(
+            "GigaChat success chat_id=%s requested_model=%s response_model=%s",
+            chat_id,
+            model_name,
+            getattr(response, "model", None),
+        )
+        return GigaChatResponse(content)
+
+    @staticmethod
+    def _failed(exc: Exception, *, chat_id, model_name: str, attempt_started: float) -> None:
+        model_telemetry.record_attempt(
+            "gigachat", model_name, None, time.monotonic() - attempt_started, error=type(exc).__name__
+        )
+        logging.error(
+            "GigaChat error chat_id=%s model=%s: %s",
+            chat_id,
+            model_name,
+            exc,
+        )
+
+    @staticmethod
+    def _exhausted(queue: List[str], prompt: str, call_started: float):
+        if queue:
+            model_telemetry.record_call(
+                "gigachat", queue[-1], None, time.monotonic() - call_started, ok=False,
+                attempts=len(queue), fallback_depth=len(queue) - 1, prompt_chars=len(prompt),
+            )
+        raise RuntimeError("All GigaChat models failed")
+
     def generate_content(
         self,
         prompt: str,
@@ -82,46 +226,50 @@ class GigaChatConversationWrapper:
 
         queue = self._get_queue(chat_id)
         max_tokens = kwargs.get("max_tokens", 500)
+        call_started = time.monotonic()
+        client = self.client
 
-        for model_name in queue:
+        for depth, model_name in enumerate(queue):
+            attempt_started = time.monotonic()
             try:
-                payload = Chat(
-                    model=model_name,
-                    messages=[
-                        Messages(
-                            role=MessagesRole.USER,
-                            content=prompt,
-                        )
-                    ],
-                    temperature=temperature,
-                    max_tokens=max_tokens,
-                )
+                response = client.chat(self._payload(model_name, prompt, temperature, max_tokens))
+            except Exception as exc:
+                self._failed(exc, chat_id=chat_id, model_name=model_name, attempt_started=attempt_started)
+                continue
+            return self._succeeded(
+                response, chat_id=chat_id, model_name=model_name, prompt=prompt, depth=depth,
+                call_started=call_started, attempt_started=attempt_started,
+            )
 
-                with GigaChat(
-                    credentials=self.api_key,
-                    base_url=GIGACHAT_BASE_URL,
-                    verify_ssl_certs=False,
-                    timeout=120,
-                ) as giga:
-                    response = giga.chat(payload)
-
-                content = response.choices[0].message.content or ""
-                self._remember_success(chat_id, model_name)
-                logging.info(
-                    "GigaChat success chat_id=%s requested_model=%s response_model=%s",
-                    chat_id,
-                    model_name,
-                    getattr(response, "model", None),
-                )
-                return GigaChatResponse(content)
+        self._exhausted(queue, prompt, call_started)
+
+    async def agenerate_content(
+        self,
+        prompt: str,
+        *,
+        chat_id=None,
+        temperature: float = 0.7,
+        **kwargs,
+    ) -> GigaChatResponse:
+        """Same as ``generate_content`` over the shared client's async connection pool."""
+        if not isinstance(prompt, str):
+            raise TypeError("GigaChat conversation wrapper currently accepts text prompts only")
 
+        queue = self._get_queue(chat_id)
+        max_tokens = kwargs.get("max_tokens", 500)
+        call_started = time.monotonic()
+        client = self.client
+
+        for depth, model_name in enumerate(queue):
+            attempt_started = time.monotonic()
+            try:
+                response = await client.achat(self._payload(model_name, prompt, temperature, max_tokens))
             except Exception as exc:
-                logging.error(
-                    "GigaChat error chat_id=%s model=%s: %s",
-                    chat_id,
-                    model_name,
-                    exc,
-                )
+                self._failed(exc, chat_id=chat_id, model_name=model_name, attempt_started=attempt_started)
                 continue
+            return self._succeeded(
+                response, chat_id=chat_id, model_name=model_name, prompt=prompt, depth=depth,
+                call_started=call_started, attempt_started=attempt_started,
+            )
 
-        raise RuntimeError("All GigaChat models failed")
+        self._exhausted(queue, prompt, call_started)
@@ -8,10 +8,9 @@ import threading
 from typing import Optional, Tuple
 from uuid import uuid4
 
-from gigachat import GigaChat
 from gigachat.models import Chat, Messages, MessagesRole
 
-from AI.gigachat_client import GIGACHAT_BASE_URL
+from AI.gigachat_client import get_client
 from core.settings import GIGACHAT_API_KEY
 
 
@@ -19,13 +18,8 @@ _IMAGE_SRC_RE = re.compile(r'<img[^>]+src="([^"]+)"', re.IGNORECASE)
 _SYNC_LOCK = threading.Lock()
 
 
-gigachat_image_client = GigaChat(
-    credentials=GIGACHAT_API_KEY,
-    base_url=GIGACHAT_BASE_URL,
-    model="GigaChat-2",
-    verify_ssl_certs=False,
-    timeout=120,
-)
+# Shared per-credential client: same token and connection pool as text GigaChat.
+gigachat_image_client = get_client(GIGACHAT_API_KEY)
 
 
 def _decode_image_content(content) -> bytes:
@@ -61,6 +55,7 @@ def _generate_gigachat_image_sync(prompt: str) -> Optional[bytes]:
     with _SYNC_LOCK:
         response = gigachat_image_client.chat(
             Chat(
+                model="GigaChat-2",
                 messages=[
                     Messages(
                         role=MessagesRole.USER,
@@ -10,7 +10,6 @@ per-chat history on disk.
 from __future__ import annotations
 
 import asyncio
-import json
 import logging
 import os
 import random
@@ -21,6 +20,7 @@ from pathlib import Path
 from typing import Iterable, Optional
 
 from AI.gigachat_image import generate_gigachat_image
+from core.json_store import JsonStateStore
 
 
 _HISTORY_FILE = Path(__file__).resolve().parent.parent / "pun_history.json"
@@ -30,6 +30,8 @@ _MIN_OVERLAP = 2
 _MAX_ATTEMPTS = 3
 _CANDIDATES_PER_ATTEMPT = 10
 _HISTORY_LOCK = threading.Lock()
+_history: dict[str, list[str]] = {}
+_store = None
 
 # These are especially sticky model cliches observed in production. They are
 # permanently excluded; all other successful results are excluded dynamically
@@ -161,12 +163,9 @@ def is_candidate_acceptable(
     return True
 
 
-def _load_history() -> dict[str, list[str]]:
-    if not _HISTORY_FILE.exists():
-        return {}
+def _load_history(store: JsonStateStore) -> dict[str, list[str]]:
     try:
-        with _HISTORY_FILE.open("r", encoding="utf-8") as handle:
-            raw = json.load(handle)
+        raw = store.read({})
         if not isinstance(raw, dict):
             return {}
         return {
@@ -179,33 +178,34 @@ def _load_history() -> dict[str, list[str]]:
         return {}
 
 
-def _save_history(history: dict[str, list[str]]) -> None:
-    tmp_path = _HISTORY_FILE.with_suffix(".json.tmp")
-    try:
-        with tmp_path.open("w", encoding="utf-8") as handle:
-            json.dump(history, handle, ensure_ascii=False, indent=2)
-        os.replace(tmp_path, _HISTORY_FILE)
-    except Exception as exc:
-        logging.warning("Pun history save failed: %s", exc)
-        try:
-            tmp_path.unlink(missing_ok=True)
-        except Exception:
-            pass
+def _history_snapshot() -> dict[str, list[str]]:
+    with _HISTORY_LOCK:
+        return {chat_id: list(lines) for chat_id, lines in _history.items()}
+
+
+def _history_store() -> JsonStateStore:
+    """History store; call under _HISTORY_LOCK. The file is read once per path."""
+    global _store, _history
+    if _store is None or _store.path != str(_HISTORY_FILE):
+        _store = JsonStateStore(_HISTORY_FILE, _history_snapshot, indent=2)
+        _history = _load_history(_store)
+    return _store
 
 
 def _get_recent(chat_id: str) -> list[str]:
     with _HISTORY_LOCK:
-        return list(_load_history().get(str(chat_id), []))
+        _history_store()
+        return list(_history.get(str(chat_id), []))
 
 
 def _remember(chat_id: str, line: str) -> None:
     with _HISTORY_LOCK:
-        history = _load_history()
-        chat_history = history.setdefault(str(chat_id), [])
+        store = _history_store()
+        chat_history = _history.setdefault(str(chat_id), [])
         if line not in chat_history:
             chat_history.append(line)
-        history[str(chat_id)] = chat_history[-_HISTORY_LIMIT:]
-        _save_history(history)
+        _history[str(chat_id)] = chat_history[-_HISTORY_LIMIT:]
+    store.mark_dirty()
 
 
 def _build_prompt(recent_lines: list[str], attempt: int) -> str:
@@ -7,14 +7,14 @@ import json
 from datetime import datetime, timedelta
 
 import pytz
-import aiofiles
 
 from aiogram.types import Message, PollAnswer
 from aiogram import Bot
 
 # Обновленные импорты для мультимодельности
-from config import LOG_FILE, quiz_questions, quiz_states, model, gigachat_model, groq_ai, chat_settings
+from config import quiz_questions, quiz_states, model, gigachat_model, groq_ai, chat_settings
 from AI.talking import update_chat_settings
+from core.message_log import message_log
 
 
 # Функция для получения временного диапазона
@@ -32,39 +32,38 @@ def get_time_range(days=1):
     return start_time, end_time
 
 # Функция для извлечения сообщений из лог-файла
-async def extract_messages(log_file, chat_id=None, limit=100, days=1):
+async def extract_messages(chat_id, limit=100, days=1):
     messages = []
     start_time, end_time = get_time_range(days)
+    # В логе наивное время, которое здесь исторически трактуется как UTC
+    since = start_time.astimezone(pytz.utc).replace(tzinfo=None)
+    until = end_time.astimezone(pytz.utc).replace(tzinfo=None)
 
     try:
-        async with aiofiles.open(log_file, mode="r", encoding="utf-8") as f:
-            log_lines = await f.readlines()
+        records = await asyncio.to_thread(
+            lambda: list(message_log.iter_chat(chat_id, since=since, until=until))
+        )
 
-        for line in log_lines:
-            match = re.search(r"(.*?) - Chat (.*?) \((.*?)\) - User (.*?) \((.*?)\) \[(.*?)\]: (.*)", line)
-            if match:
-                timestamp_str, msg_chat_id, chat_title, user_id, username, full_name, text = match.groups()
-                
-                msg_time = datetime.fromisoformat(timestamp_str)
-                msg_time = pytz.utc.localize(msg_time).astimezone(pytz.timezone('Europe/Moscow'))
-                
-                if start_time <= msg_time <= end_time:
-                    if not text or text.startswith('/') or (chat_id and str(chat_id) != str(msg_chat_id)):
-                        continue
-
-                    # Используем full_name, если оно не "NoName", иначе username
-                    display_name = full_name if full_name != "NoName" else username
-                    if display_name == "NoUsername": continue # Пропускаем, если нет имени
-
-                    messages.append({
-                        "text": text,
-                        "user_id": user_id,
-                        "username": username,
-                        "full_name": display_name,
-                        "chat_id": msg_chat_id,
-                        "chat_title": chat_title,
-                        "timestamp": timestamp_str
-                    })
+        for record in records:
+            text = record.text
+            if not text or text.startswith('/'):
+                continue
+
+            username = record.username
+            full_name = record.full_name
+            # Используем full_name, если оно не "NoName", иначе username
+            display_name = full_name if full_name != "NoName" else username
+            if display_name == "NoUsername": continue # Пропускаем, если нет имени
+
+            messages.append({
+                "text": text,
+                "user_id": record.user_id,
+                "username": username,
+                "full_name": display_name,
+                "chat_id": record.chat_id,
+                "chat_title": record.chat_title,
+                "timestamp": record.timestamp.isoformat()
+            })
 
         return messages[-limit:] if len(messages) > limit else messages
     except Exception as e:
@@ -93,13 +92,14 @@ async def generate_with_active_model(prompt: str, chat_id: str) -> str:
             if active_model == "gigachat":
                 response = gigachat_model.generate_content(prompt, chat_id=int(chat_id))
                 return response.text
-            elif active_model == "groq":
+            else:  # groq
                 return groq_ai.generate_text(prompt, max_tokens=2048)
-            else:  # gemini
-                response = model.generate_content(prompt)
-                return response.text
-        
-        return await asyncio.to_thread(sync_model_call)
+
+        if active_model in ("gigachat", "groq"):
+            return await asyncio.to_thread(sync_model_call)
+        # gemini — asyncio-клиент, без потока пула
+        response = await model.agenerate_content(prompt)
+        return response.text
         
     except Exception as e:
         logging.error(f"Quiz generation error ({active_model}): {e}")
@@ -159,7 +159,7 @@ async def generate_quiz_with_gemini(messages, chat_id: str, num_questions=1):
 
 # Функция для автоматической отправки викторины
 async def send_daily_quiz(bot: Bot, chat_id: int):
-    messages = await extract_messages(LOG_FILE, chat_id, days=1)
+    messages = await extract_messages(chat_id, days=1)
     
     if not messages:
         await bot.send_message(chat_id, "Недостаточно сообщений для создания викторины.")
@@ -236,7 +236,7 @@ async def process_quiz_start(message: Message, bot: Bot) -> tuple[bool, str]:
         return False, "В этом чате уже идет викторина! Отъебись"
     
     try:
-        messages = await extract_messages(LOG_FILE, chat_id, days=4)
+        messages = await extract_messages(chat_id, days=4)
         logging.info(f"Извлечено {len(messages)} сообщений для викторины")
 
         if not messages:
@@ -355,7 +355,7 @@ async def process_participant_quiz_start(message: Message, bot: Bot) -> tuple[bo
         return False, "Угомонись, тут уже идет другая викторина. Отъебись."
 
     try:
-        messages = await extract_messages(LOG_FILE, chat_id, days=7)
+        messages = await extract_messages(chat_id, days=7)
         logging.info(f"Извлечено {len(messages)} сообщений для викторины по участникам")
 
         if len(messages) < 20:
@@ -8,14 +8,15 @@ from aiogram.types import FSInputFile, Message, ReactionTypeEmoji
 from aiogram import Bot
 
 from config import model, groq_ai, gigachat_model, chat_settings, conversation_history
+from core.bounded import TTLDict
 
 # Полный список доступных реакций Telegram
 TELEGRAM_REACTIONS = [
     "❤️", "🥰", "😁", "❤️‍🔥", "💔", "🤨", "👀", "🫡"
 ]
 
-# Кэш последних использованных слов для избежания повторов
-_recent_word_reactions = {}
+# Кэш последних использованных слов для избежания повторов (чат, молчащий сутки, забывается)
+_recent_word_reactions = TTLDict(24 * 3600, max_size=5000, refresh_on_access=True, name="recent_word_reactions")
 
 # --- Универсальная функция выбора активной модели ---
 
@@ -48,31 +49,28 @@ async def generate_with_model(prompt: str, chat_id: int, temperature: float = 0.
     """
     model_instance, model_name = await get_active_model_for_chat(chat_id)
     
-    def sync_generate():
-        try:
-            if model_name == "groq":
-                return groq_ai.generate_text(prompt, max_tokens=max_tokens)
-            elif model_name == "gigachat":
-                response = gigachat_model.generate_content(prompt, chat_id=chat_id)
-                return response.text
-            else:  # gemini
-                response = model.generate_content(
-                    prompt, 
-                    chat_id=chat_id,
-                    generation_config={
-                        'temperature': temperature,
-                        'max_output_tokens': max_tokens,
-                        'top_p': 1.0,
-                    }
-                )
-                if response and response.candidates and response.candidates[0].content.parts:
-                    return response.text.strip()
-                return ""
-        except Exception as e:
-            logging.error(f"Ошибка генерации с моделью {model_name}: {e}")
-            return ""
-    
-    return await asyncio.to_thread(sync_generate)
+    try:
+        if model_name == "groq":
+            return await asyncio.to_thread(groq_ai.generate_text, prompt, max_tokens=max_tokens)
+        if model_name == "gigachat":
+            response = await gigachat_model.agenerate_content(prompt, chat_id=chat_id)
+            return response.text
+        # gemini — asyncio-клиент, без потока пула
+        response = await model.agenerate_content(
+            prompt,
+            chat_id=chat_id,
+            generation_config={
+                'temperature': temperature,
+                'max_output_tokens': max_tokens,
+                'top_p': 1.0,
+            }
+        )
+        if response and response.candidates and response.candidates[0].content.parts:
+            return response.text.strip()
+        return ""
+    except Exception as e:
+        logging.error(f"Ошибка генерации с моделью {model_name}: {e}")
+        return ""
 
 # --- Случайные эмодзи-реакции (БЕЗ AI) ---
 async def set_random_emoji_reaction(message: Message):
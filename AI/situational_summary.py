@@ -16,6 +16,8 @@ import random
 import re
 from typing import Awaitable, Callable, Iterable, Mapping, Sequence
 
+from core.bounded import TTLDict
+
 
 _WORD_RE = re.compile(r"\b[а-яёa-z][а-яёa-z0-9-]{2,31}\b", re.IGNORECASE)
 _RESULT_RE = re.compile(
@@ -36,16 +38,23 @@ _STOP_WORDS = {
     "хоть", "чего", "чем", "что", "чтобы", "эта", "эти", "это", "этот", "ещe",
 }
 
-# Последние слова именно этой реакции — защита от локального зацикливания модели.
-_recent_event_words: dict[str, deque[str]] = {}
-# Отдельный живой контекст для ситуативной реакции.
-_recent_chat_messages: dict[str, deque[dict]] = {}
-# Защита от двойного process_random_reactions для одного Telegram message_id.
-_seen_message_ids: dict[str, deque[int]] = {}
-
 _RECENT_LIMIT = 20
 _CONTEXT_LIMIT = 12
 _SEEN_MESSAGE_LIMIT = 100
+_CHAT_STATE_TTL = 6 * 3600     # буферы чата, молчащего дольше, забываются
+_SEEN_TTL = 3600               # повторная обработка приходит через секунды, не через час
+_MAX_CHATS = 5000
+
+# Последние слова именно этой реакции — защита от локального зацикливания модели.
+_recent_event_words: TTLDict = TTLDict(
+    _CHAT_STATE_TTL, _MAX_CHATS, refresh_on_access=True, name="situational_recent_words"
+)
+# Отдельный живой контекст для ситуативной реакции.
+_recent_chat_messages: TTLDict = TTLDict(
+    _CHAT_STATE_TTL, _MAX_CHATS, refresh_on_access=True, name="situational_context"
+)
+# Защита от двойного process_random_reactions для одного Telegram message_id.
+_seen_message_ids: TTLDict = TTLDict(_SEEN_TTL, _MAX_CHATS, refresh_on_access=True, name="situational_seen_ids")
 _DIRECT_WORD_PROBABILITY = 0.42
 
 
@@ -2,66 +2,50 @@
 
 import logging
 import asyncio
-import re
 import time
 from datetime import datetime, timedelta
 from aiogram import types
 import random
 
-from config import LOG_FILE, model, gigachat_model, groq_ai, chat_settings
+from config import model, gigachat_model, groq_ai, chat_settings
+from core.message_log import message_log
 from prompts import actions
 from features.chat_settings import save_chat_settings
 
-def _get_chat_messages(log_file_path: str, chat_id: str, start_time: datetime):
+def _get_chat_messages(chat_id: str, start_time: datetime):
     """
-    Вспомогательная функция для чтения и парсинга логов.
+    Сообщения чата начиная с start_time. Читает только нужное окно шарда чата
+    (seek по почасовому индексу core.message_log), а не весь лог.
     """
     messages = []
     users_found = {}
     chat_name = None
-    
+
     try:
-        with open(log_file_path, "r", encoding="utf-8") as f:
-            lines = f.readlines()
-            
-            for line in lines:
-                try:
-                    match = re.search(r"(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d+) - Chat (\-?\d+) \((.*?)\) - User (\d+) \((.*?)\) \[(.*?)\]: (.*?)$", line)
-                    
-                    if match:
-                        timestamp_str, log_chat_id, current_chat_name, user_id, username, display_name, text = match.groups()
-                        
-                        if not text.strip():
-                            continue
-                        
-                        # Сохраняем имя чата
-                        if str(log_chat_id) == chat_id and not chat_name:
-                            chat_name = current_chat_name
-                        
-                        try:
-                            log_timestamp = datetime.strptime(timestamp_str, "%Y-%m-%dT%H:%M:%S.%f")
-                            
-                            if str(log_chat_id) == chat_id and log_timestamp >= start_time:
-                                display_name = display_name.strip() if display_name and display_name.strip() else username
-                                date_str = log_timestamp.strftime("%d.%m") 
-                                messages.append({
-                                    "date": date_str,
-                                    "username": username, 
-                                    "display_name": display_name, 
-                                    "text": text.strip()
-                                })
-                                
-                                if username and username.lower() not in ['none', 'null']:
-                                    users_found[user_id] = {"username": username, "display_name": display_name}
-                        
-                        except ValueError as e:
-                            continue
-                    
-                except Exception:
-                    continue
-                    
-    except FileNotFoundError:
-        logging.warning(f"Log file not found: {log_file_path}")
+        for record in message_log.iter_chat(chat_id, since=start_time):
+            text = record.text.strip()
+            if not text:
+                continue
+
+            # Сохраняем имя чата
+            if not chat_name:
+                chat_name = record.chat_title
+
+            username = record.username
+            display_name = record.full_name
+            display_name = display_name.strip() if display_name and display_name.strip() else username
+            messages.append({
+                "date": record.timestamp.strftime("%d.%m"),
+                "username": username,
+                "display_name": display_name,
+                "text": text
+            })
+
+            if username and username.lower() not in ['none', 'null']:
+                users_found[record.user_id] = {"username": username, "display_name": display_name}
+
+    except Exception as e:
+        logging.error(f"Не смог прочитать лог чата {chat_id}: {e}")
         return [], {}, None
 
     return messages, users_found, chat_name
@@ -130,61 +114,82 @@ async def _generate_with_active_model(
     
     logging.info(f"Summarize: используется модель {active_model}")
     
+    max_retries = 2
+    retry_wait = 30
+
+    def handle_error(e: Exception, attempt: int) -> str | None:
+        """Текст-замена для известных ошибок; None — повторить попытку, иначе пробрасывает."""
+        error_str = str(e)
+        if "429" in error_str:
+            if attempt < max_retries:
+                logging.warning(f"Quota 429. Waiting {retry_wait}s...")
+                return None
+            raise e
+        elif "413" in error_str or "request_too_large" in error_str:
+            # Специфичная ошибка Groq - промпт слишком большой
+            return "⚠️ Логов слишком много для Groq. Переключитесь на Gemini командой 'упупа модель gemini' или попробуйте меньший период."
+        elif "PROHIBITED" in error_str or "block_reason" in error_str:
+            return "Google зассал и заблокировал ответ из-за 'недопустимого контента'. Слишком грязно ругаетесь."
+        raise e
+
     def sync_model_call_with_retry():
-        max_retries = 2
         for attempt in range(max_retries + 1):
             try:
-                if active_model == "gigachat":
-                    response = gigachat_model.generate_content(prompt, chat_id=int(chat_id))
-                    return response.text
-                elif active_model == "groq":
-                    # Используем специальную модель для суммаризации
-                    if is_summarization:
-                        logging.info(f"Используется модель суммаризации: {groq_ai.summarization_model}")
-                        # Временно меняем модель
-                        original_model = groq_ai.text_model
-                        groq_ai.text_model = groq_ai.summarization_model
-                        try:
-                            result = groq_ai.generate_text(prompt, max_tokens=2048)
-                        finally:
-                            # Восстанавливаем исходную модель
-                            groq_ai.text_model = original_model
-                    else:
+                # Используем специальную модель для суммаризации
+                if is_summarization:
+                    logging.info(f"Используется модель суммаризации: {groq_ai.summarization_model}")
+                    # Временно меняем модель
+                    original_model = groq_ai.text_model
+                    groq_ai.text_model = groq_ai.summarization_model
+                    try:
                         result = groq_ai.generate_text(prompt, max_tokens=2048)
-                    return result or "Groq вернул пустой ответ"
-                else:  # gemini
-                    response = model.generate_content(
-                        prompt, 
-                        safety_settings=safety_settings,
-                        chat_id=int(chat_id)
-                    )
-                    if not (response.text or ""):
-                        try:
-                            from AI.wrapper import _empty_response_details
-                            logging.warning("Gemini empty summary details: %s", _empty_response_details(response))
-                        except Exception:
-                            logging.warning("Gemini empty summary response without details")
-                    return response.text or ""
-                    
-            except Exception as e:
-                error_str = str(e)
-                if "429" in error_str:
-                    if attempt < max_retries:
-                        wait_time = 30
-                        logging.warning(f"Quota 429. Waiting {wait_time}s...")
-                        time.sleep(wait_time)
-                        continue
-                    else:
-                        raise e
-                elif "413" in error_str or "request_too_large" in error_str:
-                    # Специфичная ошибка Groq - промпт слишком большой
-                    return "⚠️ Логов слишком много для Groq. Переключитесь на Gemini командой 'упупа модель gemini' или попробуйте меньший период."
-                elif "PROHIBITED" in error_str or "block_reason" in error_str:
-                    return "Google зассал и заблокировал ответ из-за 'недопустимого контента'. Слишком грязно ругаетесь."
+                    finally:
+                        # Восстанавливаем исходную модель
+                        groq_ai.text_model = original_model
                 else:
-                    raise e
-    
-    return await asyncio.to_thread(sync_model_call_with_retry)
+                    result = groq_ai.generate_text(prompt, max_tokens=2048)
+                return result or "Groq вернул пустой ответ"
+            except Exception as e:
+                reply = handle_error(e, attempt)
+                if reply is not None:
+                    return reply
+                time.sleep(retry_wait)
+
+    if active_model == "groq":
+        return await asyncio.to_thread(sync_model_call_with_retry)
+
+    if active_model == "gigachat":
+        # общий асинхронный пул соединений GigaChat, без потока пула
+        for attempt in range(max_retries + 1):
+            try:
+                response = await gigachat_model.agenerate_content(prompt, chat_id=int(chat_id))
+                return response.text
+            except Exception as e:
+                reply = handle_error(e, attempt)
+                if reply is not None:
+                    return reply
+                await asyncio.sleep(retry_wait)
+
+    # gemini — asyncio-клиент: ожидание 429 не держит поток пула
+    for attempt in range(max_retries + 1):
+        try:
+            response = await model.agenerate_content(
+                prompt,
+                safety_settings=safety_settings,
+                chat_id=int(chat_id)
+            )
+            if not (response.text or ""):
+                try:
+                    from AI.wrapper import _empty_response_details
+                    logging.warning("Gemini empty summary details: %s", _empty_response_details(response))
+                except Exception:
+                    logging.warning("Gemini empty summary response without details")
+            return response.text or ""
+        except Exception as e:
+            reply = handle_error(e, attempt)
+            if reply is not None:
+                return reply
+            await asyncio.sleep(retry_wait)
 
 
 async def summarize_chat_history(message: types.Message, chat_model, log_file_path: str, action_list: list):
@@ -198,7 +203,7 @@ async def summarize_chat_history(message: types.Message, chat_model, log_file_pa
     await message.reply("Щас всех вас сдам...")
 
     messages_to_summarize, users_in_period, chat_name = await asyncio.to_thread(
-        _get_chat_messages, log_file_path, chat_id, time_threshold
+        _get_chat_messages, chat_id, time_threshold
     )
 
     if not messages_to_summarize:
@@ -287,7 +292,7 @@ async def summarize_year(message: types.Message, chat_model, log_file_path: str,
     status_msg = await message.reply("Я долго терпел вас, уебков")
 
     messages_to_summarize, users_in_period, chat_name = await asyncio.to_thread(
-        _get_chat_messages, log_file_path, chat_id, time_threshold
+        _get_chat_messages, chat_id, time_threshold
     )
 
     if not messages_to_summarize:
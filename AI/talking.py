@@ -29,8 +29,6 @@ from prompts import (
 # Функции для извлечения сообщений
 from features.lexicon_settings import (
     save_user_message,
-    extract_messages_by_username,
-    extract_messages_by_full_name,
     extract_user_messages,
     get_frequent_phrases_from_text,
     build_hybrid_style_sample,
@@ -44,6 +42,7 @@ from features.stat_rank_settings import track_message_statistics
 from services.smart_search import find_relevant_context
 from services.web_context import needs_web_search, get_web_context
 from core.history_engine import load_and_find_answer
+from core.style_corpus import style_corpus
 from AI.response_sanitizer import strip_confidence_percentages
 
 NO_CONFIDENCE_PERCENTAGES_INSTRUCTION = (
@@ -51,6 +50,22 @@ NO_CONFIDENCE_PERCENTAGES_INSTRUCTION = (
     "Если данных не хватает, коротко скажи, что именно нужно уточнить, без процентов."
 )
 
+# Модели с блокирующими клиентами: их вызовы уходят в asyncio.to_thread.
+# Gemini, GigaChat и OpenAI-совместимые провайдеры вызываются асинхронно, без потока пула.
+THREADED_MODELS = ("groq",)
+OPENAI_COMPATIBLE_MODELS = ("openrouter", "siliconflow")
+
+
+async def _generate_openai_compatible(active_model: str, prompt: str, **generation_kwargs) -> str:
+    """OpenRouter / SiliconFlow через общий асинхронный HTTP-клиент."""
+    if active_model == "openrouter":
+        client, name = openrouter_ai, "OpenRouter"
+    else:
+        client, name = siliconflow_ai, "SiliconFlow"
+    result = await client.agenerate_text(prompt, **generation_kwargs)
+    logging.info(f"{name} вернул: '{result[:100] if result else ''}'")
+    return result
+
 # =============================================================================
 # ОБРАБОТЧИКИ КОМАНД ПЕРЕКЛЮЧЕНИЯ МОДЕЛИ (ГЛОБАЛЬНО ДЛЯ ВСЕХ ЧАТОВ)
 # =============================================================================
@@ -167,26 +182,20 @@ async def generate_simple_response(prompt: str, chat_id: str) -> str:
         logging.info(f"generate_simple_response: промпт = {prompt[:200]}...")  # Первые 200 символов
         
         def sync_model_call():
-            if active_model == "gigachat":
-                response = gigachat_model.generate_content(prompt, chat_id=int(chat_id))
-                return response.text
-            elif active_model == "groq":
-                result = groq_ai.generate_text(prompt)
-                logging.info(f"Groq вернул: '{result}'")
-                return result
-            elif active_model == "openrouter":
-                result = openrouter_ai.generate_text(prompt)
-                logging.info(f"OpenRouter вернул: '{result[:100] if result else ''}'")
-                return result
-            elif active_model == "siliconflow":
-                result = siliconflow_ai.generate_text(prompt)
-                logging.info(f"SiliconFlow вернул: '{result[:100] if result else ''}'")
-                return result
-            else:  # gemini
-                response = model.generate_content(prompt, chat_id=int(chat_id))
-                return response.text
-        
-        response_text = await asyncio.to_thread(sync_model_call)
+            result = groq_ai.generate_text(prompt)
+            logging.info(f"Groq вернул: '{result}'")
+            return result
+
+        if active_model == "gigachat":
+            response = await gigachat_model.agenerate_content(prompt, chat_id=int(chat_id))
+            response_text = response.text
+        elif active_model in THREADED_MODELS:
+            response_text = await asyncio.to_thread(sync_model_call)
+        elif active_model in OPENAI_COMPATIBLE_MODELS:
+            response_text = await _generate_openai_compatible(active_model, prompt)
+        else:  # gemini — asyncio-клиент, поток пула не занимается
+            response = await model.agenerate_content(prompt, chat_id=int(chat_id))
+            response_text = response.text
         if response_text is None:
             logging.warning("generate_simple_response: модель вернула None")
             response_text = ""
@@ -326,12 +335,14 @@ async def handle_set_participant_prompt_command(message: types.Message):
 
     display_name = command_part.lstrip('@')
 
-    # Ищем сообщения (сначала по юзернейму, потом по имени)
-    messages = await extract_messages_by_username(display_name, chat_id)
+    # Ищем сообщения (сначала по юзернейму, потом по имени); корпус остаётся в кэше для ответов
+    messages = await style_corpus.load(chat_id, username=display_name)
     found_by = "username"
     if not messages:
-        messages = await extract_messages_by_full_name(display_name, chat_id)
+        messages = await style_corpus.load(chat_id, full_name=display_name)
         found_by = "full_name"
+        if messages:
+            style_corpus.forget(chat_id, username=display_name)
 
     if not messages:
         await message.reply(f"Не могу найти сообщения от пользователя '{display_name}', чтобы ему подражать.")
@@ -554,38 +565,29 @@ async def generate_response(prompt: str, chat_id: str, bot_name: str, user_input
             }
 
         # --- ГЕНЕРАЦИЯ ЧЕРЕЗ НЕЙРОСЕТИ ---
-        def sync_model_call():
-            if active_model == "gigachat":
-                response = gigachat_model.generate_content(
-                    prompt,
-                    chat_id=int(chat_id),
-                    temperature=generation_kwargs.get("temperature", 0.7),
-                )
-                return response.text
-            elif active_model == "groq":
-                return groq_ai.generate_text(prompt, **generation_kwargs)
-            elif active_model == "openrouter":
-                result = openrouter_ai.generate_text(prompt, **generation_kwargs)
-                logging.info(f"OpenRouter вернул: '{result[:100] if result else ''}'")
-                return result
-            elif active_model == "siliconflow":
-                result = siliconflow_ai.generate_text(prompt, **generation_kwargs)
-                logging.info(f"SiliconFlow вернул: '{result[:100] if result else ''}'")
-                return result
-            else:  # gemini
-                gemini_kwargs = {}
-                if generation_kwargs:
-                    gemini_kwargs["generation_config"] = {
-                        "temperature": generation_kwargs["temperature"],
-                    }
-                response = model.generate_content(
-                    prompt,
-                    chat_id=int(chat_id),
-                    **gemini_kwargs,
-                )
-                return response.text
-        
-        response_text = await asyncio.to_thread(sync_model_call)
+        if active_model == "gigachat":
+            response = await gigachat_model.agenerate_content(
+                prompt,
+                chat_id=int(chat_id),
+                temperature=generation_kwargs.get("temperature", 0.7),
+            )
+            response_text = response.text
+        elif active_model in THREADED_MODELS:
+            response_text = await asyncio.to_thread(groq_ai.generate_text, prompt, **generation_kwargs)
+        elif active_model in OPENAI_COMPATIBLE_MODELS:
+            response_text = await _generate_openai_compatible(active_model, prompt, **generation_kwargs)
+        else:  # gemini — asyncio-клиент, поток пула не занимается
+            gemini_kwargs = {}
+            if generation_kwargs:
+                gemini_kwargs["generation_config"] = {
+                    "temperature": generation_kwargs["temperature"],
+                }
+            response = await model.agenerate_content(
+                prompt,
+                chat_id=int(chat_id),
+                **gemini_kwargs,
+            )
+            response_text = response.text
         if response_text is None:
             logging.warning("generate_response: модель вернула None")
             response_text = ""
@@ -653,13 +655,17 @@ async def handle_bot_conversation(message: types.Message, user_first_name: str)
         target_name = imitated_user_data.get("username") or imitated_user_data.get("full_name")
         
         if target_name:
-            if imitated_user_data.get("username"):
-                messages = await extract_messages_by_username(imitated_user_data["username"], chat_id)
-            else:
-                messages = await extract_messages_by_full_name(imitated_user_data["full_name"], chat_id)
+            # корпус из кэша core.style_corpus: лог читается только при первом ответе после рестарта
+            messages = await style_corpus.get(
+                chat_id,
+                username=imitated_user_data.get("username"),
+                full_name=imitated_user_data.get("full_name"),
+            )
             
             if messages:
-                relevant_msgs = await find_relevant_context(user_input, messages, top_k=3)
+                relevant_msgs = await find_relevant_context(
+                    user_input, messages, top_k=3, chat_id=chat_id, user_key=target_name
+                )
                 
                 if relevant_msgs:
                     additional_context = (
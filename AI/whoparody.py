@@ -84,20 +84,20 @@ async def generate_with_active_model(prompt: str, chat_id: int) -> str:
         "HARM_CATEGORY_DANGEROUS_CONTENT": "BLOCK_NONE",
     }
 
-    def sync_generate(model_name: str) -> str:
+    async def generate(model_name: str) -> str:
+        if model_name == "groq":
+            return await asyncio.to_thread(groq_ai.generate_text, prompt) or ""
         if model_name == "gigachat":
-            response = gigachat_model.generate_content(prompt, chat_id=chat_id)
+            response = await gigachat_model.agenerate_content(prompt, chat_id=chat_id)
             return response.text or ""
-        if model_name == "groq":
-            return groq_ai.generate_text(prompt) or ""
         if model_name == "openrouter":
-            return openrouter_ai.generate_text(prompt) or ""
+            return await openrouter_ai.agenerate_text(prompt) or ""
         if model_name == "siliconflow":
-            return siliconflow_ai.generate_text(prompt) or ""
+            return await siliconflow_ai.agenerate_text(prompt) or ""
 
         # Gemini: как у "чобыло", отключаем safety-блокировку. require_text
         # превращает пустой успешный ответ в явную ошибку вместо молчания.
-        response = model.generate_content(
+        response = await model.agenerate_content(
             prompt,
             chat_id=chat_id,
             safety_settings=safety_settings,
@@ -106,7 +106,7 @@ async def generate_with_active_model(prompt: str, chat_id: int) -> str:
         return response.text or ""
 
     try:
-        result = await asyncio.to_thread(sync_generate, active_model)
+        result = await generate(active_model)
         if result and result.strip():
             return result.strip()
         raise RuntimeError(f"{active_model} вернул пустой ответ")
@@ -121,7 +121,7 @@ async def generate_with_active_model(prompt: str, chat_id: int) -> str:
         # пробуем запасную текстовую модель вместо сообщения "Модель промолчала".
         if active_model != "groq":
             try:
-                fallback = await asyncio.to_thread(sync_generate, "groq")
+                fallback = await generate("groq")
                 if fallback and fallback.strip():
                     logging.info("Профиль успешно сгенерирован через аварийный Groq fallback")
                     return fallback.strip()
@@ -1,9 +1,14 @@
 # === wrapper.py ===
 
+import asyncio
+import importlib.util
+import json
 import os
+import random
 import time
 import logging
 import threading
+import weakref
 from typing import Optional, List, Any, Callable, Tuple
 from groq import Groq
 from PIL import Image
@@ -11,37 +16,42 @@ import base64
 import io
 from google import genai
 from google.genai import types as genai_types
-from gigachat import GigaChat
-import requests
+import httpx
+
+from core.model_health import model_health, retry_after_hint
+from core.model_telemetry import content_chars, model_telemetry
+from core.rate_limiter import MAX_WAIT, estimate_tokens, rate_limiter
 
 # =========================
-# === RATE LIMIT CONTROL ===
+# === OPENAI-COMPATIBLE HTTP ===
 # =========================
-# Минимальный интервал между запросами НА ОДИН КЛЮЧ.
-# Лимиты Google считаются по ключу, поэтому глобальный замок на все вызовы
-# (как было раньше) душил параллельные чаты без всякой пользы.
-PER_KEY_MIN_DELAY = 2.5
+OPENAI_COMPAT_TIMEOUT = httpx.Timeout(connect=10.0, read=60.0, write=10.0, pool=10.0)
+OPENAI_COMPAT_LIMITS = httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60.0)
+OPENAI_COMPAT_RETRIES = 3            # повторов сверх первой попытки
+OPENAI_COMPAT_RETRY_MAX_DELAY = 20.0
+_HTTP2 = importlib.util.find_spec("h2") is not None   # httpx умеет HTTP/2 только с пакетом h2
 
-_last_call_ts: dict = {}
-_throttle_lock = threading.Lock()
-_genai_lock = threading.RLock()
+_bg_loop: Optional[asyncio.AbstractEventLoop] = None
+_bg_loop_lock = threading.Lock()
 
 
-def _throttle_key(api_key: str):
-    """Выдерживает PER_KEY_MIN_DELAY между запросами на конкретный ключ.
+def _background_loop() -> asyncio.AbstractEventLoop:
+    """Цикл событий в фоновом потоке: синхронные адаптеры выполняют в нём корутины."""
+    global _bg_loop
+    with _bg_loop_lock:
+        if _bg_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="wrapper-sync-loop", daemon=True).start()
+            _bg_loop = loop
+        return _bg_loop
 
-    Разные ключи друг друга не блокируют. Потокобезопасно: слот времени
-    резервируется под локом, ожидание — вне лока.
-    """
-    while True:
-        with _throttle_lock:
-            now = time.time()
-            last = _last_call_ts.get(api_key, 0.0)
-            wait = PER_KEY_MIN_DELAY - (now - last)
-            if wait <= 0:
-                _last_call_ts[api_key] = now
-                return
-        time.sleep(wait)
+
+# =========================
+# === RATE LIMIT CONTROL ===
+# =========================
+# Лимиты запросов — core.rate_limiter: токен-бакеты RPM/TPM на пару ключ/модель
+# (квоты Google считаются по ключу и модели, а не глобально).
+_genai_lock = threading.RLock()
 
 
 def _extract_error_details(error: Exception) -> Tuple[Optional[int], str]:
@@ -96,6 +106,23 @@ def _empty_response_details(response: Any) -> str:
     return "; ".join(details) or "no candidate text"
 
 
+def _gemini_usage(response: Any) -> Tuple[Optional[int], Optional[int]]:
+    """(токены запроса, токены ответа) из usage_metadata, если есть."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return None, None
+    return getattr(usage, "prompt_token_count", None), getattr(usage, "candidates_token_count", None)
+
+
+def _openai_usage(usage: Any) -> Tuple[Optional[int], Optional[int]]:
+    """(prompt_tokens, completion_tokens) из usage OpenAI-совместимого ответа (объект или dict)."""
+    if usage is None:
+        return None, None
+    if isinstance(usage, dict):
+        return usage.get("prompt_tokens"), usage.get("completion_tokens")
+    return getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None)
+
+
 # =========================
 # === GOOGLE-GENAI ADAPTERS ===
 # Новый SDK (google-genai) клиентный, старый (google.generativeai) — глобальный.
@@ -181,6 +208,17 @@ class _ChatAdapter:
         return self._chat.get_history()
 
 
+class _AsyncChatAdapter(_ChatAdapter):
+    """Чат поверх client.aio: send_message — корутина."""
+
+    async def send_message(self, content, **kwargs):
+        config = _build_config(kwargs)
+        content = _normalize_contents(content)
+        if config is not None:
+            return await self._chat.send_message(content, config=config)
+        return await self._chat.send_message(content)
+
+
 class GeminiModel:
     """Старый интерфейс GenerativeModel поверх клиента google-genai."""
 
@@ -203,6 +241,21 @@ class GeminiModel:
             )
         )
 
+    async def agenerate_content(self, contents, **kwargs):
+        return await self._client.aio.models.generate_content(
+            model=self.model_name,
+            contents=_normalize_contents(contents),
+            config=_build_config(kwargs),
+        )
+
+    def astart_chat(self, history=None):
+        return _AsyncChatAdapter(
+            self._client.aio.chats.create(
+                model=self.model_name,
+                history=_normalize_history(history),
+            )
+        )
+
 
 # =========================
 # === FALLBACK CHAT SESSION ===
@@ -227,7 +280,8 @@ class FallbackChatSession:
         response = self.wrapper._run_with_fallback(
             action_name="start_chat.send_message",
             chat_id=chat_chat_id,
-            request_fn=lambda model_obj: self._send_with_model(model_obj, content, **kwargs)
+            request_fn=lambda model_obj: self._send_with_model(model_obj, content, **kwargs),
+            prompt_chars=content_chars(content),
         )
         return response
 
@@ -238,6 +292,25 @@ class FallbackChatSession:
         return response
 
 
+class AsyncFallbackChatSession(FallbackChatSession):
+    """Та же сессия для корутин: send_message не занимает поток пула."""
+
+    async def send_message(self, content, chat_id=None, **kwargs):
+        chat_chat_id = chat_id if chat_id is not None else self.chat_id
+        return await self.wrapper._arun_with_fallback(
+            action_name="astart_chat.send_message",
+            chat_id=chat_chat_id,
+            request_fn=lambda model_obj: self._asend_with_model(model_obj, content, **kwargs),
+            prompt_chars=content_chars(content),
+        )
+
+    async def _asend_with_model(self, model_obj, content, **kwargs):
+        chat = model_obj.astart_chat(history=self.history)
+        response = await chat.send_message(content, **kwargs)
+        self.history = chat.history
+        return response
+
+
 # =========================
 # === MODEL FALLBACK WRAPPER ===
 # =========================
@@ -249,7 +322,6 @@ class ModelFallbackWrapper:
         self.special_queue = special_queue
         self.keys_pool = [key for key in (keys_pool or []) if key]
         self._key_rr_cursor = 0
-        self._max_retries_per_pair = 3
         self.last_used_model_name: Optional[str] = None
 
     def _get_queue(self, chat_id: Optional[int]):
@@ -264,6 +336,7 @@ class ModelFallbackWrapper:
             chat_id=chat_id,
             request_fn=lambda model_obj: model_obj.generate_content(prompt, **kwargs),
             require_text=require_text,
+            prompt_chars=content_chars(prompt),
         )
 
     def generate_custom(self, model_name: str, *args, **kwargs):
@@ -275,6 +348,7 @@ class ModelFallbackWrapper:
             chat_id=kwargs.pop("chat_id", None),
             request_fn=lambda model_obj: model_obj.generate_content(*args, **kwargs),
             require_text=require_text,
+            prompt_chars=content_chars(args[0] if args else kwargs.get("contents", "")),
         )
 
     def start_chat(self, history=None, chat_id=None, user_id=None):
@@ -287,6 +361,26 @@ class ModelFallbackWrapper:
             user_id=user_id
         )
 
+    # --- asyncio: client.aio, паузы через asyncio.sleep — поток пула не занимается ---
+
+    async def agenerate_content(self, prompt, *, chat_id=None, require_text: bool = False, **kwargs):
+        return await self._arun_with_fallback(
+            action_name="agenerate_content",
+            chat_id=chat_id,
+            request_fn=lambda model_obj: model_obj.agenerate_content(prompt, **kwargs),
+            require_text=require_text,
+            prompt_chars=content_chars(prompt),
+        )
+
+    def astart_chat(self, history=None, chat_id=None, user_id=None):
+        return AsyncFallbackChatSession(
+            self,
+            history=history,
+            model_queue=self._get_queue(chat_id),
+            chat_id=chat_id,
+            user_id=user_id
+        )
+
     @property
     def model_names(self):
         return self.default_queue
@@ -313,105 +407,176 @@ class ModelFallbackWrapper:
         chat_id: Optional[int],
         request_fn: Callable,
         require_text: bool = False,
+        prompt_chars: int = 0,
     ):
-        model_queue = [self._normalize_model_name(name) for name in self._get_queue(chat_id)]
-        key_indices = self._iter_key_indices()
-        if not key_indices:
-            raise RuntimeError("Gemini API keys pool is empty")
+        run = _FallbackRun(self, action_name, chat_id, require_text, prompt_chars)
+        for model_name, key_idx, api_key in run.pairs():
+            try:
+                run.retry_sleep += rate_limiter.acquire(api_key, model_name, run.tokens)
+                run.begin_attempt()
+                result = request_fn(self._build_model(api_key, model_name))
+                return run.succeeded(result)
+            except Exception as error:
+                run.failed(error)
+        run.exhausted()
+
+    async def _arun_with_fallback(
+        self,
+        action_name: str,
+        chat_id: Optional[int],
+        request_fn: Callable,
+        require_text: bool = False,
+        prompt_chars: int = 0,
+    ):
+        """Как _run_with_fallback, но request_fn возвращает корутину, а ожидание лимита — asyncio.sleep."""
+        run = _FallbackRun(self, action_name, chat_id, require_text, prompt_chars)
+        for model_name, key_idx, api_key in run.pairs():
+            try:
+                run.retry_sleep += await rate_limiter.aacquire(api_key, model_name, run.tokens)
+                run.begin_attempt()
+                result = await request_fn(self._build_model(api_key, model_name))
+                return run.succeeded(result)
+            except Exception as error:
+                run.failed(error)
+        run.exhausted()
+
+
+class _FallbackRun:
+    """Один вызов с фоллбэком: порядок пар модель/ключ, разбор ошибок, здоровье и телеметрия.
+
+    Общая часть синхронного и asyncio-пути ModelFallbackWrapper: драйвер берёт пары
+    из pairs() и сообщает об исходе попытки в succeeded()/failed(). Пары идут в
+    порядке core.model_health: остывающие после 429/503 пропускаются, здоровые —
+    первыми; повторов той же пары с паузами нет — ошибка сразу ведёт к следующей.
+    """
 
-        hard_failures: List[Exception] = []
-        temporary_failure_only = True
-        attempts = 0
-
-        for model_name in model_queue:
-            for key_idx in key_indices:
-                api_key = self.keys_pool[key_idx]
-                for attempt in range(1, self._max_retries_per_pair + 1):
-                    attempts += 1
-                    try:
-                        _throttle_key(api_key)
-                        model_obj = self._build_model(api_key, model_name)
-                        result = request_fn(model_obj)
-                        if require_text and not _extract_response_text(result).strip():
-                            raise EmptyModelResponseError(_empty_response_details(result))
-                        self.last_used_model_name = model_name
-                        logging.info(
-                            "Gemini success action=%s key_idx=%s model=%s attempts=%s",
-                            action_name, key_idx, model_name, attempt
-                        )
-                        return result
-                    except Exception as error:
-                        status_code, error_type = _extract_error_details(error)
-                        retryable = _is_retryable(error)
-                        logging.warning(
-                            "Gemini fail action=%s key_idx=%s model=%s attempt=%s code=%s type=%s retryable=%s",
-                            action_name, key_idx, model_name, attempt, status_code, error_type, retryable
-                        )
-                        if error_type == "EmptyModelResponseError":
-                            temporary_failure_only = False
-                            hard_failures.append(error)
-                            raise RuntimeError(f"Gemini returned empty text response: {error}")
-                        if retryable and attempt < self._max_retries_per_pair:
-                            time.sleep(2 ** (attempt - 1))
-                            continue
-                        if not retryable:
-                            temporary_failure_only = False
-                            hard_failures.append(error)
-                        break
+    def __init__(self, wrapper: ModelFallbackWrapper, action_name: str, chat_id: Optional[int],
+                 require_text: bool, prompt_chars: int):
+        self.wrapper = wrapper
+        self.action_name = action_name
+        self.require_text = require_text
+        self.prompt_chars = prompt_chars
+        self.model_queue = [wrapper._normalize_model_name(name) for name in wrapper._get_queue(chat_id)]
+        self.key_indices = wrapper._iter_key_indices()
+        if not self.key_indices:
+            raise RuntimeError("Gemini API keys pool is empty")
+        self.hard_failures: List[Exception] = []
+        self.temporary_failure_only = True
+        # телеметрия: полное время вызова, смены пар модель/ключ, ожидание лимитов
+        self.attempts = 0
+        self.call_started = time.monotonic()
+        self.fallback_depth = -1
+        self.retry_sleep = 0.0
+        self.pair = (self.model_queue[0] if self.model_queue else "", self.key_indices[0])
+        self.attempt_started: Optional[float] = None
+        self.tokens = estimate_tokens(prompt_chars)   # оценка для бакета TPM
+
+    def pairs(self):
+        """(модель, индекс ключа, ключ) для каждой попытки — по одной на готовую пару.
+
+        Сначала пары со свободным слотом в rate_limiter (в порядке здоровья), затем
+        упёршиеся в лимит — по возрастанию ожидания; дольше MAX_WAIT не ждём.
+        """
+        ranked = model_health.rank(
+            "gemini", [(model_name, key_idx) for model_name in self.model_queue for key_idx in self.key_indices]
+        )
+        if not ranked:
+            logging.warning("Gemini fail-fast action=%s: все пары модель/ключ остывают", self.action_name)
+        keys_pool = self.wrapper.keys_pool
+        ready, limited = [], []
+        for model_name, key_idx in ranked:
+            wait = rate_limiter.wait_time(keys_pool[key_idx], model_name, self.tokens)
+            if wait <= 0:
+                ready.append((model_name, key_idx))
+            elif wait <= MAX_WAIT:
+                limited.append((wait, model_name, key_idx))
+        if ranked and not ready and not limited:
+            logging.warning("Gemini fail-fast action=%s: лимиты всех пар дальше %.0fs", self.action_name, MAX_WAIT)
+        for model_name, key_idx in ready + [(model_name, key_idx) for _wait, model_name, key_idx in sorted(limited)]:
+            # пару могла остудить параллельная попытка, пока мы пробовали предыдущие
+            if model_health.cooldown_left("gemini", model_name, key_idx) > 0:
+                continue
+            self.fallback_depth += 1
+            self.attempts += 1
+            self.pair = (model_name, key_idx)
+            self.attempt_started = None
+            yield model_name, key_idx, keys_pool[key_idx]
+
+    def begin_attempt(self):
+        self.attempt_started = time.monotonic()
+
+    def _record_call(self, ok: bool, result: Any = None):
+        prompt_tokens, completion_tokens = _gemini_usage(result)
+        model_telemetry.record_call(
+            "gemini", self.pair[0], self.pair[1], time.monotonic() - self.call_started, ok=ok,
+            attempts=self.attempts, fallback_depth=max(self.fallback_depth, 0), retry_sleep_s=self.retry_sleep,
+            prompt_chars=self.prompt_chars,
+            response_chars=len(_extract_response_text(result)) if ok else 0,
+            prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+        )
 
-        if temporary_failure_only:
-            raise RuntimeError(self.GEMINI_LIMIT_EXHAUSTED_MESSAGE)
-        if hard_failures:
-            raise RuntimeError(f"All Gemini models failed. Last error: {hard_failures[-1]}")
+    def succeeded(self, result: Any) -> Any:
+        """Проверяет ответ (require_text) и отмечает успех; пустой ответ — исключение."""
+        if self.require_text and not _extract_response_text(result).strip():
+            raise EmptyModelResponseError(_empty_response_details(result))
+        model_name, key_idx = self.pair
+        latency = time.monotonic() - self.attempt_started
+        model_telemetry.record_attempt("gemini", model_name, key_idx, latency)
+        model_health.record_success("gemini", model_name, key_idx, latency)
+        prompt_tokens, completion_tokens = _gemini_usage(result)
+        if prompt_tokens is not None:
+            rate_limiter.settle(
+                self.wrapper.keys_pool[key_idx], model_name, self.tokens, prompt_tokens + (completion_tokens or 0)
+            )
+        self.wrapper.last_used_model_name = model_name
+        logging.info(
+            "Gemini success action=%s key_idx=%s model=%s attempts=%s",
+            self.action_name, key_idx, model_name, self.attempts
+        )
+        self._record_call(True, result)
+        return result
+
+    def failed(self, error: Exception):
+        """Разбирает ошибку попытки: остывание пары в model_health, дальше — следующая пара."""
+        model_name, key_idx = self.pair
+        status_code, error_type = _extract_error_details(error)
+        retryable = _is_retryable(error)
+        error_name = f"{status_code or ''}{error_type}"
+        if self.attempt_started is not None:
+            model_telemetry.record_attempt(
+                "gemini", model_name, key_idx, time.monotonic() - self.attempt_started, error=error_name,
+            )
+        text = str(error).lower()
+        overload = status_code == 503 or (status_code is None and "503" in text)
+        cooldown = model_health.record_failure(
+            "gemini", model_name, key_idx,
+            quota=retryable and not overload, overload=overload,
+            retry_after=retry_after_hint(error) if retryable else None,
+            daily="perday" in text, error=error_name,
+        )
+        logging.warning(
+            "Gemini fail action=%s key_idx=%s model=%s code=%s type=%s retryable=%s cooldown=%.0fs",
+            self.action_name, key_idx, model_name, status_code, error_type, retryable, cooldown
+        )
+        if error_type == "EmptyModelResponseError":
+            self.temporary_failure_only = False
+            self.hard_failures.append(error)
+            self._record_call(False)
+            raise RuntimeError(f"Gemini returned empty text response: {error}")
+        if not retryable:
+            self.temporary_failure_only = False
+            self.hard_failures.append(error)
+
+    def exhausted(self):
+        """Все готовые пары перепробованы (или все остывают): телеметрия и итоговое исключение."""
+        self._record_call(False)
+        if self.temporary_failure_only:
+            raise RuntimeError(self.wrapper.GEMINI_LIMIT_EXHAUSTED_MESSAGE)
+        if self.hard_failures:
+            raise RuntimeError(f"All Gemini models failed. Last error: {self.hard_failures[-1]}")
         raise RuntimeError("All Gemini models failed")
 
 
-# =========================
-# === GIGACHAT WRAPPER ===
-# =========================
-class GigaChatWrapper:
-    def __init__(self, api_key: str, default_queue: List[str], special_queue: List[str]):
-        self.api_key = api_key
-        self.default_queue = default_queue
-        self.special_queue = special_queue
-        self.last_used_model_name: Optional[str] = None
-
-    def _get_queue(self, chat_id: Optional[int]):
-        from core.settings import SPECIAL_CHAT_ID
-        if chat_id and str(chat_id) == str(SPECIAL_CHAT_ID):
-            return self.special_queue
-        return self.default_queue
-
-    def generate_content(self, prompt: str, *, chat_id=None, temperature: float = 0.7, **kwargs):
-        """Генерация ответа с помощью GigaChat"""
-        queue = self._get_queue(chat_id)
-        
-        for model_name in queue:
-            try:
-                with GigaChat(
-                    credentials=self.api_key,
-                    verify_ssl_certs=False,
-                    temperature=temperature,
-                    max_tokens=kwargs.get("max_tokens", 500),
-                    model=model_name
-                ) as giga:
-                    response = giga.chat(prompt)
-                    self.last_used_model_name = model_name
-                    
-                    # Создаём объект-обёртку для совместимости с Gemini API
-                    class GigaResponse:
-                        def __init__(self, text):
-                            self.text = text
-                    
-                    return GigaResponse(response.choices[0].message.content)
-                    
-            except Exception as e:
-                logging.error(f"GigaChat error [{model_name}]: {e}")
-                continue
-        
-        raise RuntimeError("All GigaChat models failed")
-
-
 # =========================
 # === GROQ WRAPPER ===
 # =========================
@@ -464,6 +629,7 @@ class GroqWrapper:
         """Анализ изображений (Vision) через Groq"""
         if not self.client: return "Ключ Groq не настроен"
         
+        started = time.monotonic()
         try:
             base64_image = self._prepare_image(image_bytes)
             
@@ -482,14 +648,24 @@ class GroqWrapper:
                 temperature=0.7,
                 max_tokens=1024
             )
-            return completion.choices[0].message.content or ""
+            result = completion.choices[0].message.content or ""
+            prompt_tokens, completion_tokens = _openai_usage(getattr(completion, "usage", None))
+            model_telemetry.record_single(
+                "groq", self.vision_model, time.monotonic() - started,
+                prompt_chars=len(prompt), response_chars=len(result),
+                prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+            )
+            return result
         except Exception as e:
+            model_telemetry.record_single("groq", self.vision_model, time.monotonic() - started,
+                                          error=type(e).__name__, prompt_chars=len(prompt))
             logging.error(f"Groq Vision Error: {e}")
             raise
     
     def generate_text(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7, presence_penalty: float = 0.0) -> str:
         """Генерация текста (LLM) через Groq"""
         if not self.client: return "Ключ Groq не настроен"
+        started = time.monotonic()
         try:
             completion = self.client.chat.completions.create(
                 model=self.text_model,
@@ -499,15 +675,24 @@ class GroqWrapper:
                 max_tokens=max_tokens
             )
             result = completion.choices[0].message.content
+            prompt_tokens, completion_tokens = _openai_usage(getattr(completion, "usage", None))
+            model_telemetry.record_single(
+                "groq", self.text_model, time.monotonic() - started,
+                prompt_chars=len(prompt), response_chars=len(result or ""),
+                prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+            )
             logging.info(f"Groq generate_text: модель={self.text_model}, результат_длина={len(result) if result else 0}")
             return result or ""
         except Exception as e:
+            model_telemetry.record_single("groq", self.text_model, time.monotonic() - started,
+                                          error=type(e).__name__, prompt_chars=len(prompt))
             logging.error(f"Groq Text Error: {e}", exc_info=True)
             raise
     
     def transcribe_audio(self, audio_bytes: bytes, file_name: str) -> str:
         """Транскрибация аудио (Whisper) через Groq"""
         if not self.client: return "Ключ Groq не настроен"
+        started = time.monotonic()
         try:
             audio_file = io.BytesIO(audio_bytes)
             audio_file.name = file_name 
@@ -517,29 +702,61 @@ class GroqWrapper:
                 model=self.audio_model,
                 response_format="text"
             )
+            model_telemetry.record_single("groq", self.audio_model, time.monotonic() - started,
+                                          response_chars=len(transcription or ""))
             return transcription
         except Exception as e:
+            model_telemetry.record_single("groq", self.audio_model, time.monotonic() - started,
+                                          error=type(e).__name__)
             logging.error(f"Groq Whisper Error: {e}")
             raise
 # =========================
 # === OPENAI-COMPATIBLE WRAPPER (OpenRouter, SiliconFlow) ===
 # =========================
 class OpenAICompatibleWrapper:
-    """Универсальная обёртка для провайдеров с OpenAI-совместимым API."""
+    """Универсальная обёртка для провайдеров с OpenAI-совместимым API.
+
+    Запросы идут через общий httpx.AsyncClient (keep-alive, HTTP/2, если стоит
+    пакет h2) — по клиенту на цикл событий: корутины бота используют клиент
+    своего цикла, а синхронный generate_text — тонкий адаптер, который
+    выполняет agenerate_text в фоновом цикле-потоке со своим клиентом.
+    429/5xx и сетевые сбои повторяются с экспоненциальной паузой и джиттером
+    (Retry-After, если сервер его прислал). astream_text() — SSE-поток ответа.
+    """
 
-    def __init__(self, api_key: str, base_url: str, model_name: str):
+    def __init__(self, api_key: str, base_url: str, model_name: str, transport=None):
         self.api_key = api_key
         self.base_url = base_url.rstrip('/')
         self.model_name = model_name
+        # имя провайдера для телеметрии: openrouter.ai -> openrouter
+        host = self.base_url.split("://", 1)[-1].split("/", 1)[0]
+        self.provider = host.removeprefix("api.").split(".")[0]
+        self._transport = transport
+        self._clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+            weakref.WeakKeyDictionary()
+        )
 
-    def generate_text(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7, presence_penalty: float = 0.0) -> str:
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-            # Обязательно для бесплатных моделей OpenRouter
-            "HTTP-Referer": "https://github.com/upupa-bot",
-            "X-Title": "UpupaBot",
-        }
+    def _client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None or client.is_closed:
+            client = self._clients[loop] = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    # Обязательно для бесплатных моделей OpenRouter
+                    "HTTP-Referer": "https://github.com/upupa-bot",
+                    "X-Title": "UpupaBot",
+                },
+                timeout=OPENAI_COMPAT_TIMEOUT,
+                limits=OPENAI_COMPAT_LIMITS,
+                http2=_HTTP2,
+                transport=self._transport,
+            )
+        return client
+
+    def _payload(self, prompt: str, max_tokens: int, temperature: float, presence_penalty: float,
+                 stream: bool = False) -> dict:
         payload = {
             "model": self.model_name,
             "messages": [{"role": "user", "content": prompt}],
@@ -547,21 +764,103 @@ class OpenAICompatibleWrapper:
             "presence_penalty": presence_penalty,
             "max_tokens": max_tokens,
         }
+        if stream:
+            payload["stream"] = True
+        return payload
+
+    async def _post_with_retry(self, payload: dict) -> Tuple[httpx.Response, int]:
+        """POST /chat/completions с повторами на 429/5xx и сетевых сбоях. (ответ, попыток)."""
+        client = self._client()
+        for attempt in range(1, OPENAI_COMPAT_RETRIES + 2):
+            try:
+                response = await client.post("/chat/completions", json=payload)
+                response.raise_for_status()
+                return response, attempt
+            except (httpx.HTTPStatusError, httpx.TransportError) as error:
+                status_code = error.response.status_code if isinstance(error, httpx.HTTPStatusError) else None
+                retryable = status_code is None or status_code == 429 or status_code >= 500
+                if not retryable or attempt > OPENAI_COMPAT_RETRIES:
+                    raise
+                backoff = random.uniform(0, min(OPENAI_COMPAT_RETRY_MAX_DELAY, 2 ** (attempt - 1)))
+                delay = min(max(retry_after_hint(error) or 0.0, backoff), OPENAI_COMPAT_RETRY_MAX_DELAY)
+                logging.warning(
+                    "OpenAICompatibleWrapper [%s]: %s, повтор %s через %.1fs",
+                    self.model_name, status_code or type(error).__name__, attempt, delay,
+                )
+                await asyncio.sleep(delay)
+
+    async def agenerate_text(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7,
+                             presence_penalty: float = 0.0) -> str:
+        started = time.monotonic()
         try:
-            response = requests.post(
-                f"{self.base_url}/chat/completions",
-                headers=headers,
-                json=payload,
-                timeout=60,
+            response, attempts = await self._post_with_retry(
+                self._payload(prompt, max_tokens, temperature, presence_penalty)
             )
-            response.raise_for_status()
             data = response.json()
             result = data["choices"][0]["message"]["content"]
+            prompt_tokens, completion_tokens = _openai_usage(data.get("usage"))
+            model_telemetry.record_single(
+                self.provider, self.model_name, time.monotonic() - started,
+                attempts=attempts, prompt_chars=len(prompt), response_chars=len(result or ""),
+                prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+            )
             logging.info(
                 f"OpenAICompatibleWrapper [{self.model_name}]: "
                 f"получено {len(result) if result else 0} символов"
             )
             return result or ""
         except Exception as e:
+            status_code, error_type = _extract_error_details(e)
+            model_telemetry.record_single(self.provider, self.model_name, time.monotonic() - started,
+                                          error=f"{status_code or ''}{error_type}", prompt_chars=len(prompt))
             logging.error(f"OpenAICompatibleWrapper error [{self.model_name}]: {e}")
             raise
+
+    async def astream_text(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7,
+                           presence_penalty: float = 0.0):
+        """Отдаёт ответ кусками по мере генерации (SSE, stream=true). Без повторов:
+        половину ответа повтор не вернёт."""
+        started = time.monotonic()
+        chars = 0
+        try:
+            async with self._client().stream(
+                "POST", "/chat/completions",
+                json=self._payload(prompt, max_tokens, temperature, presence_penalty, stream=True),
+            ) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    choices = json.loads(data).get("choices") or [{}]
+                    delta = (choices[0].get("delta") or {}).get("content")
+                    if delta:
+                        chars += len(delta)
+                        yield delta
+            model_telemetry.record_single(
+                self.provider, self.model_name, time.monotonic() - started,
+                prompt_chars=len(prompt), response_chars=chars,
+            )
+        except Exception as e:
+            status_code, error_type = _extract_error_details(e)
+            model_telemetry.record_single(self.provider, self.model_name, time.monotonic() - started,
+                                          error=f"{status_code or ''}{error_type}", prompt_chars=len(prompt))
+            logging.error(f"OpenAICompatibleWrapper stream error [{self.model_name}]: {e}")
+            raise
+
+    async def aclose(self):
+        """Закрывает клиент текущего цикла (при остановке бота)."""
+        client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    def generate_text(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7, presence_penalty: float = 0.0) -> str:
+        """Синхронный адаптер над agenerate_text (для кода в потоках и скриптов)."""
+        future = asyncio.run_coroutine_threadsafe(
+            self.agenerate_text(prompt, max_tokens=max_tokens, temperature=temperature,
+                                presence_penalty=presence_penalty),
+            _background_loop(),
+        )
+        return future.result()
@@ -1,6 +1,5 @@
 """Инициализация AI-клиентов: Gemini, Groq, GigaChat, OpenAI-совместимые."""
 from google import genai
-from gigachat import GigaChat
 
 from AI.wrapper import (
     GroqWrapper,
@@ -8,7 +7,7 @@ from AI.wrapper import (
     FallbackChatSession,
     OpenAICompatibleWrapper,
 )
-from AI.gigachat_client import GigaChatConversationWrapper, GIGACHAT_BASE_URL
+from AI.gigachat_client import GigaChatConversationWrapper
 from core.settings import (
     GEMINI_KEYS_POOL, PRIMARY_GEMINI_KEY,
     GROQ_API_KEY, GIGACHAT_API_KEY,
@@ -50,16 +49,6 @@ gigachat_model = GigaChatConversationWrapper(
     GIGACHAT_MODEL_QUEUE_SPECIAL
 )
 
-# =========================
-# === GIGACHAT (старый объект для совместимости) ===
-# =========================
-gigachat = GigaChat(
-    credentials=GIGACHAT_API_KEY,
-    base_url=GIGACHAT_BASE_URL,
-    model="GigaChat-2",
-    verify_ssl_certs=False
-)
-
 # === OPENAI-COMPATIBLE PROVIDERS ===
 openrouter_ai = OpenAICompatibleWrapper(
     api_key=OPENROUTER_API_KEY,
@@ -0,0 +1,233 @@
+"""Ограниченные словари для рантайм-состояния, которое иначе растёт вечно.
+
+  - LRUDict(max_size) — при переполнении вытесняет запись, к которой дольше
+    всего не обращались (OrderedDict: move_to_end / popitem — O(1));
+  - TTLDict(ttl, max_size=None, refresh_on_access=False) — плюс срок жизни:
+    дедлайны лежат в куче, просроченные снимаются с её вершины при любом
+    обращении к словарю — O(1), пока протухать нечему, и без обхода всех
+    записей. refresh_on_access продлевает срок при чтении (скользящий TTL).
+
+Оба — обычные MutableMapping: [], get, in, setdefault, pop, del, items;
+обход (iter, items, values) ничего не продлевает и не переставляет;
+peek(key) читает запись, не продлевая её (порядок LRU не меняется).
+on_evict(key, value) зовётся при вытеснении и по истечении срока (не при del).
+Контейнеры с именем (name=...) попадают в report() — админ-команда "память":
+число записей и примерный объём (по выборке записей).
+"""
+import heapq
+import itertools
+import sys
+import time
+import weakref
+from collections import OrderedDict, deque
+from collections.abc import MutableMapping
+
+SIZE_SAMPLE = 32   # записей на оценку объёма контейнера
+
+_containers: list[weakref.ref] = []
+
+
+class LRUDict(MutableMapping):
+    def __init__(self, max_size: int | None = None, *, name: str | None = None, on_evict=None):
+        self.max_size = max_size
+        self.name = name
+        self.on_evict = on_evict
+        self._data: OrderedDict = OrderedDict()
+        self.evicted = 0
+        self.expired = 0
+        if name:
+            _containers.append(weakref.ref(self))
+
+    def __getitem__(self, key):
+        value = self._data[key]
+        self._data.move_to_end(key)
+        return value
+
+    def peek(self, key, default=None):
+        """Значение без продления жизни записи: не двигает её в LRU-очереди."""
+        return self._data.get(key, default)
+
+    def __setitem__(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if self.max_size is not None and len(self._data) > self.max_size:
+            old_key = next(iter(self._data))
+            self.evicted += 1
+            self._drop(old_key)
+
+    def __delitem__(self, key):
+        del self._data[key]
+
+    def __contains__(self, key) -> bool:
+        return key in self._data
+
+    def __iter__(self):
+        return iter(list(self._data))
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    # обход читает _data напрямую: миксины MutableMapping ходят через __getitem__,
+    # и простой перебор (чистка, отладочный дамп) переставлял бы LRU и продлевал TTL
+    def items(self):
+        return list(self._data.items())
+
+    def values(self):
+        return list(self._data.values())
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({dict(self._data)!r})"
+
+    def _drop(self, key):
+        value = self._data.pop(key)
+        if self.on_evict is not None:
+            self.on_evict(key, value)
+
+
+class TTLDict(LRUDict):
+    def __init__(self, ttl: float, max_size: int | None = None, *, refresh_on_access: bool = False,
+                 name: str | None = None, on_evict=None, clock=time.monotonic):
+        super().__init__(max_size, name=name, on_evict=on_evict)
+        self.ttl = ttl
+        self.refresh_on_access = refresh_on_access
+        self.clock = clock
+        self._deadlines: dict = {}
+        self._heap: list[tuple[float, int, object]] = []
+        self._seq = itertools.count()
+
+    def _schedule(self, key):
+        deadline = self.clock() + self.ttl
+        self._deadlines[key] = deadline
+        heapq.heappush(self._heap, (deadline, next(self._seq), key))
+        # устаревшие узлы кучи (продлённые/удалённые ключи) копятся — иногда пересобираем
+        if len(self._heap) > 2 * len(self._deadlines) + 64:
+            self._heap = [(deadline, next(self._seq), key) for key, deadline in self._deadlines.items()]
+            heapq.heapify(self._heap)
+
+    def expire(self) -> int:
+        """Снимает просроченные записи; возвращает их число."""
+        now = self.clock()
+        heap = self._heap
+        removed = 0
+        while heap and heap[0][0] <= now:
+            deadline, _, key = heapq.heappop(heap)
+            if self._deadlines.get(key) != deadline:
+                continue   # ключ продлён или удалён после постановки в кучу
+            del self._deadlines[key]
+            self.expired += 1
+            removed += 1
+            self._drop(key)
+        return removed
+
+    def __getitem__(self, key):
+        self.expire()
+        value = super().__getitem__(key)
+        if self.refresh_on_access:
+            self._schedule(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.expire()
+        self._schedule(key)
+        super().__setitem__(key, value)
+
+    def peek(self, key, default=None):
+        self.expire()
+        return super().peek(key, default)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._deadlines.pop(key, None)
+
+    def __contains__(self, key) -> bool:
+        self.expire()
+        return key in self._data
+
+    def __iter__(self):
+        self.expire()
+        return super().__iter__()
+
+    def items(self):
+        self.expire()
+        return super().items()
+
+    def values(self):
+        self.expire()
+        return super().values()
+
+    def __len__(self) -> int:
+        self.expire()
+        return len(self._data)
+
+    def _drop(self, key):
+        self._deadlines.pop(key, None)
+        super()._drop(key)
+
+
+def deep_sizeof(obj, depth: int = 4, _seen: set | None = None) -> int:
+    """Примерный объём объекта с содержимым (контейнеры и __dict__ до depth уровней)."""
+    seen = _seen if _seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj, 0)
+    if depth <= 0 or isinstance(obj, (str, bytes, bytearray, int, float)):
+        return size
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, depth - 1, seen) + deep_sizeof(v, depth - 1, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+        size += sum(deep_sizeof(item, depth - 1, seen) for item in obj)
+    elif hasattr(obj, "__dict__"):
+        size += deep_sizeof(vars(obj), depth - 1, seen)
+    return size
+
+
+def approx_bytes(container: LRUDict, sample: int = SIZE_SAMPLE) -> int:
+    """Объём контейнера: сам словарь + средняя запись выборки × число записей."""
+    items = list(itertools.islice(container._data.items(), sample))
+    size = sys.getsizeof(container._data)
+    if items:
+        per_item = sum(deep_sizeof(key) + deep_sizeof(value) for key, value in items) / len(items)
+        size += int(per_item * len(container._data))
+    return size
+
+
+def report() -> list[dict]:
+    """Именованные контейнеры: записи, примерный объём, вытеснения и истечения."""
+    rows = []
+    for ref in list(_containers):
+        container = ref()
+        if container is None:
+            _containers.remove(ref)
+            continue
+        if isinstance(container, TTLDict):
+            container.expire()
+        rows.append({
+            "name": container.name,
+            "entries": len(container._data),
+            "max_size": container.max_size,
+            "ttl": getattr(container, "ttl", None),
+            "bytes": approx_bytes(container),
+            "evicted": container.evicted,
+            "expired": container.expired,
+        })
+    return rows
+
+
+def format_report(rows: list[dict]) -> str:
+    """Текст для админ-команды "память"."""
+    if not rows:
+        return "🧠 Ограниченных контейнеров нет."
+    lines = ["🧠 Рантайм-состояние:"]
+    for row in sorted(rows, key=lambda r: r["bytes"], reverse=True):
+        limits = []
+        if row["max_size"]:
+            limits.append(f"≤{row['max_size']}")
+        if row["ttl"]:
+            limits.append(f"ttl {row['ttl'] / 3600:g}ч")
+        lines.append(
+            f"{row['name']}: {row['entries']} зап., ~{row['bytes'] / 1024:.1f} КБ"
+            + (f" ({', '.join(limits)})" if limits else "")
+            + f", вытеснено {row['evicted']}, истекло {row['expired']}"
+        )
+    return "\n".join(lines)
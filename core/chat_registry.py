@@ -0,0 +1,125 @@
+"""Реестр чатов, где сидит бот (chats.json).
+
+add_chat() зовётся на каждое входящее сообщение (process_random_reactions),
+поэтому горячий путь — один поиск в словаре по id: если чат известен и его
+название/username не поменялись, ничего не происходит — ни сортировки, ни записи.
+
+Список core.state.chat_list остаётся общим (его читают sms, picgeneration,
+common_settings) и всегда упорядочен: SPECIAL_CHAT_ID первым, остальные в
+порядке появления. Индекс _by_id указывает на те же словари, что и в списке.
+Нумерованный вид для "где сидишь"/"смс" (titled()) считается лениво и
+кэшируется до следующего изменения.
+
+Запись на диск отложенная (core.json_store): все изменения за интервал уходят
+одной атомарной записью в потоке, остаток — при остановке бота.
+"""
+import logging
+
+from core.json_store import FLUSH_INTERVAL, JsonStateStore
+from core.settings import SPECIAL_CHAT_ID
+from core.state import CHAT_LIST_FILE, chat_list
+
+
+class ChatRegistry:
+    def __init__(self, chats: list, path: str = CHAT_LIST_FILE, special_chat_id: int = SPECIAL_CHAT_ID,
+                 save_delay: float = FLUSH_INTERVAL):
+        self.chats = chats
+        self.special_chat_id = special_chat_id
+        self.store = JsonStateStore(path, self.chats.copy, indent=4, interval=save_delay)
+        self._by_id: dict[int, dict] = {}
+        self._titled: list[dict] | None = None
+
+    # --- загрузка ---
+
+    def load(self):
+        """Заполняет список из файла (блокирующий, при старте)."""
+        try:
+            data = self.store.read([])
+            if not isinstance(data, list):
+                logging.warning("Файл chats.json повреждён, создан новый список чатов.")
+                data = []
+        except Exception as e:
+            logging.error(f"Ошибка при загрузке списка чатов: {e}")
+            data = []
+        self.replace(data, persist=False)
+        if data:
+            logging.info(f"Загружено {len(self.chats)} чатов из файла.")
+
+    def replace(self, chats: list[dict], persist: bool = True):
+        """Подменяет весь список (загрузка, "обнови чаты"); дубликаты по id отбрасываются."""
+        unique = {}
+        for chat in chats:
+            if isinstance(chat, dict) and "id" in chat and chat["id"] not in unique:
+                unique[chat["id"]] = chat
+        ordered = sorted(unique.values(), key=self._order_key)
+        self.chats[:] = ordered
+        self._by_id = {chat["id"]: chat for chat in ordered}
+        self._changed(persist)
+
+    def _order_key(self, chat: dict) -> int:
+        return 0 if chat["id"] == self.special_chat_id else 1
+
+    # --- чтение ---
+
+    def get(self, chat_id) -> dict | None:
+        return self._by_id.get(chat_id)
+
+    def __contains__(self, chat_id) -> bool:
+        return chat_id in self._by_id
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def titled(self) -> list[dict]:
+        """Чаты с названием, особый чат первым — нумерация "где сидишь" и "смс"."""
+        if self._titled is None:
+            self._titled = [chat for chat in self.chats if chat.get("title")]
+        return self._titled
+
+    # --- изменения ---
+
+    def upsert(self, chat_id, title, username=None) -> bool:
+        """Добавляет чат или обновляет название/username. True, если что-то поменялось."""
+        username = username or None
+        chat = self._by_id.get(chat_id)
+        if chat is not None:
+            if chat.get("title") == title and chat.get("username") == username:
+                return False
+            chat["title"] = title
+            chat["username"] = username
+        else:
+            chat = {"id": chat_id, "title": title, "username": username}
+            self._by_id[chat_id] = chat
+            if chat_id == self.special_chat_id:
+                self.chats.insert(0, chat)
+            else:
+                self.chats.append(chat)
+            logging.info(f"Добавлен новый чат: {title} ({chat_id})")
+        self._changed()
+        return True
+
+    def remove(self, chat_id) -> bool:
+        chat = self._by_id.pop(chat_id, None)
+        if chat is None:
+            return False
+        self.chats[:] = [item for item in self.chats if item is not chat]
+        self._changed()
+        return True
+
+    def _changed(self, persist: bool = True):
+        self._titled = None
+        if persist:
+            self.store.mark_dirty()
+
+    # --- запись ---
+
+    def save(self):
+        """Немедленная запись (блокирующая)."""
+        self.store.flush()
+
+    async def flush(self):
+        """Дописывает отложенные изменения (при остановке бота)."""
+        await self.store.aflush()
+
+
+chat_registry = ChatRegistry(chat_list)
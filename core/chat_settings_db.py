@@ -0,0 +1,178 @@
+"""Настройки чатов в SQLite: строка на чат вместо одного растущего chat_settings.json.
+
+Включается core.state.CHAT_SETTINGS_BACKEND = "sqlite"; тогда core.state.chat_settings —
+экземпляр SQLiteChatSettings, и весь код продолжает работать с ним как со словарём
+(chat_settings[chat_id], .get, in, setdefault, del, .keys/.items).
+
+  - при старте читается только список chat_id — JSON ни одного чата не разбирается;
+  - строка чата читается при первом обращении и остаётся в кэше (владельцы
+    меняют вложенные словари по ссылке, поэтому из кэша они не вытесняются);
+  - save_chat_settings() -> mark_dirty(): через интервал (core.json_store)
+    в базу уходят только строки, чей JSON изменился с прошлой записи, — один
+    тумблер переписывает одну строку, а не файл;
+  - первый запуск переносит данные из chat_settings.json.
+
+Ключи — строки: chat_settings[-100123] и chat_settings["-100123"] — одна запись.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+from collections.abc import MutableMapping
+
+from core.json_store import FLUSH_INTERVAL, DebouncedStore
+
+
+class SQLiteChatSettings(MutableMapping, DebouncedStore):
+    def __init__(self, db_path: str, interval: float = FLUSH_INTERVAL):
+        DebouncedStore.__init__(self, interval)
+        self.db_path = db_path
+        self._conn = None
+        self._db_lock = threading.Lock()
+        self._keys: set[str] = set()
+        self._rows: dict[str, dict] = {}         # кэш прочитанных строк
+        self._saved: dict[str, str] = {}         # JSON строки на момент последней записи
+        self._deleted: set[str] = set()
+        self._row_generation: dict[str, int] = {}
+        self.rows_read = 0
+        self.rows_written = 0
+
+    # --- база ---
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS chat_settings (chat_id TEXT PRIMARY KEY, data TEXT NOT NULL) WITHOUT ROWID"
+            )
+            self._conn = conn
+        return self._conn
+
+    def load(self, json_path: str | None = None):
+        """Читает список чатов (блокирующий, при старте); пустая база — импорт из json_path."""
+        with self._db_lock:
+            conn = self._db()
+            keys = {row[0] for row in conn.execute("SELECT chat_id FROM chat_settings")}
+            if not keys and json_path and os.path.exists(json_path):
+                keys = self._import_json(conn, json_path)
+        self._keys = keys
+        self._rows.clear()
+        self._saved.clear()
+        self._deleted.clear()
+
+    @staticmethod
+    def _import_json(conn: sqlite3.Connection, json_path: str) -> set[str]:
+        with open(json_path, "r", encoding="utf-8") as file:
+            data = json.load(file)
+        if not isinstance(data, dict):
+            logging.warning(f"[chat_settings_db] {json_path} повреждён, импорт пропущен")
+            return set()
+        rows = [(str(chat_id), json.dumps(settings, ensure_ascii=False)) for chat_id, settings in data.items()]
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO chat_settings (chat_id, data) VALUES (?, ?)", rows)
+        logging.info(f"[chat_settings_db] перенесены настройки {len(rows)} чатов из {json_path}")
+        return {chat_id for chat_id, _ in rows}
+
+    # --- словарь ---
+
+    def __getitem__(self, chat_id) -> dict:
+        key = str(chat_id)
+        row = self._rows.get(key)
+        if row is not None:
+            return row
+        if key not in self._keys:
+            raise KeyError(chat_id)
+        with self._db_lock:
+            found = self._db().execute("SELECT data FROM chat_settings WHERE chat_id = ?", (key,)).fetchone()
+        if found is None:
+            self._keys.discard(key)
+            raise KeyError(chat_id)
+        row = json.loads(found[0])
+        self.rows_read += 1
+        self._rows[key] = row
+        self._saved[key] = found[0]
+        return row
+
+    def __setitem__(self, chat_id, settings):
+        key = str(chat_id)
+        self._keys.add(key)
+        self._deleted.discard(key)
+        self._rows[key] = settings
+        self._saved.pop(key, None)   # новая строка записывается при ближайшем flush
+
+    def __delitem__(self, chat_id):
+        key = str(chat_id)
+        if key not in self._keys:
+            raise KeyError(chat_id)
+        self._keys.discard(key)
+        self._rows.pop(key, None)
+        self._saved.pop(key, None)
+        self._deleted.add(key)
+
+    def __contains__(self, chat_id) -> bool:
+        return str(chat_id) in self._keys
+
+    def __iter__(self):
+        return iter(list(self._keys))
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def clear(self):
+        self._deleted |= self._keys
+        self._keys = set()
+        self._rows.clear()
+        self._saved.clear()
+
+    # --- запись ---
+
+    def _collect(self) -> tuple[int, list[tuple[str, str]], list[str]] | None:
+        generation = self._next_generation()
+        upserts = []
+        # _saved/_deleted откатывает и поток неудачной записи (_persist) — под тем же замком
+        with self._state_lock:
+            for key, row in self._rows.items():
+                text = json.dumps(row, ensure_ascii=False)
+                if self._saved.get(key) != text:
+                    self._saved[key] = text
+                    upserts.append((key, text))
+            deletes = list(self._deleted)
+            self._deleted.clear()
+        if not upserts and not deletes:
+            return None
+        for key, _ in upserts:
+            self._row_generation[key] = generation
+        for key in deletes:
+            self._row_generation[key] = generation
+        return generation, upserts, deletes
+
+    def _persist(self, payload: tuple[int, list[tuple[str, str]], list[str]]):
+        generation, upserts, deletes = payload
+        # строку, которую уже переписал более поздний снимок, не трогаем
+        upserts = [row for row in upserts if self._row_generation.get(row[0], 0) <= generation]
+        deletes = [key for key in deletes if self._row_generation.get(key, 0) <= generation]
+        try:
+            with self._db_lock:
+                conn = self._db()
+                with conn:
+                    conn.executemany(
+                        "INSERT INTO chat_settings (chat_id, data) VALUES (?, ?) "
+                        "ON CONFLICT(chat_id) DO UPDATE SET data = excluded.data",
+                        upserts,
+                    )
+                    conn.executemany("DELETE FROM chat_settings WHERE chat_id = ?", [(key,) for key in deletes])
+            self.rows_written += len(upserts) + len(deletes)
+            self.writes += 1
+        except Exception as e:
+            logging.error(f"[chat_settings_db] не смог записать {len(upserts) + len(deletes)} строк: {e}")
+
+            def rollback():
+                # при повторной записи эти строки уйдут снова
+                for key, _ in upserts:
+                    self._saved.pop(key, None)
+                self._deleted.update(key for key in deletes if key not in self._keys)
+
+            self._persist_failed(rollback)
@@ -0,0 +1,123 @@
+"""Единственный писатель statistics.db: очередь INSERT'ов и фоновый поток.
+
+features.statistics.log_message / log_model_request только кладут строку в
+очередь (put без ожидания) — обработчик сообщения не ждёт ни открытия
+соединения, ни fsync. Поток держит одно долгоживущее соединение в режиме WAL
+и коммитит пачками: до BATCH_ROWS строк или раз в BATCH_INTERVAL секунд.
+Одинаковые запросы пачки уходят одним executemany (порядок внутри запроса сохраняется).
+
+Метрики (metrics()): глубина очереди, число пачек и строк, длительность
+последней и самой долгой записи пачки — видны в "стотистика".
+"""
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+from core.state import DB_FILE
+
+BATCH_ROWS = 500       # строк в одной транзакции максимум
+BATCH_INTERVAL = 0.2   # секунд копим пачку после первой строки
+
+
+class _Barrier:
+    """Маркер в очереди: всё, что до него, записано (для flush)."""
+    __slots__ = ("done",)
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class SQLiteWriter:
+    def __init__(self, db_path: str = DB_FILE, batch_rows: int = BATCH_ROWS,
+                 batch_interval: float = BATCH_INTERVAL):
+        self.db_path = db_path
+        self.batch_rows = batch_rows
+        self.batch_interval = batch_interval
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.batches = 0
+        self.rows = 0
+        self.errors = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+
+    def submit(self, sql: str, params: tuple):
+        """Ставит запрос в очередь на запись. Не блокирует."""
+        if self._thread is None:
+            self._start()
+        self._queue.put((sql, params))
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Ждёт записи всего, что поставлено в очередь до вызова (блокирующий)."""
+        if self._thread is None:
+            return True
+        barrier = _Barrier()
+        self._queue.put(barrier)
+        return barrier.done.wait(timeout)
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def metrics(self) -> dict:
+        return {
+            "depth": self.depth,
+            "batches": self.batches,
+            "rows": self.rows,
+            "errors": self.errors,
+            "last_flush_ms": round(self.last_flush_ms, 1),
+            "max_flush_ms": round(self.max_flush_ms, 1),
+        }
+
+    # --- поток-писатель ---
+
+    def _start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.batch_interval
+            while len(batch) < self.batch_rows and not isinstance(batch[-1], _Barrier):
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            rows = [item for item in batch if not isinstance(item, _Barrier)]
+            if rows:
+                self._commit(conn, rows)
+            for item in batch:
+                if isinstance(item, _Barrier):
+                    item.done.set()
+
+    def _commit(self, conn: sqlite3.Connection, rows: list[tuple[str, tuple]]):
+        started = time.perf_counter()
+        try:
+            by_sql: dict[str, list[tuple]] = {}
+            for sql, params in rows:
+                by_sql.setdefault(sql, []).append(params)
+            with conn:
+                for sql, params_list in by_sql.items():
+                    conn.executemany(sql, params_list)
+            self.rows += len(rows)
+        except Exception as e:
+            self.errors += 1
+            logging.error(f"[db_writer] не смог записать пачку из {len(rows)} строк: {e}")
+        self.batches += 1
+        self.last_flush_ms = (time.perf_counter() - started) * 1000
+        self.max_flush_ms = max(self.max_flush_ms, self.last_flush_ms)
+
+
+stats_writer = SQLiteWriter()
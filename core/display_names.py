@@ -0,0 +1,82 @@
+"""Кэш отображаемых имён участников для отчётов ("статистика чат").
+
+Наполняется даром: IncomingMessageLogMiddleware кладёт сюда from_user каждого
+входящего сообщения. Запись живёт DISPLAY_NAME_TTL секунд. Для промахов
+resolve_many() спрашивает bot.get_chat_member параллельно (не больше
+FETCH_CONCURRENCY запросов одновременно), так что отчёт ждёт не дольше
+одного похода в Telegram вместо пятнадцати подряд.
+"""
+import asyncio
+import logging
+import time
+
+from core.bounded import TTLDict
+
+DISPLAY_NAME_TTL = 6 * 3600   # секунд
+DISPLAY_NAME_MAX = 50_000     # записей; старейшие вытесняются
+FETCH_CONCURRENCY = 15        # одновременных get_chat_member
+
+
+def format_display_name(user) -> str | None:
+    """Имя для отчёта по aiogram User: "Имя Фамилия", "Имя" или "@username"."""
+    if user.first_name and user.last_name:
+        return f"{user.first_name} {user.last_name}"
+    if user.first_name:
+        return user.first_name
+    if user.username:
+        return f"@{user.username}"
+    return None
+
+
+class DisplayNameCache:
+    def __init__(self, ttl: float = DISPLAY_NAME_TTL, max_size: int = DISPLAY_NAME_MAX,
+                 clock=time.monotonic):
+        self._names: TTLDict = TTLDict(ttl, max_size, name="display_names", clock=clock)
+
+    def note_user(self, user):
+        """Запоминает имя из from_user (вызывается на каждом входящем сообщении)."""
+        name = format_display_name(user)
+        if name:
+            self.put(user.id, name)
+
+    def put(self, user_id: int, name: str):
+        self._names[user_id] = name
+
+    def get(self, user_id: int) -> str | None:
+        return self._names.get(user_id)
+
+    async def resolve_many(self, bot, chat_id: int, user_ids: list[int],
+                           concurrency: int = FETCH_CONCURRENCY) -> dict[int, str]:
+        """Имена для user_ids: из кэша, промахи — параллельным get_chat_member."""
+        names = {}
+        misses = []
+        for user_id in user_ids:
+            name = self.get(user_id)
+            if name:
+                names[user_id] = name
+            else:
+                misses.append(user_id)
+        if not misses:
+            return names
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch(user_id: int) -> str:
+            async with semaphore:
+                try:
+                    chat_member = await bot.get_chat_member(chat_id, user_id)
+                except Exception as e:
+                    logging.error(f"Ошибка при получении информации о пользователе {user_id} в чате {chat_id}: {e}")
+                    return f"Пользователь {user_id}"
+            name = format_display_name(chat_member.user)
+            if not name:
+                return f"Пользователь {user_id}"
+            self.put(user_id, name)
+            return name
+
+        for user_id, name in zip(misses, await asyncio.gather(*(fetch(u) for u in misses))):
+            names[user_id] = name
+        return names
+
+
+display_names = DisplayNameCache()
@@ -1,9 +1,31 @@
-import re
+"""Режим "По памяти" (active_model == "history"): ответ кусками старой переписки чата.
+
+На реплику ищется самое похожее сообщение из истории чата, ответом служит то,
+что ему ответили (до RESPONSE_DEPTH сообщений подряд одного автора).
+
+Для каждого чата один раз строится _ChatHistory (потом дописывается подпиской
+на core.message_log):
+  - нормализованные тексты (rapidfuzz default_process);
+  - инвертированный индекс триграмм слов -> позиции сообщений: кандидаты — до
+    MAX_CANDIDATES сообщений с наибольшим числом общих триграмм с запросом.
+Кандидаты оцениваются одним вызовом rapidfuzz cdist (WRatio, как раньше у thefuzz);
+продолжение того же автора отсчитывается при ответе — не дальше depth сообщений.
+
+Индексы живут в LRU на MAX_CHATS чатов. Новые сообщения подписчик кладёт в
+очередь своего чата и сразу дописывает, если индекс не занят поиском; иначе
+очередь разберёт следующий поиск или следующее сообщение.
+"""
 import logging
 import random
-import os
-from thefuzz import process
-from config import LOG_FILE
+import threading
+from array import array
+
+import numpy as np
+from rapidfuzz import fuzz, process, utils
+
+from core.bounded import LRUDict
+from core.log_record import LogRecord, LogWatermark
+from core.message_log import message_log
 
 # === ПУЛЬТ УПРАВЛЕНИЯ РЕЖИМОМ ===
 MATCH_THRESHOLD = 70      # Схожесть (0-100). Чем выше, тем строже контекст.
@@ -11,73 +33,161 @@ RESPONSE_DEPTH = 2        # Сколько сообщений брать. 1 - к
 STRICT_USER = True        # True: брать сообщения только одного автора. False: брать кусок диалога всех подряд.
 MIN_WORD_LEN = 3          # Игнорировать слова короче этого при поиске (предлоги и т.д.)
 IGNORE_SHORT_MSG = True   # Игнорировать ответы из логов короче 2 символов (типа "п", "д", ".")
+MIN_HISTORY = 10          # меньше сообщений в истории — не отвечаем
+SKIP_LAST = 5             # последние сообщения (текущий разговор) не ищем
+MAX_CANDIDATES = 2000     # сколько кандидатов из индекса отдаём на нечёткое сравнение
+MAX_CHATS = 32            # индексов в памяти; дольше всех не спрошенный вытесняется
+
+
+def _trigrams(norm_text: str) -> set:
+    """Триграммы внутри слов (без пробелов) нормализованного текста."""
+    grams = set()
+    for word in norm_text.split():
+        for i in range(len(word) - 2):
+            grams.add(word[i:i + 3])
+    return grams
+
+
+class _ChatHistory:
+    __slots__ = ("texts", "norms", "user_ids", "postings", "mark", "pending")
+
+    def __init__(self):
+        self.texts: list[str] = []
+        self.norms: list[str] = []
+        self.user_ids: list[str] = []
+        self.postings: dict[str, array] = {}
+        self.mark = LogWatermark()
+        self.pending: list[LogRecord] = []
+
+    def append(self, record: LogRecord):
+        self.mark.note(record)
+        text = record.text.strip()
+        if IGNORE_SHORT_MSG and len(text) < 2:
+            return
+        pos = len(self.texts)
+        norm = utils.default_process(text)
+        self.texts.append(text)
+        self.norms.append(norm)
+        self.user_ids.append(record.user_id)
+        for gram in _trigrams(norm):
+            self.postings.setdefault(gram, array("I")).append(pos)
+
+    def drain(self):
+        """Дописывает накопленные подписчиком сообщения (под HistoryEngine._lock)."""
+        pending, self.pending = self.pending, []
+        for record in pending:
+            if self.mark.is_new(record):
+                self.append(record)
+
+    def run_length(self, start: int, limit: int) -> int:
+        """Сколько сообщений подряд с start (не больше limit) написал один автор."""
+        end = min(start + limit, len(self.texts))
+        count = 0
+        while start + count < end and self.user_ids[start + count] == self.user_ids[start]:
+            count += 1
+        return count
+
+    def candidates(self, norm_query: str, limit: int) -> np.ndarray:
+        """Позиции (< limit) с наибольшим числом общих с запросом триграмм."""
+        lists = [self.postings[g] for g in _trigrams(norm_query) if g in self.postings]
+        if not lists:
+            return np.empty(0, dtype=np.int64)
+        positions = np.concatenate([np.frombuffer(p, dtype=np.uint32) for p in lists])
+        overlap = np.bincount(positions, minlength=len(self.texts))[:limit]
+        hit = np.flatnonzero(overlap)
+        if len(hit) > MAX_CANDIDATES:
+            hit = hit[np.argpartition(-overlap[hit], MAX_CANDIDATES - 1)[:MAX_CANDIDATES]]
+        return hit
 
-def load_and_find_answer(user_input: str, chat_id: str, depth: int = RESPONSE_DEPTH):
-    history = []
-    chat_id_str = str(chat_id)
-    
-    try:
-        if not os.path.exists(LOG_FILE):
-            return None
-
-        with open(LOG_FILE, 'r', encoding='utf-8') as f:
-            for line in f:
-                if chat_id_str in line:
-                    # Регулярка под ваш формат лога
-                    match = re.search(r"User (\d+) \(.*?\) \[(.*?)\]: (.*)", line)
-                    if match:
-                        text = match.group(3).strip()
-                        if IGNORE_SHORT_MSG and len(text) < 2:
-                            continue
-                        history.append({
-                            "user_id": match.group(1),
-                            "text": text
-                        })
-        
-        if len(history) < 10:
-            return None
-
-        # Очистка входного запроса для лучшего поиска
-        clean_input = " ".join([w for w in user_input.split() if len(w) >= MIN_WORD_LEN])
-        if not clean_input: clean_input = user_input
-
-        all_texts = [msg['text'] for msg in history[:-5]]
-        
-        # Поиск совпадений
-        matches = process.extractBests(clean_input, all_texts, score_cutoff=MATCH_THRESHOLD, limit=5)
-        
-        if not matches:
-            return None
-
-        # Выбор лучшего совпадения (можно брать [0] для точности или random для хаоса)
-        best_match_text = matches[0][0] 
-        
-        indices = [i for i, x in enumerate(all_texts) if x == best_match_text]
-        start_index = random.choice(indices)
-        
-        response_parts = []
-        current_idx = start_index + 1
-        
-        if current_idx < len(history):
-            first_responder_id = history[current_idx]['user_id']
-            for i in range(depth):
-                idx = current_idx + i
-                if idx < len(history):
-                    msg = history[idx]
-                    
-                    # Логика управления контекстом:
-                    if STRICT_USER:
-                        # Только если продолжает писать тот же человек
-                        if msg['user_id'] == first_responder_id:
-                            response_parts.append(msg['text'])
-                        else:
-                            break
-                    else:
-                        # Берем всё подряд (хаотичный диалог)
-                        response_parts.append(f"[{msg.get('name', '???')}]: {msg['text']}")
+
+class HistoryEngine:
+    def __init__(self):
+        self._chats: LRUDict = LRUDict(MAX_CHATS, name="history_engine_chats")
+        self._lock = threading.Lock()
+
+    def on_message(self, record: LogRecord):
+        """Подписчик message_log: сообщение уходит в очередь своего чата (если он проиндексирован).
+
+        Очередь разбирается сразу, если индекс не занят поиском, — ждать
+        поиск в потоке event loop нельзя, а копить до следующего поиска — значит
+        копить вечно, если в чате больше не спрашивают.
+        """
+        history = self._chats.peek(record.chat_id)
+        if history is None:
+            return
+        history.pending.append(record)
+        if self._lock.acquire(blocking=False):
+            try:
+                history.drain()
+            finally:
+                self._lock.release()
+
+    def _chat(self, chat_id: str) -> _ChatHistory:
+        """Индекс чата (под self._lock): строится при первом обращении, затем догоняется из очереди."""
+        history = self._chats.get(chat_id)
+        if history is None:
+            # индекс регистрируется до чтения шарда: всё, что запишется во время
+            # чтения, копится в его очереди (повторы с прочитанным отсечёт mark)
+            history = self._chats[chat_id] = _ChatHistory()
+            try:
+                for record in message_log.iter_chat(chat_id):
+                    history.append(record)
+            except Exception:
+                self._chats.pop(chat_id, None)
+                raise
+        history.drain()
+        return history
+
+    def find_answer(self, user_input: str, chat_id: str, depth: int = RESPONSE_DEPTH):
+        with self._lock:
+            history = self._chat(str(chat_id))
+            if len(history.texts) < MIN_HISTORY:
+                return None
+
+            # Очистка входного запроса для лучшего поиска
+            clean_input = " ".join([w for w in user_input.split() if len(w) >= MIN_WORD_LEN])
+            if not clean_input: clean_input = user_input
+            norm_query = utils.default_process(clean_input)
+            if not norm_query:
+                return None
+
+            limit = len(history.texts) - SKIP_LAST
+            candidates = history.candidates(norm_query, limit)
+            if not len(candidates):
+                return None
+
+            # Поиск совпадений
+            scores = process.cdist(
+                [norm_query], [history.norms[i] for i in candidates],
+                scorer=fuzz.WRatio, score_cutoff=MATCH_THRESHOLD, dtype=np.uint8,
+            )[0]
+            best = int(scores.argmax())
+            if scores[best] < MATCH_THRESHOLD:
+                return None
+
+            # Одинаковые сообщения встречаются много раз — берём случайное из них
+            best_text = history.texts[candidates[best]]
+            start_index = random.choice([int(i) for i in candidates if history.texts[i] == best_text])
+
+            current_idx = start_index + 1
+            if STRICT_USER:
+                # Только если продолжает писать тот же человек
+                count = history.run_length(current_idx, depth)
+                response_parts = history.texts[current_idx:current_idx + count]
+            else:
+                # Берем всё подряд (хаотичный диалог)
+                response_parts = [f"[???]: {text}" for text in history.texts[current_idx:current_idx + depth]]
 
         return " ".join(response_parts) if response_parts else None
-            
+
+
+history_engine = HistoryEngine()
+message_log.subscribe(history_engine.on_message)
+
+
+def load_and_find_answer(user_input: str, chat_id: str, depth: int = RESPONSE_DEPTH):
+    try:
+        return history_engine.find_answer(user_input, chat_id, depth)
     except Exception as e:
         logging.error(f"Error: {e}")
         return None
@@ -0,0 +1,211 @@
+"""Отложенная атомарная запись JSON-состояния (chat_settings.json, chats.json и т.п.).
+
+Раньше каждое изменение настройки переписывало весь файл с отступами прямо в
+обработчике — а некоторые изменения случаются на каждое сообщение. Теперь
+владелец данных держит их в памяти и после изменения зовёт mark_dirty():
+
+  - первое изменение планирует запись через interval секунд, следующие за это
+    время лишь ставят флаг — не больше одной записи на хранилище за интервал;
+  - снимок (snapshot() -> json.dumps) снимается в потоке цикла событий, где
+    данные и меняются; сама запись — в потоке (run_in_executor);
+  - запись: tmp-файл + fsync + os.replace. tmp-файл служит журналом: если бот
+    упал после fsync, но до replace, read() при старте доводит замену до конца,
+    а недописанный tmp отбрасывает; неудачная запись повторяется через interval;
+  - вне цикла событий (скрипты, тесты, загрузка) mark_dirty() пишет сразу;
+    из рабочих потоков — через цикл, привязанный bind_loop() (или пойманный
+    при первом изменении из цикла);
+  - flush_all() при остановке бота дописывает всё грязное.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+from typing import Any, Callable
+
+FLUSH_INTERVAL = 2.0   # секунд копим изменения до записи
+
+_stores: list["DebouncedStore"] = []
+_loop: asyncio.AbstractEventLoop | None = None
+
+
+def bind_loop(loop: asyncio.AbstractEventLoop | None = None):
+    """Запоминает цикл событий бота: изменения из рабочих потоков пишутся через него."""
+    global _loop
+    _loop = loop or asyncio.get_running_loop()
+
+
+class DebouncedStore:
+    """Общая механика отложенной записи. Наследник реализует _collect() — снимок
+    изменений в потоке цикла событий (None — писать нечего) — и _persist(снимок)
+    — запись в потоке."""
+
+    def __init__(self, interval: float = FLUSH_INTERVAL):
+        self.interval = interval
+        self._dirty = False
+        self._timer = None
+        self._pending = False          # таймер поставлен из другого потока, но ещё не взведён
+        self._state_lock = threading.Lock()
+        self._generation = 0           # номер снимка; старый снимок не перетирает новый
+        self.marks = 0
+        self.writes = 0
+        _stores.append(self)
+
+    def _collect(self) -> Any:
+        raise NotImplementedError
+
+    def _persist(self, payload: Any):
+        raise NotImplementedError
+
+    def _next_generation(self) -> int:
+        with self._state_lock:
+            self._dirty = False
+            self._generation += 1
+            return self._generation
+
+    # --- изменения ---
+
+    def mark_dirty(self):
+        """Данные изменились: запись будет не позже чем через interval секунд."""
+        global _loop
+        with self._state_lock:
+            self.marks += 1
+            self._dirty = True
+            if self._timer is not None or self._pending:
+                return
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = None
+            if loop is not None:
+                _loop = _loop or loop
+                self._timer = loop.call_later(self.interval, self._flush_later, loop)
+                return
+            if _loop is not None and _loop.is_running():
+                self._pending = True
+                _loop.call_soon_threadsafe(self._arm, _loop)
+                return
+        self.flush()   # цикла нет — пишем сразу
+
+    def _arm(self, loop):
+        with self._state_lock:
+            self._pending = False
+            if self._timer is None:
+                self._timer = loop.call_later(self.interval, self._flush_later, loop)
+
+    def _persist_failed(self, rollback: Callable[[], None] | None = None):
+        """Запись не удалась (зовётся из _persist): данные снова грязные, и повтор
+        планируется через interval — иначе он ждал бы следующего изменения."""
+        with self._state_lock:
+            if rollback is not None:
+                rollback()
+            self._dirty = True
+            loop = _loop
+            if self._timer is not None or self._pending or loop is None or not loop.is_running():
+                return
+            self._pending = True
+            loop.call_soon_threadsafe(self._arm, loop)
+
+    def _flush_later(self, loop):
+        with self._state_lock:
+            self._timer = None
+        if self._dirty:
+            payload = self._collect()
+            if payload is not None:
+                loop.run_in_executor(None, self._persist, payload)
+
+    def _cancel_timer(self):
+        with self._state_lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def flush(self):
+        """Немедленная запись (блокирующая)."""
+        self._cancel_timer()
+        payload = self._collect()
+        if payload is not None:
+            self._persist(payload)
+
+    async def aflush(self):
+        """Дописывает отложенное; снимок — в цикле событий, запись — в потоке."""
+        self._cancel_timer()
+        if self._dirty:
+            payload = self._collect()
+            if payload is not None:
+                await asyncio.to_thread(self._persist, payload)
+
+
+class JsonStateStore(DebouncedStore):
+    """Файл JSON целиком: snapshot() отдаёт сериализуемые данные владельца."""
+
+    def __init__(self, path: str, snapshot: Callable[[], Any], indent: int | None = 4,
+                 interval: float = FLUSH_INTERVAL):
+        super().__init__(interval)
+        self.path = str(path)
+        self.snapshot = snapshot
+        self.indent = indent
+        self._write_lock = threading.Lock()
+        self._written = 0
+
+    @property
+    def journal_path(self) -> str:
+        return f"{self.path}.tmp"
+
+    # --- чтение ---
+
+    def read(self, default: Any = None) -> Any:
+        """Читает файл (блокирующий, при старте), сперва доводя до конца прерванную запись."""
+        self._recover_journal()
+        if not os.path.exists(self.path):
+            return default
+        with open(self.path, "r", encoding="utf-8") as file:
+            return json.load(file)
+
+    def _recover_journal(self):
+        if not os.path.exists(self.journal_path):
+            return
+        try:
+            with open(self.journal_path, "r", encoding="utf-8") as file:
+                json.load(file)
+        except Exception:
+            logging.warning(f"[json_store] недописанный журнал {self.journal_path} отброшен")
+            os.remove(self.journal_path)
+            return
+        os.replace(self.journal_path, self.path)
+        logging.warning(f"[json_store] {self.path} восстановлен из журнала")
+
+    # --- запись ---
+
+    def _collect(self) -> tuple[int, str] | None:
+        generation = self._next_generation()
+        try:
+            return generation, json.dumps(self.snapshot(), ensure_ascii=False, indent=self.indent)
+        except Exception as e:
+            with self._state_lock:
+                self._dirty = True
+            logging.error(f"[json_store] не смог сериализовать {self.path}: {e}")
+            return None
+
+    def _persist(self, payload: tuple[int, str]):
+        generation, text = payload
+        try:
+            with self._write_lock:
+                if generation <= self._written:
+                    return
+                with open(self.journal_path, "w", encoding="utf-8") as file:
+                    file.write(text)
+                    file.flush()
+                    os.fsync(file.fileno())
+                os.replace(self.journal_path, self.path)
+                self._written = generation
+                self.writes += 1
+        except Exception as e:
+            logging.error(f"[json_store] не смог записать {self.path}: {e}")
+            self._persist_failed()
+
+
+async def flush_all():
+    """Дописывает все грязные хранилища (при остановке бота)."""
+    for store in list(_stores):
+        await store.aflush()
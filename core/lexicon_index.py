@@ -0,0 +1,290 @@
+"""Накопительные счётчики n-грамм для "лексикон чат" / "мой лексикон" / "лексикон <имя>".
+
+Таблица ngrams хранит готовые частоты слов, биграмм и триграмм по чату
+(user_id = '') и по каждому участнику чата, так что команда — это один
+ORDER BY count DESC LIMIT top_n по индексу, без перечитывания лога.
+N-граммы считаются внутри одного сообщения (через границу сообщений фразы не склеиваются).
+
+Наполнение — как у core.recall_index:
+  - подписка на core.message_log: новые сообщения копятся в _pending и пачкой
+    сворачиваются в один Counter и один UPSERT на n-грамму;
+  - догон при первом обращении к чату после старта: всё, что в шарде новее
+    indexed_chats.last_ts (первый раз — вся история чата);
+  - rebuild() — полный пересчёт из лога (админ-команда "лексикон пересобрать"),
+    например после правки STOPWORDS.
+
+Биграммы и триграммы почти все уникальны, и таблица растёт быстрее лога.
+compact() (раз в COMPACT_INTERVAL, фоновая задача из main.py) удаляет
+фразы (n >= 2), встреченные реже COMPACT_MIN_COUNT раз, и оставляет не больше
+KEEP_TOP самых частых фраз на (чат, участник, n); слова не трогаются. Топы
+команд это не меняет; редкая фраза, повторившись после чистки, начнёт счёт заново.
+"""
+import asyncio
+import collections
+import logging
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+from core.log_record import LogRecord
+from core.message_log import message_log
+from core.state import LEXICON_DB_FILE
+from prompts import STOPWORDS
+
+FLUSH_BATCH = 100   # сколько новых сообщений копим перед фоновой записью
+MAX_N = 3           # считаем слова, биграммы и триграммы
+CHAT_TOTAL = ""     # user_id строки с частотами всего чата
+COMPACT_INTERVAL = 24 * 3600   # как часто чистить счётчики, с
+COMPACT_MIN_COUNT = 2          # фразы (n >= 2) реже этого удаляются
+KEEP_TOP = 5000                # фраз (n >= 2) на (чат, участник, n) после чистки
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def clean_text(text: str) -> list:
+    """Слова текста в нижнем регистре без стоп-слов."""
+    return [word for word in _WORD_RE.findall(text.lower()) if word not in STOPWORDS]
+
+
+def count_ngrams(text: str, counter: collections.Counter, max_n: int = MAX_N):
+    """Добавляет в counter n-граммы одного сообщения: ключ (n, 'слово слово')."""
+    words = clean_text(text)
+    for n in range(1, max_n + 1):
+        for i in range(len(words) - n + 1):
+            counter[(n, " ".join(words[i:i + n]))] += 1
+
+
+class LexiconIndex:
+    def __init__(self, db_path: str = LEXICON_DB_FILE):
+        self.db_path = db_path
+        self._conn = None
+        self._lock = threading.Lock()
+        self._pending: list[LogRecord] = []
+        self._caught_up: set[str] = set()
+        self._flush_scheduled = False
+
+    # --- соединение и схема ---
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS ngrams (
+                    chat_id TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    n INTEGER NOT NULL,
+                    gram TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (chat_id, user_id, n, gram)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS idx_ngrams_top ON ngrams (chat_id, user_id, n, count DESC);
+                CREATE TABLE IF NOT EXISTS users (
+                    chat_id TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    username TEXT NOT NULL,
+                    full_name TEXT NOT NULL,
+                    PRIMARY KEY (chat_id, user_id)
+                );
+                CREATE TABLE IF NOT EXISTS indexed_chats (
+                    chat_id TEXT PRIMARY KEY,
+                    last_ts TEXT NOT NULL
+                );
+                """
+            )
+            self._conn = conn
+        return self._conn
+
+    # --- наполнение ---
+
+    def on_message(self, record: LogRecord):
+        """Подписчик message_log: копит запись и при необходимости планирует запись пачки."""
+        if not record.text.strip():
+            return
+        self._pending.append(record)
+        if len(self._pending) >= FLUSH_BATCH and not self._flush_scheduled:
+            self._flush_scheduled = True
+            asyncio.get_running_loop().run_in_executor(None, self.flush)
+
+    def flush(self):
+        """Сворачивает накопленные записи догнанных чатов в счётчики. Остальные догонятся из шарда."""
+        with self._lock:
+            self._flush_scheduled = False
+            pending, self._pending = self._pending, []
+            by_chat: dict[str, list[LogRecord]] = {}
+            for record in pending:
+                if record.chat_id in self._caught_up:
+                    by_chat.setdefault(record.chat_id, []).append(record)
+            if not by_chat:
+                return
+            try:
+                conn = self._db()
+                with conn:
+                    for chat_id, records in by_chat.items():
+                        self._add(conn, chat_id, records)
+            except Exception as e:
+                logging.error(f"[lexicon_index] не смог записать пачку: {e}", exc_info=True)
+
+    def _add(self, conn: sqlite3.Connection, chat_id: str, records) -> int:
+        """Добавляет записи чата в счётчики, пропуская уже учтённые (ts <= last_ts)."""
+        row = conn.execute("SELECT last_ts FROM indexed_chats WHERE chat_id = ?", (chat_id,)).fetchone()
+        last_ts = row[0] if row else ""
+        counters: dict[str, collections.Counter] = collections.defaultdict(collections.Counter)
+        users = {}
+        added = 0
+        for record in records:
+            ts = record.timestamp.isoformat()
+            if ts <= last_ts or not record.text.strip():
+                continue
+            count_ngrams(record.text, counters[record.user_id])
+            users[record.user_id] = (record.username, record.full_name)
+            last_ts = ts
+            added += 1
+
+        chat_total = collections.Counter()
+        for user_counter in counters.values():
+            chat_total.update(user_counter)
+        counters[CHAT_TOTAL] = chat_total
+
+        conn.executemany(
+            "INSERT INTO ngrams (chat_id, user_id, n, gram, count) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(chat_id, user_id, n, gram) DO UPDATE SET count = count + excluded.count",
+            (
+                (chat_id, user_id, n, gram, count)
+                for user_id, counter in counters.items()
+                for (n, gram), count in counter.items()
+            ),
+        )
+        conn.executemany(
+            "INSERT INTO users (chat_id, user_id, username, full_name) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(chat_id, user_id) DO UPDATE SET username = excluded.username, full_name = excluded.full_name",
+            ((chat_id, user_id, username, full_name) for user_id, (username, full_name) in users.items()),
+        )
+        if last_ts:
+            conn.execute(
+                "INSERT INTO indexed_chats (chat_id, last_ts) VALUES (?, ?) "
+                "ON CONFLICT(chat_id) DO UPDATE SET last_ts = excluded.last_ts",
+                (chat_id, last_ts),
+            )
+        return added
+
+    def ensure_chat(self, chat_id):
+        """Догоняет счётчики чата по его шарду (первый раз — вся история)."""
+        chat_id = str(chat_id)
+        self.flush()
+        with self._lock:
+            if chat_id in self._caught_up:
+                return
+            conn = self._db()
+            row = conn.execute("SELECT last_ts FROM indexed_chats WHERE chat_id = ?", (chat_id,)).fetchone()
+            since = datetime.fromisoformat(row[0]) if row else None
+            with conn:
+                self._add(conn, chat_id, message_log.iter_chat(chat_id, since=since))
+            self._caught_up.add(chat_id)
+
+    def rebuild(self, chat_id=None) -> tuple[int, int]:
+        """Пересчитывает счётчики из лога с нуля: одного чата или всех. Возвращает (чатов, сообщений)."""
+        chat_ids = [str(chat_id)] if chat_id is not None else message_log.chat_ids()
+        self.flush()
+        total = 0
+        for cid in chat_ids:
+            with self._lock:
+                conn = self._db()
+                with conn:
+                    for table in ("ngrams", "users", "indexed_chats"):
+                        conn.execute(f"DELETE FROM {table} WHERE chat_id = ?", (cid,))
+                    total += self._add(conn, cid, message_log.iter_chat(cid))
+                self._caught_up.add(cid)
+        return len(chat_ids), total
+
+    # --- чистка ---
+
+    def compact(self, min_count: int = COMPACT_MIN_COUNT, keep_top: int = KEEP_TOP) -> int:
+        """Удаляет редкие фразы и хвосты фраз за пределами keep_top. Возвращает число удалённых строк.
+
+        Слова (n = 1) не трогаются — по ним строится отчёт. Чистка идёт по чату за
+        транзакцию, и между чатами замок отпускается: запись новых пачек не ждёт всю таблицу.
+        """
+        self.flush()
+        with self._lock:
+            chat_ids = [chat_id for (chat_id,) in self._db().execute("SELECT chat_id FROM indexed_chats")]
+        removed = 0
+        for chat_id in chat_ids:
+            with self._lock:
+                conn = self._db()
+                with conn:
+                    removed += conn.execute(
+                        "DELETE FROM ngrams WHERE chat_id = ? AND n >= 2 AND count < ?", (chat_id, min_count)
+                    ).rowcount
+                    removed += conn.execute(
+                        "DELETE FROM ngrams WHERE (chat_id, user_id, n, gram) IN ("
+                        " SELECT chat_id, user_id, n, gram FROM ("
+                        "  SELECT chat_id, user_id, n, gram, ROW_NUMBER() OVER ("
+                        "   PARTITION BY user_id, n ORDER BY count DESC) AS place"
+                        "  FROM ngrams WHERE chat_id = ? AND n >= 2) WHERE place > ?)",
+                        (chat_id, keep_top),
+                    ).rowcount
+        if removed:
+            logging.info(f"[lexicon_index] чистка: удалено {removed} редких n-грамм")
+        return removed
+
+    async def compact_loop(self, interval: float = COMPACT_INTERVAL):
+        """Плановая чистка раз в interval секунд (фоновая задача из main.py)."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.compact)
+            except Exception as e:
+                logging.error(f"[lexicon_index] чистка не удалась: {e}", exc_info=True)
+
+    # --- чтение ---
+
+    def top(self, chat_id, n: int, top_n: int, user_ids: list[str] | None = None) -> list[tuple[str, int]]:
+        """Самые частые n-граммы чата (или суммарно по user_ids): [(фраза, count)]."""
+        chat_id = str(chat_id)
+        self.ensure_chat(chat_id)
+        with self._lock:
+            conn = self._db()
+            if user_ids is None or len(user_ids) == 1:
+                user_id = CHAT_TOTAL if user_ids is None else str(user_ids[0])
+                return conn.execute(
+                    "SELECT gram, count FROM ngrams WHERE chat_id = ? AND user_id = ? AND n = ? "
+                    "ORDER BY count DESC LIMIT ?",
+                    (chat_id, user_id, n, top_n),
+                ).fetchall()
+            if not user_ids:
+                return []
+            placeholders = ",".join("?" * len(user_ids))
+            return conn.execute(
+                f"SELECT gram, SUM(count) AS total FROM ngrams "
+                f"WHERE chat_id = ? AND user_id IN ({placeholders}) AND n = ? "
+                f"GROUP BY gram ORDER BY total DESC LIMIT ?",
+                (chat_id, *map(str, user_ids), n, top_n),
+            ).fetchall()
+
+    def find_users(self, chat_id, username_or_name: str) -> list[str]:
+        """user_id участников чата: сначала по username, если нет — по полному имени (без учёта регистра)."""
+        chat_id = str(chat_id)
+        self.ensure_chat(chat_id)
+        with self._lock:
+            conn = self._db()
+            rows = conn.execute(
+                "SELECT user_id FROM users WHERE chat_id = ? AND username = ?", (chat_id, username_or_name)
+            ).fetchall()
+            if not rows:
+                name = username_or_name.lower()
+                rows = [
+                    (user_id,)
+                    for user_id, full_name in conn.execute(
+                        "SELECT user_id, full_name FROM users WHERE chat_id = ?", (chat_id,)
+                    )
+                    if full_name.lower() == name
+                ]
+        return [user_id for (user_id,) in rows]
+
+
+lexicon_index = LexiconIndex()
+message_log.subscribe(lexicon_index.on_message)
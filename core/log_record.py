@@ -0,0 +1,124 @@
+"""Разбор записей лога сообщений — единственное место, где известен формат строки.
+
+Формат (format_log_line, пишет features.lexicon_settings.save_user_message):
+    <iso-время> - Chat <id> (<название>) - User <id> (<username>) [<имя>]: <текст>
+
+Регулярка работает прямо по байтам: запись не декодируется целиком, в str
+переводятся только поля. Перед разбором читатели отсекают лишнее дешёвыми
+проверками по сырым байтам — chat_marker() (подстрока чата) и
+timestamp_key() (сравнение префикса времени вместо fromisoformat).
+"""
+import re
+from collections import Counter
+from datetime import datetime
+
+# "YYYY-MM-DDTHH:MM:SS" — до секунд isoformat сравнивается как строка
+TIMESTAMP_KEY_LEN = 19
+
+RECORD_START_RE = re.compile(rb"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}")
+RECORD_CHAT_RE = re.compile(rb"\S+ - Chat (\S+) \(")
+
+# Только заголовок записи: текст — всё после него, срезом (регулярка по тексту
+# многострочных сообщений стоила бы O(длины) на каждый символ). Время проверяет fromisoformat.
+LOG_RECORD_RE = re.compile(
+    rb"([\d\-T:.]+) - Chat (-?\d+) \((.*?)\) - User (\d+) \((.*?)\) \[(.*?)\]: ",
+    re.DOTALL,
+)
+
+
+class LogRecord:
+    """Разобранная запись лога. chat_id и user_id — строки, как в логе."""
+
+    __slots__ = ("timestamp", "chat_id", "chat_title", "user_id", "username", "full_name", "text")
+
+    def __init__(self, timestamp: datetime, chat_id: str, chat_title: str, user_id: str,
+                 username: str, full_name: str, text: str):
+        self.timestamp = timestamp
+        self.chat_id = chat_id
+        self.chat_title = chat_title
+        self.user_id = user_id
+        self.username = username
+        self.full_name = full_name
+        self.text = text
+
+    def __repr__(self):
+        return f"LogRecord({self.timestamp.isoformat()}, chat={self.chat_id}, user={self.user_id}, {self.text!r})"
+
+
+class LogWatermark:
+    """Докуда дочитан лог: время последней учтённой записи и какие записи с этим
+    временем уже учтены.
+
+    Подписчик message_log получает запись уже после того, как она легла в шард,
+    так что догоняющий после чтения шарда буфер может повторять прочитанное.
+    Сравнение только по времени (> последнего) теряло соседние записи той же
+    секунды; здесь запись того же времени отбрасывается, только если такая
+    (автор, текст) уже была учтена.
+    """
+
+    __slots__ = ("ts", "seen")
+
+    def __init__(self):
+        self.ts: datetime | None = None
+        self.seen: Counter = Counter()
+
+    def note(self, record: LogRecord):
+        """Запись учтена (прочитана из шарда или дописана из буфера)."""
+        if record.timestamp != self.ts:
+            self.ts = record.timestamp
+            self.seen.clear()
+        self.seen[(record.user_id, record.text)] += 1
+
+    def is_new(self, record: LogRecord) -> bool:
+        """Запись из буфера подписчика ещё не учтена. Повтор «съедается» один раз."""
+        if self.ts is None or record.timestamp > self.ts:
+            return True
+        if record.timestamp < self.ts:
+            return False
+        key = (record.user_id, record.text)
+        if self.seen[key] > 0:
+            self.seen[key] -= 1
+            return False
+        return True
+
+
+def format_log_line(timestamp: datetime, chat_id, chat_title: str, user_id, username: str,
+                    full_name: str, text: str) -> str:
+    """Строка лога для записи — обратная операция к parse_log_record."""
+    return (f"{timestamp.isoformat()} - Chat {chat_id} ({chat_title}) - User {user_id} ({username})"
+            f" [{full_name}]: {text}\n")
+
+
+def chat_marker(chat_id) -> bytes:
+    """Подстрока, которая есть в сырой записи чата chat_id (None — любого чата)."""
+    if chat_id is None:
+        return b" - Chat "
+    return f" - Chat {chat_id} (".encode("utf-8")
+
+
+def timestamp_key(dt: datetime) -> bytes:
+    """Префикс времени записи для сравнения с raw[:TIMESTAMP_KEY_LEN] без разбора."""
+    return dt.isoformat().encode("ascii")[:TIMESTAMP_KEY_LEN]
+
+
+def parse_log_record(raw: bytes | str) -> LogRecord | None:
+    """Разбирает запись лога или возвращает None (мусор, BROADCAST и т.п.)."""
+    if isinstance(raw, str):
+        raw = raw.encode("utf-8")
+    match = LOG_RECORD_RE.match(raw)
+    if not match:
+        return None
+    ts, chat_id, chat_title, user_id, username, full_name = match.groups()
+    try:
+        timestamp = datetime.fromisoformat(ts.decode("ascii"))
+    except ValueError:
+        return None
+    return LogRecord(
+        timestamp,
+        chat_id.decode("ascii"),
+        chat_title.decode("utf-8", errors="replace"),
+        user_id.decode("ascii"),
+        username.decode("utf-8", errors="replace"),
+        full_name.decode("utf-8", errors="replace"),
+        raw[match.end():].rstrip(b"\n").decode("utf-8", errors="replace"),
+    )
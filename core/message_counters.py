@@ -0,0 +1,227 @@
+"""Счётчики сообщений участников для рангов и "статистика" (message_stats).
+
+Во время работы источник правды — словарь core.state.message_stats:
+{chat_id: {user_id: {total, daily, weekly, last_daily_reset, last_weekly_reset}}}.
+increment() меняет одну запись и помечает её грязной — O(1) на сообщение,
+диск не трогается. Пишет один писатель (в потоке, не больше одной записи
+одновременно): после FLUSH_EVERY изменений, раз в FLUSH_INTERVAL секунд (run())
+и при остановке бота (flush()).
+
+Бэкенды (core.state.STATS_BACKEND):
+  - "json": словарь целиком сериализуется и атомарно подменяет STATS_FILE
+    (tmp + os.replace) — раз на пачку изменений, а не на каждое сообщение;
+  - "sqlite": в STATS_DB_FILE уходят только грязные строки, total — приращением
+    (total = total + прирост). Первый запуск переносит данные из STATS_FILE.
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+from datetime import date
+
+from core.state import STATS_BACKEND, STATS_DB_FILE, STATS_FILE, message_stats
+
+FLUSH_EVERY = 500     # изменений до внеочередной записи
+FLUSH_INTERVAL = 30   # секунд между плановыми записями
+
+
+class MessageCounters:
+    def __init__(self, stats: dict, backend: str = STATS_BACKEND,
+                 json_path: str = STATS_FILE, db_path: str = STATS_DB_FILE):
+        if backend not in ("json", "sqlite"):
+            raise ValueError(f"Неизвестный бэкенд статистики: {backend}")
+        self.stats = stats
+        self.backend = backend
+        self.json_path = json_path
+        self.db_path = db_path
+        self._conn = None
+        self._lock = threading.Lock()
+        self._dirty: dict[tuple[str, str], int] = {}  # (чат, участник) -> прирост total с прошлой записи
+        self._retry_rows: list[tuple] = []            # строки неудавшейся записи в SQLite
+        self._retry_json = False                      # неудавшаяся запись JSON — повторить целиком
+        self._changes = 0
+        self._inflight = None
+
+    # --- загрузка ---
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS user_counters (
+                    chat_id TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    total INTEGER NOT NULL,
+                    daily INTEGER NOT NULL,
+                    weekly INTEGER NOT NULL,
+                    last_daily_reset TEXT NOT NULL,
+                    last_weekly_reset TEXT NOT NULL,
+                    PRIMARY KEY (chat_id, user_id)
+                ) WITHOUT ROWID
+                """
+            )
+            self._conn = conn
+        return self._conn
+
+    def _read_json(self) -> dict:
+        if not os.path.exists(self.json_path):
+            return {}
+        with open(self.json_path, "r", encoding="utf-8") as file:
+            return json.load(file)
+
+    def load(self):
+        """Заполняет словарь статистики с диска (блокирующий, при старте)."""
+        self.stats.clear()
+        try:
+            if self.backend == "json":
+                self.stats.update(self._read_json())
+            else:
+                with self._lock:
+                    conn = self._db()
+                    if conn.execute("SELECT 1 FROM user_counters LIMIT 1").fetchone() is None:
+                        self._import_json(conn)
+                    for chat_id, user_id, total, daily, weekly, last_daily, last_weekly in conn.execute(
+                        "SELECT * FROM user_counters"
+                    ):
+                        self.stats.setdefault(chat_id, {})[user_id] = {
+                            "total": total,
+                            "daily": daily,
+                            "weekly": weekly,
+                            "last_daily_reset": last_daily,
+                            "last_weekly_reset": last_weekly,
+                        }
+            logging.info(f"📊 Загружено {len(self.stats)} чатов в статистику.")
+        except Exception as e:
+            logging.error(f"Ошибка при загрузке статистики: {e}")
+            self.stats.clear()
+
+    def _import_json(self, conn: sqlite3.Connection):
+        """Разовый перенос message_stats.json в пустую базу."""
+        data = self._read_json()
+        today = date.today().isoformat()
+        with conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO user_counters VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (chat_id, user_id, s.get("total", 0), s.get("daily", 0), s.get("weekly", 0),
+                     s.get("last_daily_reset", today), s.get("last_weekly_reset", today))
+                    for chat_id, users in data.items()
+                    for user_id, s in users.items()
+                ),
+            )
+        if data:
+            logging.info(f"📊 Статистика {len(data)} чатов перенесена из {self.json_path} в {self.db_path}.")
+
+    # --- изменение ---
+
+    def increment(self, chat_id: str, user_id: str, today: date | None = None) -> dict:
+        """+1 сообщение участнику (со сбросом дневного/недельного счётчика). Возвращает его запись."""
+        today = today or date.today()
+        today_str = today.isoformat()
+        user_stats = self.stats.setdefault(chat_id, {}).get(user_id)
+        if user_stats is None:
+            user_stats = self.stats[chat_id][user_id] = {
+                "total": 0,
+                "daily": 0,
+                "weekly": 0,
+                "last_daily_reset": today_str,
+                "last_weekly_reset": today_str,
+            }
+
+        try:
+            last_daily_reset = date.fromisoformat(user_stats.get("last_daily_reset", today_str))
+        except (TypeError, ValueError):
+            last_daily_reset = today
+            user_stats["last_daily_reset"] = today_str
+        try:
+            last_weekly_reset = date.fromisoformat(user_stats.get("last_weekly_reset", today_str))
+        except (TypeError, ValueError):
+            last_weekly_reset = today
+            user_stats["last_weekly_reset"] = today_str
+
+        if today > last_daily_reset:
+            user_stats["daily"] = 0
+            user_stats["last_daily_reset"] = today_str
+        if (today - last_weekly_reset).days >= 7:
+            user_stats["weekly"] = 0
+            user_stats["last_weekly_reset"] = today_str
+
+        user_stats["total"] = user_stats.get("total", 0) + 1
+        user_stats["daily"] = user_stats.get("daily", 0) + 1
+        user_stats["weekly"] = user_stats.get("weekly", 0) + 1
+
+        key = (chat_id, user_id)
+        self._dirty[key] = self._dirty.get(key, 0) + 1
+        self._changes += 1
+        if self._changes >= FLUSH_EVERY and (self._inflight is None or self._inflight.done()):
+            self._start_write()
+        return user_stats
+
+    # --- запись ---
+
+    def _snapshot(self):
+        """Что писать (в потоке событий, пока запись не идёт): JSON-текст или грязные строки."""
+        dirty, self._dirty = self._dirty, {}
+        self._changes = 0
+        if self.backend == "json":
+            self._retry_json = False
+            return json.dumps(self.stats, ensure_ascii=False)
+        rows, self._retry_rows = self._retry_rows, []
+        for (chat_id, user_id), delta in dirty.items():
+            s = self.stats[chat_id][user_id]
+            rows.append((chat_id, user_id, delta, s["daily"], s["weekly"],
+                         s["last_daily_reset"], s["last_weekly_reset"]))
+        return rows
+
+    def _write(self, snapshot):
+        """Блокирующая запись снимка (в потоке)."""
+        with self._lock:
+            try:
+                if self.backend == "json":
+                    tmp_path = self.json_path + ".tmp"
+                    with open(tmp_path, "w", encoding="utf-8") as file:
+                        file.write(snapshot)
+                    os.replace(tmp_path, self.json_path)
+                    return
+                conn = self._db()
+                with conn:
+                    conn.executemany(
+                        "INSERT INTO user_counters VALUES (?, ?, ?, ?, ?, ?, ?) "
+                        "ON CONFLICT(chat_id, user_id) DO UPDATE SET "
+                        "total = total + excluded.total, daily = excluded.daily, weekly = excluded.weekly, "
+                        "last_daily_reset = excluded.last_daily_reset, last_weekly_reset = excluded.last_weekly_reset",
+                        snapshot,
+                    )
+            except Exception as e:
+                logging.error(f"Ошибка при сохранении статистики: {e}")
+                # приращения не терять: уйдут со следующей записью
+                if self.backend == "sqlite":
+                    self._retry_rows = snapshot + self._retry_rows
+                else:
+                    self._retry_json = True
+
+    def _start_write(self):
+        self._inflight = asyncio.get_running_loop().run_in_executor(None, self._write, self._snapshot())
+        return self._inflight
+
+    async def flush(self):
+        """Записывает накопленные изменения (дожидается идущей записи)."""
+        # пока ждали, increment() мог запустить следующую запись
+        while self._inflight is not None and not self._inflight.done():
+            await self._inflight
+        if self._changes or self._retry_rows or self._retry_json:
+            await self._start_write()
+
+    async def run(self, interval: float = FLUSH_INTERVAL):
+        """Плановая запись раз в interval секунд (фоновая задача из main.py)."""
+        while True:
+            await asyncio.sleep(interval)
+            await self.flush()
+
+
+message_counters = MessageCounters(message_stats)
@@ -0,0 +1,621 @@
+"""Лог сообщений чатов: шард на чат + почасовой индекс к каждому шарду.
+
+Формат записи и её разбор — core.log_record.
+Текст может содержать переводы строк — тогда запись занимает несколько строк
+файла, продолжения начинаются НЕ с метки времени.
+
+Раскладка на диске: MESSAGES_DIR/<chat_id>/messages.log — append-only шард чата,
+рядом messages.log.idx — строка "YYYY-MM-DDTHH <offset>" на каждый новый час,
+offset — байтовое смещение первой записи этого часа. Чтение истории чата стоит
+пропорционально объёму этого чата, окна по времени читаются seek'ом к нужному часу.
+
+Производные индексы (поиск по истории, лексикон и т.п.) подписываются на запись
+через MessageLog.subscribe и получают разобранную запись сразу после append.
+
+Сегменты: messages.log — активный сегмент. При смене месяца (или когда он
+перерастает SEGMENT_MAX_BYTES) он закрывается в archive/<время первой записи>.log
+и в фоне сжимается gzip'ом; manifest.json чата хранит для каждого архивного
+сегмента диапазон времени, число записей и исходный размер. Читатели пропускают
+сегменты вне окна since/until и распаковывают нужные потоково.
+
+Старый общий user_messages.log один раз раскладывается по шардам
+(MessageLog.migrate_legacy), затем прошлые месяцы уходят в архив
+(MessageLog.archive_old) — оба вызываются из main.py до старта polling.
+"""
+import asyncio
+import bisect
+import gzip
+import itertools
+import json
+import logging
+import os
+import shutil
+import threading
+from collections import defaultdict, deque
+from datetime import datetime
+
+import aiofiles
+
+from core.log_record import (
+    RECORD_CHAT_RE, RECORD_START_RE, TIMESTAMP_KEY_LEN, chat_marker, parse_log_record, timestamp_key,
+)
+from core.state import LOG_FILE, MESSAGES_DIR
+
+HOUR_KEY_LEN = 13  # "YYYY-MM-DDTHH"
+
+SHARD_FILE = "messages.log"
+ARCHIVE_DIR = "archive"
+MANIFEST_FILE = "manifest.json"
+SEGMENT_MAX_BYTES = 64 * 1024 * 1024  # активный сегмент больше этого закрывается досрочно
+MONTH_KEY_LEN = 7                     # "YYYY-MM"
+MIGRATED_MARKER = ".migrated"
+MIGRATION_BUFFER_BYTES = 64 * 1024 * 1024
+REVERSE_BLOCK_BYTES = 64 * 1024  # блок чтения файла с конца
+REVERSE_SEGMENT_WINDOW = 256     # записей архивного сегмента за первый проход с конца
+
+def iter_raw_records(f):
+    """Склеивает строки бинарного файла в записи: (offset, bytes записи)."""
+    pos = f.tell()
+    start = None
+    chunks = []
+    for line in f:
+        if RECORD_START_RE.match(line):
+            if start is not None:
+                yield start, b"".join(chunks)
+            start = pos
+            chunks = [line]
+        elif start is not None:
+            chunks.append(line)
+        pos += len(line)
+    if start is not None:
+        yield start, b"".join(chunks)
+
+
+def iter_raw_records_reverse(f, start: int = 0, block_size: int = REVERSE_BLOCK_BYTES):
+    """То же, что iter_raw_records, но от конца файла к началу (не раньше start).
+
+    Файл читается блоками с конца, так что N последних записей стоят O(N), а не O(файла).
+    """
+    f.seek(0, os.SEEK_END)
+    pos = f.tell()
+    tail = b""          # начало строки, которая началась в ещё не прочитанном блоке
+    continuation = []   # строки-продолжения текущей записи, от последней к первой
+    while pos > start:
+        size = min(block_size, pos - start)
+        pos -= size
+        f.seek(pos)
+        lines = (f.read(size) + tail).splitlines(keepends=True)
+        line_end = pos + sum(len(line) for line in lines)
+        # первая строка блока может быть неполной — доклеится к следующему блоку
+        tail = lines.pop(0) if pos > start and lines else b""
+        for line in reversed(lines):
+            line_end -= len(line)
+            if RECORD_START_RE.match(line):
+                yield line_end, line + b"".join(reversed(continuation))
+                continuation = []
+            else:
+                continuation.append(line)
+
+
+def filter_records(raw_records, chat_id: str | None, since: datetime | None = None,
+                   until: datetime | None = None, reverse: bool = False):
+    """Разбирает сырые записи чата chat_id (None — всех) в окне [since, until].
+
+    raw_records идут по времени (reverse=True — от новых к старым), так что за
+    границей окна чтение прекращается.
+    """
+    marker = chat_marker(chat_id)
+    since_key = timestamp_key(since) if since is not None else None
+    until_key = timestamp_key(until) if until is not None else None
+    for _offset, raw in raw_records:
+        # дешёвые проверки по байтам до разбора записи
+        if marker not in raw:
+            continue
+        key = raw[:TIMESTAMP_KEY_LEN]
+        if since_key is not None and key < since_key:
+            if reverse:
+                break
+            continue
+        if until_key is not None and key > until_key:
+            if reverse:
+                continue
+            break
+        record = parse_log_record(raw)
+        if not record or (chat_id and record.chat_id != chat_id):
+            continue
+        if since is not None and record.timestamp < since:
+            if reverse:
+                break
+            continue
+        if until is not None and record.timestamp > until:
+            if reverse:
+                continue
+            break
+        yield record
+
+
+def hour_key(dt: datetime) -> str:
+    return dt.strftime("%Y-%m-%dT%H")
+
+
+class HourIndex:
+    """Час -> смещение первой записи часа в лог-файле.
+
+    Потокобезопасен: пишет event loop (note_append), читают потоки
+    из asyncio.to_thread.
+    """
+
+    def __init__(self, log_path: str):
+        self.log_path = log_path
+        self.index_path = log_path + ".idx"
+        self._keys: list[str] = []
+        self._offsets: list[int] = []
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    # --- построение ---
+
+    def load(self):
+        """Читает сайдкар и догоняет записи, дописанные в обход индекса."""
+        with self._lock:
+            if self._loaded:
+                return
+            self._read_sidecar()
+            self._catch_up()
+            self._loaded = True
+
+    def _read_sidecar(self):
+        self._keys, self._offsets = [], []
+        log_size = os.path.getsize(self.log_path) if os.path.exists(self.log_path) else 0
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) != 2:
+                        continue
+                    key, offset = parts[0], int(parts[1])
+                    if self._keys and key <= self._keys[-1]:
+                        continue
+                    self._keys.append(key)
+                    self._offsets.append(offset)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logging.warning(f"[message_log] индекс {self.index_path} битый, перестраиваю: {e}")
+            self._keys, self._offsets = [], []
+
+        if self._offsets and self._offsets[-1] > log_size:
+            # лог подменили/обрезали — индекс недействителен
+            logging.warning(f"[message_log] индекс {self.index_path} длиннее лога, перестраиваю")
+            self._keys, self._offsets = [], []
+            os.remove(self.index_path)
+
+    def _catch_up(self):
+        if not os.path.exists(self.log_path):
+            return
+        start = self._offsets[-1] if self._offsets else 0
+        new_buckets = []
+        with open(self.log_path, "rb") as f:
+            f.seek(start)
+            for offset, raw in iter_raw_records(f):
+                key = raw[:HOUR_KEY_LEN].decode("ascii", errors="replace")
+                last = new_buckets[-1][0] if new_buckets else (self._keys[-1] if self._keys else "")
+                if key > last:
+                    new_buckets.append((key, offset))
+        if new_buckets:
+            self._append_buckets(new_buckets)
+
+    def _append_buckets(self, buckets):
+        for key, offset in buckets:
+            self._keys.append(key)
+            self._offsets.append(offset)
+        try:
+            with open(self.index_path, "a", encoding="utf-8") as f:
+                f.writelines(f"{key} {offset}\n" for key, offset in buckets)
+        except OSError as e:
+            logging.error(f"[message_log] не смог дописать индекс {self.index_path}: {e}")
+
+    def note_append(self, offset: int, timestamp: datetime):
+        """Вызывается писателем после дописывания записи по смещению offset.
+
+        Пока индекс строится, не ждём лок (это event loop): пропущенный час
+        безопасен — читатель просто начнёт с предыдущего часа.
+        """
+        if not self._loaded:
+            return
+        with self._lock:
+            key = hour_key(timestamp)
+            if not self._keys or key > self._keys[-1]:
+                self._append_buckets([(key, offset)])
+
+    # --- чтение ---
+
+    def offset_for(self, since: datetime) -> int:
+        """Смещение, с которого гарантированно начинаются записи не раньше since."""
+        self.load()
+        with self._lock:
+            pos = bisect.bisect_right(self._keys, hour_key(since)) - 1
+            return self._offsets[pos] if pos >= 0 else 0
+
+    def iter_window(self, chat_id, since: datetime | None = None, until: datetime | None = None,
+                    reverse: bool = False):
+        """Записи чата chat_id (None — всех чатов) с since <= timestamp <= until
+        в хронологическом порядке, reverse=True — от новых к старым."""
+        chat_id = str(chat_id) if chat_id is not None else None
+        try:
+            f = open(self.log_path, "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            start = self.offset_for(since) if since is not None else 0
+            if reverse:
+                raw_records = iter_raw_records_reverse(f, start)
+            else:
+                f.seek(start)
+                raw_records = iter_raw_records(f)
+            yield from filter_records(raw_records, chat_id, since, until, reverse)
+
+
+_indexes: dict[str, HourIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(log_path: str) -> HourIndex:
+    """Один HourIndex на файл лога."""
+    with _indexes_lock:
+        index = _indexes.get(log_path)
+        if index is None:
+            index = _indexes[log_path] = HourIndex(log_path)
+        return index
+
+
+def drop_index(log_path: str):
+    """Забывает индекс файла (файл закрыт в архив или подменён) и удаляет его сайдкар."""
+    with _indexes_lock:
+        _indexes.pop(log_path, None)
+    try:
+        os.remove(log_path + ".idx")
+    except FileNotFoundError:
+        pass
+
+
+def _segment_name(first_raw: bytes) -> str:
+    """Имя архивного сегмента по времени первой записи: сортировка имён = хронология."""
+    ts = first_raw[:TIMESTAMP_KEY_LEN].decode("ascii", errors="replace")
+    return ts.replace(":", "-") + ".log"
+
+
+def _open_segment(path: str):
+    """Архивный сегмент для чтения: .gz распаковывается потоково."""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    try:
+        return open(path, "rb")
+    except FileNotFoundError:
+        # пока читали список, сегмент успели сжать
+        return gzip.open(path + ".gz", "rb")
+
+
+class MessageLog:
+    """Пошардовое хранилище сообщений: один append-only файл на чат.
+
+    Пишет только event loop (append), читают потоки (iter_chat через
+    asyncio.to_thread) — итераторы блокирующие.
+    """
+
+    def __init__(self, root: str = MESSAGES_DIR):
+        self.root = root
+        self._write_lock = asyncio.Lock()
+        self._listeners = []
+        self._active_month: dict[str, str] = {}  # чат -> месяц первой записи активного сегмента
+        self._manifest_lock = threading.Lock()
+
+    def subscribe(self, callback):
+        """callback(record) вызывается в event loop после каждой записи — должен быть дешёвым."""
+        self._listeners.append(callback)
+
+    def shard_path(self, chat_id) -> str:
+        return os.path.join(self.root, str(chat_id), SHARD_FILE)
+
+    def chat_ids(self) -> list[str]:
+        """Все чаты, по которым есть шард."""
+        try:
+            return [
+                name for name in os.listdir(self.root)
+                if os.path.isfile(os.path.join(self.root, name, SHARD_FILE))
+            ]
+        except FileNotFoundError:
+            return []
+
+    def archive_dir(self, chat_id) -> str:
+        return os.path.join(self.root, str(chat_id), ARCHIVE_DIR)
+
+    async def append(self, chat_id, timestamp: datetime, line: str):
+        """Дописывает готовую строку лога в шард чата (при необходимости закрыв сегмент)."""
+        path = self.shard_path(chat_id)
+        # лок: смещение для почасового индекса должно совпасть с реальным местом записи
+        async with self._write_lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            closed = self._maybe_roll(str(chat_id), timestamp.strftime("%Y-%m"))
+            if closed:
+                asyncio.get_running_loop().run_in_executor(None, self.compress_segment, chat_id, closed)
+            async with aiofiles.open(path, mode="ab") as f:
+                offset = await f.tell()
+                await f.write(line.encode("utf-8"))
+            get_index(path).note_append(offset, timestamp)
+
+        if self._listeners:
+            record = parse_log_record(line)
+            if record:
+                for callback in self._listeners:
+                    try:
+                        callback(record)
+                    except Exception as e:
+                        logging.error(f"[message_log] подписчик {callback!r} упал: {e}", exc_info=True)
+
+    def iter_chat(self, chat_id, since: datetime | None = None, reverse: bool = False,
+                  until: datetime | None = None):
+        """Сообщения чата (LogRecord) в хронологическом порядке,
+        reverse=True — от новых к старым (активный сегмент читается с конца лениво).
+
+        Архивные сегменты вне окна [since, until] не открываются.
+        """
+        chat_id = str(chat_id)
+        segments = self._segments_for(chat_id, since, until)
+        active = get_index(self.shard_path(chat_id))
+        if reverse:
+            yield from active.iter_window(chat_id, since, until, reverse=True)
+            for path in reversed(segments):
+                yield from self._iter_segment_reverse(path, chat_id, since, until)
+        else:
+            for path in segments:
+                yield from self._iter_segment(path, chat_id, since, until)
+            yield from active.iter_window(chat_id, since, until)
+
+    # --- сегменты и архив ---
+
+    def read_manifest(self, chat_id) -> list[dict]:
+        """Архивные сегменты чата: [{file, start, end, records, bytes}] по времени."""
+        path = os.path.join(self.root, str(chat_id), MANIFEST_FILE)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError) as e:
+            logging.error(f"[message_log] битый манифест {path}: {e}")
+            return []
+
+    def _add_to_manifest(self, chat_id, entry: dict):
+        with self._manifest_lock:
+            entries = [e for e in self.read_manifest(chat_id) if e["file"] != entry["file"]]
+            entries.append(entry)
+            entries.sort(key=lambda e: e["file"])
+            path = os.path.join(self.root, str(chat_id), MANIFEST_FILE)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entries, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, path)
+
+    def _segments_for(self, chat_id: str, since: datetime | None, until: datetime | None) -> list[str]:
+        """Пути архивных сегментов, которые могут пересекаться с окном, по времени.
+
+        Несжатые сегменты (закрыты, но ещё не в манифесте) берутся всегда.
+        """
+        since_key = since.isoformat()[:TIMESTAMP_KEY_LEN] if since is not None else None
+        until_key = until.isoformat()[:TIMESTAMP_KEY_LEN] if until is not None else None
+        archive = self.archive_dir(chat_id)
+        paths = {}
+        for entry in self.read_manifest(chat_id):
+            if since_key is not None and entry["end"][:TIMESTAMP_KEY_LEN] < since_key:
+                continue
+            if until_key is not None and entry["start"][:TIMESTAMP_KEY_LEN] > until_key:
+                continue
+            paths[entry["file"]] = os.path.join(archive, entry["file"])
+        try:
+            pending = [name for name in os.listdir(archive) if name.endswith(".log")]
+        except FileNotFoundError:
+            pending = []
+        compressed = {e["file"] for e in self.read_manifest(chat_id)} if pending else set()
+        for name in pending:
+            if name + ".gz" not in compressed:
+                paths[name] = os.path.join(archive, name)
+        return [paths[name] for name in sorted(paths)]
+
+    @staticmethod
+    def _iter_segment(path: str, chat_id: str, since: datetime | None, until: datetime | None):
+        try:
+            f = _open_segment(path)
+        except FileNotFoundError:
+            return
+        with f:
+            yield from filter_records(iter_raw_records(f), chat_id, since, until)
+
+    def _iter_segment_reverse(self, path: str, chat_id: str, since: datetime | None, until: datetime | None):
+        """Сегмент от новых записей к старым без распаковки месяца в память.
+
+        gzip читается только вперёд: проход держит окно последних записей до уже
+        отданных, следующий (если читателю мало) — вдвое большее окно перед ними и
+        обрывает распаковку на границе. Память растёт с тем, сколько прочитано.
+        """
+        end = None   # записи с номера end уже отданы; None — ещё ни одной
+        window = REVERSE_SEGMENT_WINDOW
+        while end is None or end > 0:
+            tail = deque(maxlen=window)
+            count = 0
+            for record in itertools.islice(self._iter_segment(path, chat_id, since, until), end):
+                tail.append(record)
+                count += 1
+            yield from reversed(tail)
+            end = count - len(tail)
+            window *= 2
+
+    def _maybe_roll(self, chat_id: str, month: str) -> str | None:
+        """Закрывает активный сегмент, если начался новый месяц или он перерос лимит.
+
+        Вызывается под _write_lock. Возвращает путь закрытого (ещё несжатого) сегмента.
+        """
+        path = self.shard_path(chat_id)
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            self._active_month[chat_id] = month
+            return None
+        if size == 0:
+            return None
+        active_month = self._active_month.get(chat_id)
+        if active_month is None:
+            with open(path, "rb") as f:
+                active_month = f.read(MONTH_KEY_LEN).decode("ascii", errors="replace")
+            self._active_month[chat_id] = active_month
+        if month == active_month and size < SEGMENT_MAX_BYTES:
+            return None
+
+        with open(path, "rb") as f:
+            name = _segment_name(f.read(TIMESTAMP_KEY_LEN))
+        archive = self.archive_dir(chat_id)
+        os.makedirs(archive, exist_ok=True)
+        closed = os.path.join(archive, name)
+        os.replace(path, closed)
+        drop_index(path)
+        self._active_month[chat_id] = month
+        return closed
+
+    def compress_segment(self, chat_id, raw_path: str):
+        """Сжимает закрытый сегмент в .gz и вносит его в манифест (блокирующий)."""
+        try:
+            start = end = None
+            records = 0
+            gz_path = raw_path + ".gz"
+            with open(raw_path, "rb") as src, gzip.open(gz_path + ".tmp", "wb") as dst:
+                for _offset, raw in iter_raw_records(src):
+                    ts = raw.split(b" ", 1)[0].decode("ascii", errors="replace")
+                    start = start or ts
+                    end = ts
+                    records += 1
+                    dst.write(raw)
+            os.replace(gz_path + ".tmp", gz_path)
+            self._add_to_manifest(chat_id, {
+                "file": os.path.basename(gz_path),
+                "start": start or "",
+                "end": end or "",
+                "records": records,
+                "bytes": os.path.getsize(raw_path),
+            })
+            os.remove(raw_path)
+        except Exception as e:
+            logging.error(f"[message_log] не смог сжать сегмент {raw_path}: {e}", exc_info=True)
+
+    def archive_old(self) -> int:
+        """Приборка при старте: прошлые месяцы активных сегментов уходят в архив,
+        недожатые сегменты дожимаются. Только до старта polling (append не идут).
+        Возвращает число новых архивных сегментов.
+        """
+        created = 0
+        for chat_id in self.chat_ids():
+            archive = self.archive_dir(chat_id)
+            path = self.shard_path(chat_id)
+            with open(path, "rb") as f:
+                newest = next(iter_raw_records_reverse(f), None)
+            if newest is not None:
+                last_month = newest[1][:MONTH_KEY_LEN]
+                tmp_path = path + ".tmp"
+                closed = []
+                out = None
+                out_month = None
+                with open(path, "rb") as src, open(tmp_path, "wb") as active:
+                    for _offset, raw in iter_raw_records(src):
+                        month = raw[:MONTH_KEY_LEN]
+                        if month >= last_month:
+                            active.write(raw)
+                            continue
+                        if month != out_month:
+                            if out:
+                                out.close()
+                            os.makedirs(archive, exist_ok=True)
+                            closed.append(os.path.join(archive, _segment_name(raw)))
+                            out = open(closed[-1], "wb")
+                            out_month = month
+                        out.write(raw)
+                    if out:
+                        out.close()
+                if closed:
+                    os.replace(tmp_path, path)
+                    drop_index(path)
+                    created += len(closed)
+                else:
+                    os.remove(tmp_path)
+            try:
+                pending = sorted(name for name in os.listdir(archive) if name.endswith(".log"))
+            except FileNotFoundError:
+                pending = []
+            for name in pending:
+                self.compress_segment(chat_id, os.path.join(archive, name))
+        self._active_month.clear()
+        if created:
+            logging.info(f"[message_log] в архив ушло сегментов: {created}")
+        return created
+
+    # --- миграция со старого общего лога ---
+
+    def migrate_legacy(self, legacy_path: str = LOG_FILE) -> int:
+        """Раскладывает общий user_messages.log по шардам. Идемпотентна.
+
+        Пишет во временную папку и подменяет root целиком, так что падение
+        посередине ничего не портит. Сообщения, успевшие попасть в шарды до
+        миграции, дописываются после старых. Возвращает число перенесённых записей.
+        """
+        if os.path.exists(os.path.join(self.root, MIGRATED_MARKER)):
+            return 0
+
+        tmp_root = self.root + ".migrating"
+        shutil.rmtree(tmp_root, ignore_errors=True)
+        os.makedirs(tmp_root)
+
+        migrated = 0
+        buffers: dict[str, list[bytes]] = defaultdict(list)
+        buffered = 0
+
+        def flush():
+            for chat_id, chunks in buffers.items():
+                shard = os.path.join(tmp_root, chat_id, SHARD_FILE)
+                os.makedirs(os.path.dirname(shard), exist_ok=True)
+                with open(shard, "ab") as out:
+                    out.writelines(chunks)
+            buffers.clear()
+
+        if os.path.exists(legacy_path):
+            with open(legacy_path, "rb") as f:
+                for _offset, raw in iter_raw_records(f):
+                    match = RECORD_CHAT_RE.match(raw)
+                    if not match:
+                        continue  # BROADCAST и прочие служебные строки
+                    if not raw.endswith(b"\n"):
+                        raw += b"\n"
+                    buffers[match.group(1).decode("utf-8", errors="replace")].append(raw)
+                    migrated += 1
+                    buffered += len(raw)
+                    if buffered >= MIGRATION_BUFFER_BYTES:
+                        flush()
+                        buffered = 0
+            flush()
+
+        for chat_id in self.chat_ids():
+            with open(self.shard_path(chat_id), "rb") as src:
+                shard = os.path.join(tmp_root, chat_id, SHARD_FILE)
+                os.makedirs(os.path.dirname(shard), exist_ok=True)
+                with open(shard, "ab") as out:
+                    shutil.copyfileobj(src, out)
+
+        with open(os.path.join(tmp_root, MIGRATED_MARKER), "w", encoding="utf-8") as f:
+            f.write(f"{datetime.now().isoformat()} {legacy_path} {migrated}\n")
+
+        shutil.rmtree(self.root, ignore_errors=True)
+        os.rename(tmp_root, self.root)
+        with _indexes_lock:
+            _indexes.clear()
+        logging.info(f"[message_log] {legacy_path} разложен по шардам: {migrated} записей")
+        return migrated
+
+
+message_log = MessageLog()
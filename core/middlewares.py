@@ -8,6 +8,7 @@ from aiogram import BaseMiddleware
 from aiogram.enums import ContentType
 from aiogram.types import Message
 
+from core.display_names import display_names
 from features.statistics import log_message # Импортируем вашу функцию логирования
 
 class StatisticsMiddleware(BaseMiddleware):
@@ -61,6 +62,8 @@ class IncomingMessageLogMiddleware(BaseMiddleware):
         data: Dict[str, Any],
     ) -> Any:
         if isinstance(event, Message) and event.from_user:
+            # имя для отчётов — без отдельного запроса к Telegram
+            display_names.note_user(event.from_user)
             message_text = event.text or event.caption
             safe_text = "<без текста>"
             if message_text:
@@ -0,0 +1,187 @@
+"""Здоровье пар модель/ключ: куда слать запрос, а куда пока не стоит.
+
+Раньше фоллбэк Gemini на каждый запрос заново обходил всю матрицу модель × ключ
+и долбил каждую пару повторами с паузами — даже ту, что секунду назад
+вернула 429. Теперь общая таблица помнит по каждой паре (провайдер, модель,
+индекс ключа):
+  - остывание: после 429/квоты пара пропускается до истечения срока —
+    подсказка сервера (Retry-After, RetryInfo.retryDelay, "retry in 37s"),
+    а без неё QUOTA_COOLDOWN с удвоением подряд до MAX_COOLDOWN; суточная
+    квота — не меньше DAILY_COOLDOWN; 503 (перегрузка) — OVERLOAD_COOLDOWN;
+  - долю успехов (EWMA) и задержку успешных попыток (EWMA). Провалы со
+    временем забываются: штраф вдвое меньше каждые RECOVERY_HALF_LIFE секунд,
+    иначе однажды сбойнувшая пара не получила бы запросов, чтобы исправиться.
+
+rank() отдаёт готовые пары, самые здоровые первыми (при равном здоровье —
+в порядке очереди моделей); пустой список — все пары остывают, и вызов
+падает сразу, без пауз. Админ-команда "телеметрия" показывает таблицу.
+"""
+import re
+import threading
+import time
+
+QUOTA_COOLDOWN = 30.0          # 429 без подсказки: первая пауза, с
+MAX_COOLDOWN = 15 * 60.0       # потолок удвоения
+DAILY_COOLDOWN = 60 * 60.0     # исчерпана суточная квота
+OVERLOAD_COOLDOWN = 10.0       # 503: модель перегружена
+EWMA_ALPHA = 0.2
+RECOVERY_HALF_LIFE = 600.0
+HEALTH_STEP = 0.1              # здоровье сравнивается с этим шагом, внутри шага — порядок очереди
+
+_RETRY_DELAY_RE = re.compile(r"retryDelay['\"]?\s*[:=]\s*['\"]?(\d+(?:\.\d+)?)s", re.IGNORECASE)
+_RETRY_IN_RE = re.compile(r"retry in (\d+(?:\.\d+)?)\s*(ms|s)", re.IGNORECASE)
+
+
+def retry_after_hint(error: Exception) -> float | None:
+    """Сколько секунд сервер просит подождать: заголовок Retry-After или текст ошибки."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers:
+        try:
+            value = headers.get("retry-after") or headers.get("Retry-After")
+            if value is not None:
+                return max(float(value), 0.0)
+        except (TypeError, ValueError, AttributeError):
+            pass
+    text = f"{getattr(error, 'details', '') or ''} {error}"
+    match = _RETRY_DELAY_RE.search(text)
+    if match:
+        return float(match.group(1))
+    match = _RETRY_IN_RE.search(text)
+    if match:
+        seconds = float(match.group(1))
+        return seconds / 1000 if match.group(2).lower() == "ms" else seconds
+    return None
+
+
+class PairHealth:
+    __slots__ = ("successes", "failures", "success_ewma", "latency_ewma", "updated",
+                 "cooldown_until", "strikes", "last_error")
+
+    def __init__(self, now: float):
+        self.successes = 0
+        self.failures = 0
+        self.success_ewma = 1.0
+        self.latency_ewma: float | None = None
+        self.updated = now
+        self.cooldown_until = 0.0
+        self.strikes = 0          # 429 подряд — для удвоения остывания
+        self.last_error = ""
+
+    def health(self, now: float) -> float:
+        penalty = (1.0 - self.success_ewma) * 0.5 ** ((now - self.updated) / RECOVERY_HALF_LIFE)
+        return 1.0 - penalty
+
+    def _observe(self, ok: bool, now: float):
+        self.success_ewma = (1 - EWMA_ALPHA) * self.health(now) + EWMA_ALPHA * (1.0 if ok else 0.0)
+        self.updated = now
+
+
+class ModelHealth:
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._pairs: dict[tuple[str, str, int], PairHealth] = {}
+
+    def _pair(self, provider: str, model: str, key_idx) -> PairHealth:
+        key = (provider, model or "", -1 if key_idx is None else int(key_idx))
+        pair = self._pairs.get(key)
+        if pair is None:
+            pair = self._pairs[key] = PairHealth(self.clock())
+        return pair
+
+    def record_success(self, provider: str, model: str, key_idx, latency_s: float):
+        with self._lock:
+            now = self.clock()
+            pair = self._pair(provider, model, key_idx)
+            pair.successes += 1
+            pair.strikes = 0
+            pair.cooldown_until = 0.0
+            pair._observe(True, now)
+            pair.latency_ewma = latency_s if pair.latency_ewma is None else (
+                pair.latency_ewma + EWMA_ALPHA * (latency_s - pair.latency_ewma)
+            )
+
+    def record_failure(self, provider: str, model: str, key_idx, *, quota: bool = False,
+                       overload: bool = False, retry_after: float | None = None,
+                       daily: bool = False, error: str = "") -> float:
+        """Неудачная попытка. Возвращает назначенное остывание, с (0 — пара остаётся в ротации)."""
+        with self._lock:
+            now = self.clock()
+            pair = self._pair(provider, model, key_idx)
+            pair.failures += 1
+            pair.last_error = error
+            pair._observe(False, now)
+            cooldown = 0.0
+            if quota:
+                pair.strikes += 1
+                cooldown = retry_after if retry_after is not None else min(
+                    QUOTA_COOLDOWN * 2 ** (pair.strikes - 1), MAX_COOLDOWN
+                )
+                if daily:
+                    cooldown = max(cooldown, DAILY_COOLDOWN)
+            elif overload:
+                cooldown = retry_after if retry_after is not None else OVERLOAD_COOLDOWN
+            if cooldown > 0:
+                pair.cooldown_until = max(pair.cooldown_until, now + cooldown)
+            return cooldown
+
+    def cooldown_left(self, provider: str, model: str, key_idx) -> float:
+        with self._lock:
+            pair = self._pairs.get((provider, model or "", -1 if key_idx is None else int(key_idx)))
+            return max(pair.cooldown_until - self.clock(), 0.0) if pair else 0.0
+
+    def rank(self, provider: str, pairs: list[tuple[str, int]]) -> list[tuple[str, int]]:
+        """Готовые пары (модель, индекс ключа): остывающие отброшены, здоровые — первыми."""
+        with self._lock:
+            now = self.clock()
+            ready = []
+            for position, (model, key_idx) in enumerate(pairs):
+                pair = self._pairs.get((provider, model or "", int(key_idx)))
+                if pair is None:
+                    ready.append((0, position, (model, key_idx)))
+                    continue
+                if pair.cooldown_until > now:
+                    continue
+                ready.append((round((1.0 - pair.health(now)) / HEALTH_STEP), position, (model, key_idx)))
+        ready.sort()
+        return [item for _bucket, _position, item in ready]
+
+    def snapshot(self) -> list[dict]:
+        with self._lock:
+            now = self.clock()
+            return [
+                {
+                    "provider": provider, "model": model, "key_idx": key_idx,
+                    "successes": pair.successes, "failures": pair.failures,
+                    "health": pair.health(now), "latency_s": pair.latency_ewma,
+                    "cooldown_s": max(pair.cooldown_until - now, 0.0), "last_error": pair.last_error,
+                }
+                for (provider, model, key_idx), pair in self._pairs.items()
+            ]
+
+    def reset(self):
+        with self._lock:
+            self._pairs.clear()
+
+
+def format_report(rows: list[dict]) -> str:
+    """Текст для админ-команды "телеметрия" (после телеметрии)."""
+    if not rows:
+        return ""
+    lines = ["🩺 Здоровье пар модель/ключ:"]
+    for row in sorted(rows, key=lambda r: (r["provider"], r["model"], r["key_idx"])):
+        key = f" key#{row['key_idx']}" if row["key_idx"] >= 0 else ""
+        line = (
+            f"{row['provider']} {row['model']}{key}: {row['health']:.0%}, "
+            f"{row['successes']} ок / {row['failures']} fail"
+        )
+        if row["latency_s"] is not None:
+            line += f", ~{row['latency_s']:.1f}с"
+        if row["cooldown_s"] > 0:
+            line += f", остывает ещё {row['cooldown_s']:.0f}с ({row['last_error']})"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+model_health = ModelHealth()
@@ -0,0 +1,245 @@
+"""Телеметрия вызовов моделей: где на самом деле уходит время ответа.
+
+Обёртки (AI.wrapper, AI.gigachat_client) сообщают сюда о каждой попытке и о
+каждом вызове целиком. Ключ — (провайдер, модель, индекс ключа API; -1 — ключ
+один или неизвестен):
+  - попытка: длительность, успех или тип ошибки;
+  - вызов: полное время (с фоллбэками и паузами между повторами), число
+    попыток, глубина фоллбэка (сколько пар модель/ключ сменили до успеха),
+    суммарные паузы, размеры запроса и ответа в символах, токены (если
+    провайдер их вернул).
+
+Окно копится в памяти; run() раз в WINDOW_SECONDS закрывает его, пишет строки
+в statistics.db (model_telemetry, через core.db_writer) и хранит последние
+KEEP_WINDOWS окон для админ-команды "телеметрия".
+"""
+import asyncio
+import bisect
+import json
+import threading
+import time
+from collections import Counter, deque
+
+from core.db_writer import stats_writer
+
+WINDOW_SECONDS = 60
+KEEP_WINDOWS = 60     # в памяти — последний час
+# Верхние границы корзин гистограмм, мс (последняя — всё, что дольше)
+LATENCY_BOUNDS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 20000, 40000, 80000)
+
+
+class Histogram:
+    """Гистограмма длительностей с фиксированными корзинами: сложение и квантили."""
+    __slots__ = ("buckets", "count", "total_ms")
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BOUNDS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+
+    def add(self, ms: float):
+        self.buckets[bisect.bisect_left(LATENCY_BOUNDS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+
+    def merge(self, other: "Histogram"):
+        for i, n in enumerate(other.buckets):
+            self.buckets[i] += n
+        self.count += other.count
+        self.total_ms += other.total_ms
+
+    def quantile(self, q: float) -> float | None:
+        """Верхняя граница корзины, в которую попал q-квантиль (мс)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank and n:
+                return LATENCY_BOUNDS_MS[i] if i < len(LATENCY_BOUNDS_MS) else float("inf")
+        return float("inf")
+
+
+class KeyStats:
+    """Счётчики одного ключа (провайдер, модель, индекс ключа) за окно."""
+    __slots__ = ("attempts", "attempt_latency", "failures", "calls", "failed_calls", "call_latency",
+                 "attempts_per_call", "fallback_depth", "retry_sleep_ms", "prompt_chars",
+                 "response_chars", "prompt_tokens", "completion_tokens")
+
+    def __init__(self):
+        self.attempts = 0
+        self.attempt_latency = Histogram()
+        self.failures = Counter()
+        self.calls = 0
+        self.failed_calls = 0
+        self.call_latency = Histogram()
+        self.attempts_per_call = 0
+        self.fallback_depth = 0
+        self.retry_sleep_ms = 0.0
+        self.prompt_chars = 0
+        self.response_chars = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def merge(self, other: "KeyStats"):
+        for name in self.__slots__:
+            mine, theirs = getattr(self, name), getattr(other, name)
+            if isinstance(mine, Histogram):
+                mine.merge(theirs)
+            elif isinstance(mine, Counter):
+                mine.update(theirs)
+            else:
+                setattr(self, name, mine + theirs)
+
+    def to_row(self) -> dict:
+        return {
+            "attempts": self.attempts,
+            "attempt_latency": self.attempt_latency.buckets,
+            "failures": dict(self.failures),
+            "calls": self.calls,
+            "failed_calls": self.failed_calls,
+            "call_latency": self.call_latency.buckets,
+            "call_latency_total_ms": round(self.call_latency.total_ms, 1),
+            "attempts_per_call": self.attempts_per_call,
+            "fallback_depth": self.fallback_depth,
+            "retry_sleep_ms": round(self.retry_sleep_ms, 1),
+            "prompt_chars": self.prompt_chars,
+            "response_chars": self.response_chars,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+        }
+
+
+def content_chars(content) -> int:
+    """Сколько символов текста в запросе (строка, список частей, словари с "text"/"parts")."""
+    if isinstance(content, str):
+        return len(content)
+    if isinstance(content, (list, tuple)):
+        return sum(content_chars(item) for item in content)
+    if isinstance(content, dict):
+        return content_chars(content.get("text") or content.get("parts") or content.get("content") or "")
+    text = getattr(content, "text", None)
+    return len(text) if isinstance(text, str) else 0
+
+
+class ModelTelemetry:
+    def __init__(self, writer=stats_writer, keep_windows: int = KEEP_WINDOWS):
+        self.writer = writer
+        self._lock = threading.Lock()
+        self._window: dict[tuple[str, str, int], KeyStats] = {}
+        self._window_start = time.time()
+        self._history: deque[tuple[float, dict]] = deque(maxlen=keep_windows)
+
+    def _stats(self, provider: str, model: str, key_idx) -> KeyStats:
+        key = (provider, model or "", -1 if key_idx is None else int(key_idx))
+        stats = self._window.get(key)
+        if stats is None:
+            stats = self._window[key] = KeyStats()
+        return stats
+
+    def record_attempt(self, provider: str, model: str, key_idx, latency_s: float, error: str | None = None):
+        """Одна попытка запроса к паре модель/ключ. error — тип ошибки или None при успехе."""
+        with self._lock:
+            stats = self._stats(provider, model, key_idx)
+            stats.attempts += 1
+            stats.attempt_latency.add(latency_s * 1000)
+            if error:
+                stats.failures[error] += 1
+
+    def record_call(self, provider: str, model: str, key_idx, latency_s: float, *, ok: bool = True,
+                    attempts: int = 1, fallback_depth: int = 0, retry_sleep_s: float = 0.0,
+                    prompt_chars: int = 0, response_chars: int = 0,
+                    prompt_tokens: int | None = None, completion_tokens: int | None = None):
+        """Вызов целиком. При неудаче model — последняя опробованная модель."""
+        with self._lock:
+            stats = self._stats(provider, model, key_idx)
+            if ok:
+                stats.calls += 1
+            else:
+                stats.failed_calls += 1
+            stats.call_latency.add(latency_s * 1000)
+            stats.attempts_per_call += attempts
+            stats.fallback_depth += fallback_depth
+            stats.retry_sleep_ms += retry_sleep_s * 1000
+            stats.prompt_chars += prompt_chars
+            stats.response_chars += response_chars
+            stats.prompt_tokens += prompt_tokens or 0
+            stats.completion_tokens += completion_tokens or 0
+
+    def record_single(self, provider: str, model: str, latency_s: float, error: str | None = None, **call):
+        """Провайдер без повторов и фоллбэка: одна попытка и есть вызов."""
+        self.record_attempt(provider, model, None, latency_s, error)
+        self.record_call(provider, model, None, latency_s, ok=error is None, **call)
+
+    def rotate(self) -> int:
+        """Закрывает текущее окно: в историю и в statistics.db. Возвращает число ключей."""
+        with self._lock:
+            window, self._window = self._window, {}
+            started, self._window_start = self._window_start, time.time()
+            if not window:
+                return 0
+            self._history.append((started, window))
+        window_start = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(started))
+        for (provider, model, key_idx), stats in window.items():
+            self.writer.submit(
+                "INSERT INTO model_telemetry (window_start, provider, model, key_idx, data) VALUES (?, ?, ?, ?, ?)",
+                (window_start, provider, model, key_idx, json.dumps(stats.to_row(), ensure_ascii=False)),
+            )
+        return len(window)
+
+    def snapshot(self) -> dict[tuple[str, str, int], KeyStats]:
+        """Сумма по окнам в памяти и текущему окну."""
+        total: dict[tuple[str, str, int], KeyStats] = {}
+        with self._lock:
+            windows = [window for _started, window in self._history] + [self._window]
+            for window in windows:
+                for key, stats in window.items():
+                    total.setdefault(key, KeyStats()).merge(stats)
+        return total
+
+    async def run(self, interval: float = WINDOW_SECONDS):
+        """Закрывает окна по таймеру (фоновая задача из main.py)."""
+        while True:
+            await asyncio.sleep(interval)
+            self.rotate()
+
+
+def format_report(snapshot: dict[tuple[str, str, int], KeyStats]) -> str:
+    """Текст для админ-команды "телеметрия"."""
+    if not snapshot:
+        return "📡 Телеметрия: вызовов моделей пока не было."
+
+    def ms(value):
+        if value is None:
+            return "—"
+        return "∞" if value == float("inf") else f"{value / 1000:g}с"
+
+    parts = [f"📡 Телеметрия моделей (последние {KEEP_WINDOWS} мин.)"]
+    rows = sorted(snapshot.items(), key=lambda item: item[1].call_latency.total_ms, reverse=True)
+    for (provider, model, key_idx), stats in rows:
+        key = f" key#{key_idx}" if key_idx >= 0 else ""
+        finished = stats.calls + stats.failed_calls
+        line = [f"\n{provider} {model}{key}"]
+        if finished:
+            line.append(
+                f"  вызовы: {stats.calls} ок / {stats.failed_calls} fail, "
+                f"p50 {ms(stats.call_latency.quantile(0.5))}, p95 {ms(stats.call_latency.quantile(0.95))}, "
+                f"попыток {stats.attempts_per_call / finished:.1f}, фоллбэк {stats.fallback_depth / finished:.1f}, "
+                f"паузы {stats.retry_sleep_ms / 1000:.1f}с"
+            )
+            line.append(
+                f"  символы {stats.prompt_chars // finished}→{stats.response_chars // finished}, "
+                f"токены {stats.prompt_tokens}→{stats.completion_tokens}"
+            )
+        if stats.attempts:
+            failures = ", ".join(f"{name} {count}" for name, count in stats.failures.most_common(3))
+            line.append(
+                f"  попытки: {stats.attempts}, p95 {ms(stats.attempt_latency.quantile(0.95))}"
+                + (f", ошибки: {failures}" if failures else "")
+            )
+        parts.append("\n".join(line))
+    return "\n".join(parts)
+
+
+model_telemetry = ModelTelemetry()
@@ -0,0 +1,116 @@
+"""Лимитер запросов к моделям: токен-бакеты RPM и TPM на пару ключ/модель.
+
+Раньше AI.wrapper выдерживал фиксированные 2.5 с между запросами на ключ
+(PER_KEY_MIN_DELAY) — 24 запроса в минуту на ключ независимо от модели, хотя
+квоты Google считаются по модели: у flash-lite своя минута, у gemma своя.
+
+Теперь у каждой пары (ключ, модель) два бакета из core.settings.GEMINI_RATE_LIMITS:
+  - запросы: ёмкость — BURST_SECONDS секунд квоты, пополнение rpm/60 в секунду;
+  - токены: то же для tpm. Запрос берёт оценку (символы / CHARS_PER_TOKEN);
+    после ответа settle() поправляет бакет по фактическому usage. Запрос
+    крупнее ёмкости проходит при полном бакете и уводит его в минус.
+
+Так ключ в среднем выбирает свою опубликованную квоту, а не треть её.
+
+  - wait_time() — сколько ждать до слота, ничего не занимая: фоллбэк по нему
+    сначала пробует пары без ожидания, а спит, только если свободных нет;
+  - try_acquire() — занять слот без ожидания (0.0) или узнать ожидание;
+  - acquire() / aacquire() — дождаться слота в потоке (time.sleep) или в
+    корутине (asyncio.sleep); возвращают, сколько ждали.
+"""
+import asyncio
+import threading
+import time
+
+from core.settings import GEMINI_RATE_LIMITS
+
+BURST_SECONDS = 10.0     # ёмкость бакета: столько секунд квоты можно выбрать залпом
+CHARS_PER_TOKEN = 4      # грубая оценка токенов запроса до ответа
+MAX_WAIT = 15.0          # дольше ждать слот внутри одного вызова не стоит
+DEFAULT_LIMITS = (10, 250_000)   # (rpm, tpm) для модели, которой нет в таблице
+
+
+class TokenBucket:
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+
+    def __init__(self, per_minute: float, now: float):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * BURST_SECONDS)
+        self.tokens = self.capacity
+        self.updated = now
+
+    def refill(self, now: float):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Сколько ждать, пока бакет наберёт amount (не больше ёмкости)."""
+        missing = min(amount, self.capacity) - self.tokens
+        return missing / self.rate if missing > 0 else 0.0
+
+
+def estimate_tokens(prompt_chars: int) -> int:
+    return max(1, prompt_chars // CHARS_PER_TOKEN)
+
+
+class RateLimiter:
+    def __init__(self, limits: dict[str, tuple[int, int]] | None = None,
+                 default: tuple[int, int] = DEFAULT_LIMITS, clock=time.monotonic):
+        self.limits = dict(limits or {})
+        self.default = default
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._buckets: dict[tuple[str, str], tuple[TokenBucket, TokenBucket]] = {}
+
+    def _pair(self, key: str, model: str, now: float) -> tuple[TokenBucket, TokenBucket]:
+        buckets = self._buckets.get((key, model))
+        if buckets is None:
+            rpm, tpm = self.limits.get(model, self.default)
+            buckets = self._buckets[(key, model)] = (TokenBucket(rpm, now), TokenBucket(tpm, now))
+        for bucket in buckets:
+            bucket.refill(now)
+        return buckets
+
+    def wait_time(self, key: str, model: str, tokens: int = 1) -> float:
+        """Ожидание до слота для пары, ничего не занимая."""
+        with self._lock:
+            requests, token_bucket = self._pair(key, model, self.clock())
+            return max(requests.wait_time(1), token_bucket.wait_time(tokens))
+
+    def try_acquire(self, key: str, model: str, tokens: int = 1) -> float:
+        """Занимает слот (0.0) или, не занимая, возвращает ожидание до него."""
+        with self._lock:
+            requests, token_bucket = self._pair(key, model, self.clock())
+            wait = max(requests.wait_time(1), token_bucket.wait_time(tokens))
+            if wait <= 0:
+                requests.tokens -= 1
+                token_bucket.tokens -= tokens
+            return wait
+
+    def settle(self, key: str, model: str, estimated: int, actual: int | None):
+        """Поправляет бакет токенов по фактическому расходу из ответа модели."""
+        if not actual:
+            return
+        with self._lock:
+            _requests, token_bucket = self._pair(key, model, self.clock())
+            token_bucket.tokens -= actual - estimated
+
+    def acquire(self, key: str, model: str, tokens: int = 1) -> float:
+        """Ждёт слот в потоке (time.sleep). Возвращает, сколько ждали (с)."""
+        waited = 0.0
+        while (wait := self.try_acquire(key, model, tokens)) > 0:
+            time.sleep(wait)
+            waited += wait
+        return waited
+
+    async def aacquire(self, key: str, model: str, tokens: int = 1) -> float:
+        """То же для корутин: ждёт asyncio.sleep, не занимая поток пула."""
+        waited = 0.0
+        while (wait := self.try_acquire(key, model, tokens)) > 0:
+            await asyncio.sleep(wait)
+            waited += wait
+        return waited
+
+
+rate_limiter = RateLimiter(GEMINI_RATE_LIMITS)
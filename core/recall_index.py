@@ -0,0 +1,205 @@
+"""Полнотекстовый индекс истории чатов (SQLite FTS5) для "упупа когда мы говорили про".
+
+Таблица messages хранит текст с порядковым номером сообщения в чате (seq), так что
+контекст вокруг совпадения достаётся диапазоном seq. messages_fts — FTS5-индекс
+над ней; колонка chat_key ("c<id>", минус заменён на "m") превращает поиск в
+пересечение двух постинг-листов, и запрос по одному чату не трогает остальные.
+
+Наполнение:
+  - подписка на core.message_log: новые сообщения копятся в _pending и пачкой
+    пишутся в фоне;
+  - догон при первом обращении к чату после старта: всё, что в шарде новее
+    indexed_chats.last_ts (первый раз — вся история чата). Это же чинит потерю
+    _pending при падении.
+"""
+import asyncio
+import logging
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+from core.log_record import LogRecord
+from core.message_log import message_log
+from core.state import RECALL_DB_FILE
+
+FLUSH_BATCH = 200          # сколько новых сообщений копим перед фоновой записью
+_QUERY_WORD_RE = re.compile(r"\w+")
+_PREFIX_MIN_LEN = 3        # слова от этой длины ищем по префиксу ("кино" -> кинотеатр, кином)
+_STEM_MIN_LEN = 5          # а у длинных ещё и срезаем окончание — грубая замена стеммингу
+
+
+def _chat_key(chat_id) -> str:
+    return "c" + str(chat_id).replace("-", "m")
+
+
+def build_match_query(topic: str) -> str | None:
+    """'про кино и сериалы' -> '"про"* OR "кино"* OR "и" OR "сериа"*' для FTS5 MATCH."""
+    terms = []
+    for word in _QUERY_WORD_RE.findall(topic.lower()):
+        if len(word) >= _STEM_MIN_LEN:
+            terms.append(f'"{word[:max(_STEM_MIN_LEN - 1, len(word) - 2)]}"*')
+        elif len(word) >= _PREFIX_MIN_LEN:
+            terms.append(f'"{word}"*')
+        else:
+            terms.append(f'"{word}"')
+    if not terms:
+        return None
+    return " OR ".join(dict.fromkeys(terms))
+
+
+class RecallIndex:
+    def __init__(self, db_path: str = RECALL_DB_FILE):
+        self.db_path = db_path
+        self._conn = None
+        self._lock = threading.Lock()
+        self._pending: list[LogRecord] = []
+        self._caught_up: set[str] = set()
+        self._flush_scheduled = False
+
+    # --- соединение и схема ---
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS messages (
+                    id INTEGER PRIMARY KEY,
+                    chat_id TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    ts TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    UNIQUE (chat_id, seq)
+                );
+                CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+                    chat_key, text,
+                    content='messages', content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2'
+                );
+                CREATE TABLE IF NOT EXISTS indexed_chats (
+                    chat_id TEXT PRIMARY KEY,
+                    last_ts TEXT NOT NULL,
+                    next_seq INTEGER NOT NULL
+                );
+                """
+            )
+            self._conn = conn
+        return self._conn
+
+    # --- наполнение ---
+
+    def on_message(self, record: LogRecord):
+        """Подписчик message_log: копит запись и при необходимости планирует запись пачки."""
+        if not record.text.strip():
+            return
+        self._pending.append(record)
+        if len(self._pending) >= FLUSH_BATCH and not self._flush_scheduled:
+            self._flush_scheduled = True
+            asyncio.get_running_loop().run_in_executor(None, self.flush)
+
+    def flush(self):
+        """Пишет накопленные записи чатов, которые уже догнаны. Остальные догонятся из шарда."""
+        with self._lock:
+            self._flush_scheduled = False
+            pending, self._pending = self._pending, []
+            by_chat: dict[str, list[LogRecord]] = {}
+            for record in pending:
+                if record.chat_id in self._caught_up:
+                    by_chat.setdefault(record.chat_id, []).append(record)
+            if not by_chat:
+                return
+            try:
+                conn = self._db()
+                with conn:
+                    for chat_id, records in by_chat.items():
+                        self._insert(conn, chat_id, records)
+            except Exception as e:
+                logging.error(f"[recall_index] не смог записать пачку: {e}", exc_info=True)
+
+    def _insert(self, conn: sqlite3.Connection, chat_id: str, records):
+        """Дописывает записи чата, пропуская уже проиндексированные (ts <= last_ts)."""
+        row = conn.execute(
+            "SELECT last_ts, next_seq FROM indexed_chats WHERE chat_id = ?", (chat_id,)
+        ).fetchone()
+        last_ts, next_seq = row if row else ("", 0)
+        chat_key = _chat_key(chat_id)
+        for record in records:
+            ts = record.timestamp.isoformat()
+            text = record.text.strip()
+            if ts <= last_ts or not text:
+                continue
+            name = (record.full_name or "").strip() or record.username
+            cur = conn.execute(
+                "INSERT INTO messages (chat_id, seq, ts, name, text) VALUES (?, ?, ?, ?, ?)",
+                (chat_id, next_seq, ts, name, text),
+            )
+            conn.execute(
+                "INSERT INTO messages_fts (rowid, chat_key, text) VALUES (?, ?, ?)",
+                (cur.lastrowid, chat_key, text),
+            )
+            next_seq += 1
+            last_ts = ts
+        conn.execute(
+            "INSERT INTO indexed_chats (chat_id, last_ts, next_seq) VALUES (?, ?, ?) "
+            "ON CONFLICT(chat_id) DO UPDATE SET last_ts = excluded.last_ts, next_seq = excluded.next_seq",
+            (chat_id, last_ts, next_seq),
+        )
+
+    def ensure_chat(self, chat_id):
+        """Догоняет индекс чата по его шарду (первый раз — вся история)."""
+        chat_id = str(chat_id)
+        self.flush()
+        with self._lock:
+            if chat_id in self._caught_up:
+                return
+            conn = self._db()
+            row = conn.execute(
+                "SELECT last_ts FROM indexed_chats WHERE chat_id = ?", (chat_id,)
+            ).fetchone()
+            since = datetime.fromisoformat(row[0]) if row and row[0] else None
+            with conn:
+                self._insert(conn, chat_id, message_log.iter_chat(chat_id, since=since))
+            self._caught_up.add(chat_id)
+
+    # --- чтение ---
+
+    def message_count(self, chat_id) -> int:
+        with self._lock:
+            row = self._db().execute(
+                "SELECT next_seq FROM indexed_chats WHERE chat_id = ?", (str(chat_id),)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def candidates(self, chat_id, topic: str, limit: int) -> list[tuple[int, str]]:
+        """BM25-кандидаты: [(seq, text)], лучшие первыми."""
+        match = build_match_query(topic)
+        if not match:
+            return []
+        query = f"chat_key : {_chat_key(chat_id)} AND text : ({match})"
+        with self._lock:
+            rows = self._db().execute(
+                """SELECT m.seq, m.text FROM messages_fts
+                   JOIN messages m ON m.id = messages_fts.rowid
+                   WHERE messages_fts MATCH ?
+                   ORDER BY bm25(messages_fts, 0.0, 1.0)
+                   LIMIT ?""",
+                (query, limit),
+            ).fetchall()
+        return rows
+
+    def window(self, chat_id, lo: int, hi: int) -> list[dict]:
+        """Сообщения чата с seq в [lo, hi]: [{dt, name, text}]."""
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT ts, name, text FROM messages WHERE chat_id = ? AND seq BETWEEN ? AND ? ORDER BY seq",
+                (str(chat_id), lo, hi),
+            ).fetchall()
+        return [{"dt": datetime.fromisoformat(ts), "name": name, "text": text} for ts, name, text in rows]
+
+
+recall_index = RecallIndex()
+message_log.subscribe(recall_index.on_message)
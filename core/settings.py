@@ -120,6 +120,18 @@ TTS_MODELS_QUEUE = [
     "gemini-2.5-flash-preview-tts"
 ]
 
+# Квоты на ключ (проект) и модель: (запросов в минуту, токенов в минуту).
+# По ним core.rate_limiter наполняет бакеты; модели не из списка — (10, 250_000).
+GEMINI_RATE_LIMITS = {
+    "gemini-3.1-flash-lite": (15, 250_000),
+    "gemini-2.5-flash-lite": (15, 250_000),
+    "gemini-2.5-flash": (10, 250_000),
+    "gemini-3-flash-preview": (5, 250_000),
+    "gemma-3-12b-it": (30, 15_000),
+    "gemma-3-4b-it": (30, 15_000),
+    "gemini-2.5-flash-preview-tts": (3, 10_000),
+}
+
 # --- GIGACHAT MODEL QUEUES ---
 # Wrapper идёт по списку слева направо и переключается только при ошибке.
 # Обычные чаты: экономим основной большой Lite-пул, затем усиливаем качество.
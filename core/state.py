@@ -2,22 +2,40 @@
 
 Все модули мутируют ЭТИ объекты по ссылке — не пересоздавать!
 """
-from datetime import datetime, timedelta
-
+from core.bounded import TTLDict
 from core.logging_setup import logger
 
 # =========================
 # === FILES / STATE ===
 # =========================
 CHAT_SETTINGS_FILE = "chat_settings.json"
+CHAT_SETTINGS_DB_FILE = "chat_settings.db"
+CHAT_SETTINGS_BACKEND = "json"  # где хранить настройки чатов: "json" (CHAT_SETTINGS_FILE) или "sqlite" (строка на чат)
 LOG_FILE = "user_messages.log"
+MESSAGES_DIR = "messages"  # пошардовый лог сообщений: messages/<chat_id>/messages.log
 STATS_FILE = "message_stats.json"
+STATS_DB_FILE = "message_stats.db"
+STATS_BACKEND = "json"  # где хранить счётчики рангов: "json" (STATS_FILE) или "sqlite" (STATS_DB_FILE)
 CHAT_LIST_FILE = "chats.json"
 SMS_DISABLED_CHATS_FILE = "sms_disabled_chats.json"
 DB_FILE = "statistics.db"
+RECALL_DB_FILE = "recall_index.db"  # полнотекстовый индекс для "когда мы говорили про"
+LEXICON_DB_FILE = "lexicon.db"  # счётчики слов и фраз для "лексикон"
+EMBEDDINGS_DIR = "embeddings"  # эмбеддинги сообщений для smart_search: embeddings/<chat_id>/<участник>.npz
+
+if CHAT_SETTINGS_BACKEND == "sqlite":
+    from core.chat_settings_db import SQLiteChatSettings
+    chat_settings = SQLiteChatSettings(CHAT_SETTINGS_DB_FILE)
+else:
+    chat_settings = {}
+
+CONVERSATION_HISTORY_TTL = 3 * 24 * 3600  # история диалога молчащего чата забывается через 3 дня
+CONVERSATION_HISTORY_MAX_CHATS = 2000
+conversation_history = TTLDict(
+    CONVERSATION_HISTORY_TTL, max_size=CONVERSATION_HISTORY_MAX_CHATS,
+    refresh_on_access=True, name="conversation_history",
+)
 
-chat_settings = {}
-conversation_history = {}
 message_stats = {}
 quiz_questions = {}
 quiz_states = {}
@@ -25,20 +43,14 @@ chat_list = []
 sms_disabled_chats = set()
 ANTISPAM_ENABLED_CHATS = set()
 
-serious_mode_messages = {}
+# message_id ответа бота -> диалог серьёзного режима; записи живут 24 часа
+serious_mode_messages = TTLDict(24 * 3600, name="serious_mode_messages")
 
 def cleanup_old_serious_messages():
-    """Очистка записей старше 24 часов"""
-    cutoff = datetime.now() - timedelta(hours=24)
-    to_remove = [
-        msg_id for msg_id, data in serious_mode_messages.items()
-        if isinstance(data, dict) and data.get('timestamp', datetime.now()) < cutoff
-    ]
-    for msg_id in to_remove:
-        del serious_mode_messages[msg_id]
-    
-    if to_remove:
-        logger.info(f"Очищено {len(to_remove)} старых записей серьёзного режима")
+    """Очистка записей старше 24 часов (снимаются только протухшие — без обхода всех)"""
+    removed = serious_mode_messages.expire()
+    if removed:
+        logger.info(f"Очищено {removed} старых записей серьёзного режима")
 
 MAX_HISTORY_LENGTH = 20
 DIALOG_ENABLED = True
@@ -0,0 +1,126 @@
+"""Кэш сообщений имитируемого участника для режима "промпт участник" (prompt_type == "user_style").
+
+Каждый ответ бота в этом режиме ищет похожие реплики участника (services.smart_search),
+и раньше для этого на каждом ходу перечитывался весь лог чата. Здесь корпус
+(чат, участник) читается из шарда один раз — на "промпт участник" или на первом
+ответе после рестарта — и дальше пополняется подпиской на core.message_log.
+
+Память ограничена: на корпус — последние STYLE_CORPUS_MAX_MESSAGES сообщений,
+корпусов — не больше STYLE_CORPUS_MAX_CHATS (самый давно использованный вытесняется).
+Участники без сообщений запоминаются отдельно (до STYLE_CORPUS_MAX_MISSES), чтобы
+не перечитывать шард на каждом ответе.
+Весь код, кроме чтения шарда, работает в event loop, поэтому без блокировок.
+"""
+import asyncio
+from collections import OrderedDict, deque
+
+from core.log_record import LogRecord, LogWatermark
+from core.message_log import message_log
+
+STYLE_CORPUS_MAX_MESSAGES = 5000
+STYLE_CORPUS_MAX_CHATS = 32
+STYLE_CORPUS_MAX_MISSES = 64
+
+
+def _corpus_key(chat_id, username: str | None, full_name: str | None) -> tuple:
+    if username:
+        return str(chat_id), "username", username
+    return str(chat_id), "full_name", (full_name or "").lower()
+
+
+def _matches(key: tuple, record: LogRecord) -> bool:
+    _chat_id, field, value = key
+    if field == "username":
+        return record.username == value
+    return record.full_name.lower() == value
+
+
+class StyleCorpusCache:
+    def __init__(self):
+        self._corpora: OrderedDict[tuple, deque] = OrderedDict()
+        # промахи: пустые корпуса (их тоже пополняет on_message), чтобы участник без
+        # сообщений не перечитывал шард на каждом ответе
+        self._misses: OrderedDict[tuple, deque] = OrderedDict()
+        self._loading: dict[tuple, list[LogRecord]] = {}
+        self._inflight: dict[tuple, asyncio.Task] = {}
+
+    def on_message(self, record: LogRecord):
+        """Подписчик message_log: дописывает сообщение в корпуса его автора."""
+        for corpora in (self._corpora, self._misses):
+            for key, corpus in corpora.items():
+                if key[0] == record.chat_id and _matches(key, record):
+                    corpus.append(record.text.strip())
+        for key, buffered in self._loading.items():
+            if key[0] == record.chat_id and _matches(key, record):
+                buffered.append(record)
+
+    @staticmethod
+    def _scan(key: tuple) -> tuple[list[str], LogWatermark]:
+        """Все тексты участника из шарда чата и докуда шард прочитан."""
+        texts, mark = [], LogWatermark()
+        for record in message_log.iter_chat(key[0]):
+            if _matches(key, record):
+                texts.append(record.text.strip())
+                mark.note(record)
+        return texts, mark
+
+    @staticmethod
+    def _remember(corpora: OrderedDict, key: tuple, corpus: deque, limit: int):
+        corpora[key] = corpus
+        corpora.move_to_end(key)
+        while len(corpora) > limit:
+            corpora.popitem(last=False)
+
+    async def _load(self, key: tuple) -> list[str]:
+        self._loading[key] = []
+        try:
+            texts, mark = await asyncio.to_thread(self._scan, key)
+        finally:
+            buffered = self._loading.pop(key)
+        # то, что пришло во время чтения и не попало в прочитанное
+        texts.extend(record.text.strip() for record in buffered if mark.is_new(record))
+        corpus = deque(texts, maxlen=STYLE_CORPUS_MAX_MESSAGES)
+        if texts:
+            self._misses.pop(key, None)
+            self._remember(self._corpora, key, corpus, STYLE_CORPUS_MAX_CHATS)
+        else:
+            self._corpora.pop(key, None)
+            self._remember(self._misses, key, corpus, STYLE_CORPUS_MAX_MISSES)
+        return texts
+
+    async def load(self, chat_id, username: str | None = None, full_name: str | None = None) -> list[str]:
+        """Читает сообщения участника из лога и кэширует хвост. Возвращает ВСЕ сообщения.
+
+        Одновременные чтения одного корпуса ждут одну задачу, а не читают шард каждое.
+        """
+        key = _corpus_key(chat_id, username, full_name)
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.ensure_future(self._load(key))
+            task.add_done_callback(lambda _task: self._inflight.pop(key, None))
+        return list(await asyncio.shield(task))
+
+    def forget(self, chat_id, username: str | None = None, full_name: str | None = None):
+        """Убирает промах из кэша (например, username не нашёлся, а имя — да)."""
+        self._misses.pop(_corpus_key(chat_id, username, full_name), None)
+
+    async def get(self, chat_id, username: str | None = None, full_name: str | None = None) -> list[str]:
+        """Сообщения участника (последние STYLE_CORPUS_MAX_MESSAGES); лог читается только при промахе."""
+        key = _corpus_key(chat_id, username, full_name)
+        corpus = self._corpora.get(key)
+        if corpus is not None:
+            self._corpora.move_to_end(key)
+            return list(corpus)
+        corpus = self._misses.get(key)
+        if corpus is not None:
+            if corpus:
+                # участник заговорил — промах становится обычным корпусом
+                del self._misses[key]
+                self._remember(self._corpora, key, corpus, STYLE_CORPUS_MAX_CHATS)
+            return list(corpus)
+        texts = await self.load(chat_id, username, full_name)
+        return texts[-STYLE_CORPUS_MAX_MESSAGES:]
+
+
+style_corpus = StyleCorpusCache()
+message_log.subscribe(style_corpus.on_message)
@@ -4,6 +4,7 @@ from datetime import datetime
 from aiogram import types
 from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
 from config import ADMIN_ID, LOG_FILE
+from core.message_log import message_log
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
@@ -18,30 +19,20 @@ def log_message(message: str):
 
 async def get_all_chats_from_log():
     """
-    Получение уникальных чатов из лог-файла.
+    Получение уникальных чатов из лога сообщений (по шардам core.message_log).
     Оставляет ТОЛЬКО ГРУППЫ (ID < 0), исключая личные сообщения.
     """
     chats = set()
-    try:
-        with open(LOG_FILE, 'r', encoding='utf-8') as f:
-            for line in f:
-                if " - Chat " in line:
-                    # Извлекаем ID чата из строки лога
-                    # Пример строки: ... - Chat -100123456789 ...
-                    try:
-                        chat_part = line.split(" - Chat ")[1].split(" ")[0]
-                        chat_id = int(chat_part)
-                        
-                        # ФИЛЬТР: Добавляем только если ID отрицательный (группы/каналы)
-                        # Личные чаты имеют положительный ID
-                        if chat_id < 0:
-                            chats.add(chat_id)
-                            
-                    except (ValueError, IndexError):
-                        continue
-    except FileNotFoundError:
-        logger.warning(f"Лог-файл {LOG_FILE} не найден")
-    
+    for chat_part in message_log.chat_ids():
+        try:
+            chat_id = int(chat_part)
+        except ValueError:
+            continue
+        # ФИЛЬТР: Добавляем только если ID отрицательный (группы/каналы)
+        # Личные чаты имеют положительный ID
+        if chat_id < 0:
+            chats.add(chat_id)
+
     return list(chats)
 
 async def send_broadcast_message(bot, message_text: str):
@@ -1,118 +1,79 @@
-import os
-import json
 import logging
 from aiogram import types, Bot
 from config import (
     CHAT_SETTINGS_FILE,
-    CHAT_LIST_FILE,
-    SPECIAL_CHAT_ID,
+    CHAT_SETTINGS_BACKEND,
     chat_settings,
-    chat_list,
     ADMIN_ID,
     sms_disabled_chats,
 )
+from core.chat_registry import chat_registry
+from core.json_store import JsonStateStore
+
+# Хранилище настроек: изменения копятся и пишутся не чаще раза в интервал.
+# В режиме "sqlite" chat_settings сам себе хранилище и пишет только изменённые строки.
+if CHAT_SETTINGS_BACKEND == "sqlite":
+    chat_settings_store = chat_settings
+else:
+    chat_settings_store = JsonStateStore(CHAT_SETTINGS_FILE, lambda: chat_settings, indent=4)
 
 # Функция загрузки настроек чатов при старте
 def load_chat_settings():
     """
-    Загружает настройки чатов из файла JSON.
+    Загружает настройки чатов из файла JSON (или список чатов из SQLite).
     Важно: Модифицирует глобальный словарь `chat_settings` на месте,
     чтобы все модули, импортирующие его, видели изменения.
     """
     global chat_settings
-    if os.path.exists(CHAT_SETTINGS_FILE):
-        try:
-            with open(CHAT_SETTINGS_FILE, "r", encoding="utf-8") as file:
-                data = json.load(file)
-                if isinstance(data, dict):
-                    # ИСПРАВЛЕНИЕ: Очищаем текущий словарь и обновляем его данными из файла.
-                    # Это гарантирует, что все ссылки на `chat_settings` в других модулях
-                    # остаются действительными и видят загруженные данные.
-                    chat_settings.clear()
-                    chat_settings.update(data)
-                    logging.info(f"Загружены настройки для {len(chat_settings)} чатов.")
-                else:
-                    # Если файл поврежден, очищаем словарь
-                    chat_settings.clear()
-                    logging.warning("Файл chat_settings.json повреждён, используется пустой словарь настроек.")
-        except Exception as e:
-            logging.error(f"Ошибка при загрузке настроек чатов: {e}")
-            chat_settings.clear() # Очищаем в случае любой ошибки чтения
-    else:
+    if CHAT_SETTINGS_BACKEND == "sqlite":
+        chat_settings.load(json_path=CHAT_SETTINGS_FILE)
+        logging.info(f"Настройки чатов в SQLite: {len(chat_settings)} чатов.")
+        return
+    try:
+        data = chat_settings_store.read()
+    except Exception as e:
+        logging.error(f"Ошибка при загрузке настроек чатов: {e}")
+        chat_settings.clear() # Очищаем в случае любой ошибки чтения
+        return
+    if data is None:
         # Если файл не существует, убедимся, что словарь пуст
         chat_settings.clear()
         logging.info("Файл chat_settings.json не найден, используется пустой словарь настроек.")
+    elif isinstance(data, dict):
+        # Очищаем текущий словарь и обновляем его данными из файла, чтобы все
+        # ссылки на `chat_settings` в других модулях видели загруженные данные.
+        chat_settings.clear()
+        chat_settings.update(data)
+        logging.info(f"Загружены настройки для {len(chat_settings)} чатов.")
+    else:
+        # Если файл поврежден, очищаем словарь
+        chat_settings.clear()
+        logging.warning("Файл chat_settings.json повреждён, используется пустой словарь настроек.")
 
-# Функция сохранения настроек чатов в файл
+# Функция сохранения настроек чатов: помечает хранилище грязным, запись — отложенная
 def save_chat_settings():
-    try:
-        with open(CHAT_SETTINGS_FILE, "w", encoding="utf-8") as file:
-            json.dump(chat_settings, file, ensure_ascii=False, indent=4)
-        logging.info("Настройки чатов сохранены.")
-    except Exception as e:
-        logging.error(f"Ошибка при сохранении настроек чатов: {e}")
+    chat_settings_store.mark_dirty()
 
 load_chat_settings() # Загружаем настройки при старте бота
 
 
 # Функция загрузки списка чатов при старте
 def load_chats():
-    global chat_list
-    if os.path.exists(CHAT_LIST_FILE):
-        try:
-            with open(CHAT_LIST_FILE, "r", encoding="utf-8") as file:
-                data = json.load(file)
-                if isinstance(data, list): # Проверяем, что файл содержит список
-                    # ИЗМЕНЕНО: Модифицируем список на месте, а не переназначаем
-                    chat_list.clear()
-                    chat_list.extend(data)
-                    logging.info(f"Загружено {len(chat_list)} чатов из файла.")
-                else:
-                    chat_list.clear()
-                    logging.warning("Файл chats.json повреждён, создан новый список чатов.")
-        except Exception as e:
-            logging.error(f"Ошибка при загрузке списка чатов: {e}")
-            chat_list.clear()
-    else:
-        chat_list.clear()
+    chat_registry.load()
 
-# Функция сохранения списка чатов в файл
+# Функция сохранения списка чатов: запись отложенная, как и у настроек
 def save_chats():
-    try:
-        with open(CHAT_LIST_FILE, "w", encoding="utf-8") as file:
-            json.dump(chat_list, file, ensure_ascii=False, indent=4)
-        logging.info("Список чатов сохранён.")
-    except Exception as e:
-        logging.error(f"Ошибка при сохранении списка чатов: {e}")
+    chat_registry.store.mark_dirty()
 
-# Функция добавления чата (без дублирования)
+# Функция добавления чата (без дублирования); на каждое сообщение — поиск в словаре
 def add_chat(chat_id, chat_title, chat_username=None):
-    global chat_list
-
-    # Проверяем, есть ли уже этот чат в списке
-    if not any(chat["id"] == chat_id for chat in chat_list):
-        chat_info = {
-            "id": chat_id,
-            "title": chat_title,
-            "username": chat_username if chat_username else None
-        }
-        chat_list.append(chat_info)
-        save_chats() # Сохраняем изменения
-        logging.info(f"Добавлен новый чат: {chat_title} ({chat_id})")
-
-    # Перемещаем "особый" чат наверх
-    chat_list.sort(key=lambda chat: 0 if chat["id"] == SPECIAL_CHAT_ID else 1)
+    chat_registry.upsert(chat_id, chat_title, chat_username)
 
 # Функция удаления чата из списка и настроек
 def remove_chat(chat_id):
-    global chat_list, chat_settings
+    global chat_settings
 
-    removed = False
-    before_count = len(chat_list)
-    chat_list[:] = [chat for chat in chat_list if chat.get("id") != chat_id]
-    if len(chat_list) != before_count:
-        removed = True
-        save_chats()
+    removed = chat_registry.remove(chat_id)
 
     chat_id_str = str(chat_id)
     settings_removed = False
@@ -138,14 +99,11 @@ def get_chats_list(chat_id, chat_title, chat_username):
     # Добавляем текущий чат, если его нет
     add_chat(chat_id, chat_title, chat_username)
     
-    # Фильтруем чаты без названия (где title == None)
-    filtered_chats = [chat for chat in chat_list if chat.get("title")]
+    # Чаты с названием, особый чат первым (реестр держит этот вид в кэше)
+    filtered_chats = chat_registry.titled()
     if not filtered_chats:
         return "Я пока никуда не добавлен."
 
-    # Сортируем список перед созданием нумерованного текста
-    filtered_chats.sort(key=lambda chat: 0 if chat["id"] == SPECIAL_CHAT_ID else 1)
-    
     # Создаем новый список с правильной нумерацией
     numbered_chats = []
     for i, chat in enumerate(filtered_chats):
@@ -160,8 +118,6 @@ def get_chats_list(chat_id, chat_title, chat_username):
 
 async def process_update_all_chats(message: types.Message, bot: Bot):
     """Попытка обновить информацию о всех чатах через API бота и удаление недоступных чатов"""
-    global chat_list
-    
     if message.from_user.id != ADMIN_ID: # Проверка на админа
         await message.reply("Иди нахуй, у тебя нет прав на это.")
         return
@@ -174,7 +130,7 @@ async def process_update_all_chats(message: types.Message, bot: Bot):
         bot_me = await bot.get_me()
         bot_id = bot_me.id
 
-        for chat in chat_list:
+        for chat in chat_registry.chats:
             try:
                 # ???????????????? ???????????????????? ???????????????????? ?? ???????? ?????????? API
                 chat_info = await bot.get_chat(chat["id"])
@@ -244,9 +200,8 @@ async def process_update_all_chats(message: types.Message, bot: Bot):
                 unique_ids.add(chat["id"])
                 unique_chats.append(chat)
         
-        # ИЗМЕНЕНО: Обновляем глобальный список на месте
-        chat_list.clear()
-        chat_list.extend(unique_chats)
+        # Обновляем реестр (глобальный список меняется на месте, особый чат первым)
+        chat_registry.replace(unique_chats, persist=False)
 
         if removed_chats:
             removed_ids = {c["id"] for c in removed_chats}
@@ -263,11 +218,8 @@ async def process_update_all_chats(message: types.Message, bot: Bot):
                 save_chat_settings()
 
         
-        # Сортируем чаты (специальный чат всегда первый)
-        chat_list.sort(key=lambda chat: 0 if chat["id"] == SPECIAL_CHAT_ID else 1)
-        
         # Обновляем индексы для всех чатов
-        for i, chat in enumerate(chat_list):
+        for i, chat in enumerate(chat_registry.chats):
             chat["index"] = i + 1
         
         save_chats() # Сохраняем обновленный список
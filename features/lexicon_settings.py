@@ -1,14 +1,14 @@
 from datetime import datetime
-import re
-import aiofiles
+import asyncio
 import logging
 import random
 import collections
 from collections import defaultdict
 from nltk.util import ngrams
 from aiogram import types
-from config import LOG_FILE
-from prompts import STOPWORDS
+from core.lexicon_index import clean_text, lexicon_index
+from core.log_record import format_log_line
+from core.message_log import message_log
 
 
 STYLE_SAMPLE_MIN_CHARS = 8
@@ -41,70 +41,51 @@ def build_hybrid_style_sample(messages: list, recent_count: int = RECENT_STYLE_S
 
     return recent_messages + random_messages
 
-# Запись сообщений всех пользователей в файл
+# Запись сообщений всех пользователей в шард чата (core.message_log)
 async def save_user_message(message: types.Message):
-    timestamp = datetime.now().isoformat()
+    now = datetime.now()
     chat_id = message.chat.id if message.chat else "NoChat"
     chat_title = message.chat.title if message.chat and message.chat.title else "ЛС"
     user_id = message.from_user.id
     username = message.from_user.username or "NoUsername"
     full_name = message.from_user.full_name or "NoName"
     text = message.text or ""
-    log_line = f"{timestamp} - Chat {chat_id} ({chat_title}) - User {user_id} ({username}) [{full_name}]: {text}\n"
+    log_line = format_log_line(now, chat_id, chat_title, user_id, username, full_name, text)
 
     try:
-        async with aiofiles.open(LOG_FILE, mode="a", encoding="utf-8") as f:
-            await f.write(log_line)
+        await message_log.append(chat_id, now, log_line)
     except Exception as e:
-        logging.error(f"Ошибка записи в {LOG_FILE}: {e}")
+        logging.error(f"Ошибка записи в лог чата {chat_id}: {e}")
+
+def _collect_chat_texts(chat_id, predicate=None) -> list:
+    """Тексты сообщений чата (опционально — только прошедших predicate(record))."""
+    return [
+        record.text.strip()
+        for record in message_log.iter_chat(chat_id)
+        if predicate is None or predicate(record)
+    ]
 
 # 📌 Функция для получения сообщений по ID
 async def extract_user_messages(user_id: int, chat_id: int) -> list:
-    messages = []
-    pattern = re.compile(rf".* - Chat {chat_id}\b.*User {user_id}\b.*: (.*)")
-    async with aiofiles.open(LOG_FILE, mode="r", encoding="utf-8") as f:
-        async for line in f:
-            match = pattern.match(line)
-            if match:
-                messages.append(match.group(1).strip())
-    return messages
+    user_id = str(user_id)
+    return await asyncio.to_thread(
+        _collect_chat_texts, chat_id, lambda record: record.user_id == user_id
+    )
 
 async def extract_messages_by_username(username: str, chat_id: int) -> list:
-    messages = []
-    pattern = re.compile(rf".* - Chat {chat_id}\b.*User \d+ \(({re.escape(username)})\) \[.*?\]: (.*)")
-    async with aiofiles.open(LOG_FILE, mode="r", encoding="utf-8") as f:
-        async for line in f:
-            match = pattern.match(line)
-            if match:
-                messages.append(match.group(2).strip())
-    return messages
+    return await asyncio.to_thread(
+        _collect_chat_texts, chat_id, lambda record: record.username == username
+    )
 
 async def extract_messages_by_full_name(full_name: str, chat_id: int) -> list:
-    messages = []
-    pattern = re.compile(rf".* - Chat {chat_id}\b.*User \d+ \([^)]+\) \[(.+?)\]: (.*)")
-    async with aiofiles.open(LOG_FILE, mode="r", encoding="utf-8") as f:
-        async for line in f:
-            match = pattern.match(line)
-            if match and match.group(1).lower() == full_name.lower():
-                messages.append(match.group(2).strip())
-    return messages
+    full_name = full_name.lower()
+    return await asyncio.to_thread(
+        _collect_chat_texts, chat_id, lambda record: record.full_name.lower() == full_name
+    )
 
 # Функция для извлечения сообщений всего чата по chat_id
 async def extract_chat_messages(chat_id: int) -> list:
-    messages = []
-    pattern = re.compile(rf".* - Chat {chat_id}\b.*User .+?: (.*)")
-    async with aiofiles.open(LOG_FILE, mode="r", encoding="utf-8") as f:
-        async for line in f:
-            match = pattern.match(line)
-            if match:
-                messages.append(match.group(1).strip())
-    return messages
-
-# 📌 Очистка текста (удаление стоп-слов)
-def clean_text(text: str) -> list:
-    words = re.findall(r"\w+", text.lower())
-    filtered_words = [word for word in words if word not in STOPWORDS]
-    return filtered_words
+    return await asyncio.to_thread(_collect_chat_texts, chat_id)
 
 # 📌 Функция для получения самых частых слов
 async def get_frequent_words(user_id: int, top_n: int = 10):
@@ -134,23 +115,12 @@ def get_frequent_phrases_from_text(text: str, n: int = 2, top_n: int = 5) -> lis
     ngram_counter = collections.Counter(ngram_list)
     return [(" ".join(gram), count) for gram, count in ngram_counter.most_common(top_n)]
 
-# Функции для подсчета частотности слов и фраз для чата
+# Функции для подсчета частотности слов и фраз для чата (готовые счётчики core.lexicon_index)
 async def get_chat_frequent_words(chat_id: int, top_n: int = 10):
-    messages = await extract_chat_messages(chat_id)
-    all_text = " ".join(messages)
-    words = clean_text(all_text)
-    counter = collections.Counter(words)
-    return counter.most_common(top_n)
+    return await asyncio.to_thread(lexicon_index.top, chat_id, 1, top_n)
 
 async def get_chat_frequent_phrases(chat_id: int, n: int = 2, top_n: int = 10):
-    messages = await extract_chat_messages(chat_id)
-    all_text = " ".join(messages)
-    words = clean_text(all_text)
-    if len(words) < n:
-        return []
-    ngram_list = list(ngrams(words, n))
-    ngram_counter = collections.Counter(ngram_list)
-    return [(" ".join(gram), count) for gram, count in ngram_counter.most_common(top_n)]
+    return await asyncio.to_thread(lexicon_index.top, chat_id, n, top_n)
 
 # 🆕 НОВАЯ ФУНКЦИЯ: Получить активных пользователей чата
 async def get_chat_active_users(chat_id, min_messages=10):
@@ -158,24 +128,20 @@ async def get_chat_active_users(chat_id, min_messages=10):
     try:
         user_stats = defaultdict(lambda: {'username': None, 'full_name': None, 'count': 0})
         
-        # Паттерн для парсинга строк лога
-        pattern = re.compile(rf".* - Chat {chat_id}\b.*User (\d+) \(([^)]+)\) \[(.+?)\]: (.*)")
-        
-        async with aiofiles.open(LOG_FILE, mode="r", encoding="utf-8") as f:
-            async for line in f:
-                match = pattern.match(line)
-                if match:
-                    user_id = match.group(1)
-                    username = match.group(2) if match.group(2) != "NoUsername" else None
-                    full_name = match.group(3) if match.group(3) != "NoName" else None
-                    
-                    # Используем username как ключ, если есть, иначе full_name
-                    key = username if username else full_name
-                    if key:
-                        user_stats[key]['username'] = username
-                        user_stats[key]['full_name'] = full_name
-                        user_stats[key]['count'] += 1
-        
+        def count_users():
+            for record in message_log.iter_chat(chat_id):
+                username = record.username if record.username != "NoUsername" else None
+                full_name = record.full_name if record.full_name != "NoName" else None
+
+                # Используем username как ключ, если есть, иначе full_name
+                key = username if username else full_name
+                if key:
+                    user_stats[key]['username'] = username
+                    user_stats[key]['full_name'] = full_name
+                    user_stats[key]['count'] += 1
+
+        await asyncio.to_thread(count_users)
+
         # Фильтруем пользователей с достаточным количеством сообщений
         result = []
         for key, stats in user_stats.items():
@@ -198,14 +164,13 @@ async def get_chat_active_users(chat_id, min_messages=10):
 
 # Вынесенная логика обработки "мой лексикон"
 async def process_my_lexicon(user_id, chat_id, message):
-    # Собираем только сообщения этого пользователя в этом чате
-    messages = await extract_user_messages(user_id, chat_id)
-    if not messages:
+    # Счётчики только этого пользователя в этом чате
+    user_ids = [str(user_id)]
+    frequent_words = await asyncio.to_thread(lexicon_index.top, chat_id, 1, 10, user_ids)
+    if not frequent_words:
         await message.reply("Нулевой")
         return
-        
-    frequent_words = get_frequent_phrases_from_text(" ".join(messages), n=1, top_n=10)
-    frequent_phrases = get_frequent_phrases_from_text(" ".join(messages), n=2, top_n=5)
+    frequent_phrases = await asyncio.to_thread(lexicon_index.top, chat_id, 2, 5, user_ids)
     
     response_text = (
         "Часто употребляемые слова в этом чате:\n" +
@@ -230,21 +195,30 @@ async def process_chat_lexicon(message: types.Message) -> str:
     )
     return response_text
 
+# Админ-команда "лексикон пересобрать": пересчёт счётчиков из лога
+async def process_lexicon_rebuild(message: types.Message):
+    status = await message.reply("Пересчитываю лексикон по всему логу...")
+    try:
+        chats, messages = await asyncio.to_thread(lexicon_index.rebuild)
+    except Exception as e:
+        logging.error(f"Ошибка пересборки лексикона: {e}")
+        await status.edit_text("Не смог пересобрать лексикон, смотри логи.")
+        return
+    await status.edit_text(f"Лексикон пересобран: {chats} чатов, {messages} сообщений.")
+
 # Вынесенная логика обработки "лексикон <имя пользователя>"
 async def process_user_lexicon(username_or_name, chat_id, message):
-    # Сначала пробуем найти по username (без @)
-    messages = await extract_messages_by_username(username_or_name, chat_id)
-    
-    if not messages:
-        # Если по username не нашли, пробуем искать по полному имени
-        messages = await extract_messages_by_full_name(username_or_name, chat_id)
-        
-    if not messages:
+    # Сначала ищем по username (без @), если не нашли — по полному имени
+    user_ids = await asyncio.to_thread(lexicon_index.find_users, chat_id, username_or_name)
+    frequent_words = []
+    if user_ids:
+        frequent_words = await asyncio.to_thread(lexicon_index.top, chat_id, 1, 10, user_ids)
+
+    if not frequent_words:
         await message.reply(f"Сообщения пользователя '{username_or_name}' в этом чате не найдены.")
         return
-        
-    frequent_words = get_frequent_phrases_from_text(" ".join(messages), n=1, top_n=10)
-    frequent_phrases = get_frequent_phrases_from_text(" ".join(messages), n=2, top_n=5)
+
+    frequent_phrases = await asyncio.to_thread(lexicon_index.top, chat_id, 2, 5, user_ids)
     
     response_text = (
         f"Часто употребляемые слова пользователя {username_or_name}:\n" +
@@ -38,10 +38,7 @@ def _get_group_chat_activity() -> dict[int, datetime]:
     result: dict[int, datetime] = {}
     try:
         conn = sqlite3.connect(DB_FILE)
-        rows = conn.execute(
-            """SELECT chat_id, MAX(message_timestamp) FROM message_stats
-               WHERE is_private = 0 GROUP BY chat_id"""
-        ).fetchall()
+        rows = conn.execute("SELECT chat_id, last_message_at FROM chats").fetchall()
         conn.close()
     except Exception as e:
         logging.error(f"[proactive] не смог прочитать БД статистики: {e}")
@@ -1,30 +1,17 @@
-import os
-import json
+import asyncio
 import logging
-import re
 from collections import deque
 from datetime import datetime, timedelta
 from aiogram import Bot, types
 # ИСПРАВЛЕНИЕ: Добавляем импорт `sms_disabled_chats` из config.py
-from config import SMS_DISABLED_CHATS_FILE, SPECIAL_CHAT_ID, LOG_FILE, sms_disabled_chats
+from config import SMS_DISABLED_CHATS_FILE, SPECIAL_CHAT_ID, sms_disabled_chats
+from core.json_store import JsonStateStore
+from core.message_log import message_log
 
 
-LOG_START_RE = re.compile(r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}")
 TELEGRAM_MESSAGE_LIMIT = 4096
 TELEGRAM_REPLY_SAFE_LIMIT = TELEGRAM_MESSAGE_LIMIT - 96
 
-USER_LOG_LINE_RE = re.compile(
-    r"^(?P<timestamp>\d{4}-\d{2}-\d{2}[T ][^\n]*?)"
-    r"\s+-\s+Chat\s+(?P<chat_id>-?\d+)\b"
-    r"(?:\s+\(.*?\))?"
-    r"\s+-\s+User(?:\s+\S+)?"
-    r"(?:\s+\((?P<username>.*?)\))?"
-    r"(?:\s+\[(?P<full_name>.*?)\])?"
-    r":\s*(?P<text>.*)\Z",
-    re.DOTALL,
-)
-
-
 def _get_numbered_chats(chat_list: list) -> list:
     """Возвращает список чатов с той же фильтрацией и сортировкой, что и команда "где сидишь"."""
     filtered_chats = [chat for chat in chat_list if chat.get("title")]
@@ -32,31 +19,6 @@ def _get_numbered_chats(chat_list: list) -> list:
     return filtered_chats
 
 
-def _parse_user_log_line(line: str):
-    """Парсит строку user_messages.log и возвращает данные сообщения или None."""
-    match = USER_LOG_LINE_RE.match(line.rstrip("\n"))
-    if not match:
-        return None
-
-    return match.groupdict()
-
-
-def _iter_user_log_records(file):
-    """Возвращает логические записи лога, склеивая многострочные сообщения."""
-    current_record = None
-
-    for line in file:
-        if LOG_START_RE.match(line):
-            if current_record is not None:
-                yield current_record
-            current_record = line
-        elif current_record is not None:
-            current_record += line
-
-    if current_record is not None:
-        yield current_record
-
-
 def _fit_recent_messages_to_telegram_limit(messages, max_length: int = TELEGRAM_REPLY_SAFE_LIMIT) -> list[str]:
     """Обрезает вывод под лимит Telegram, сохраняя самые последние сообщения."""
     fitted_messages = deque()
@@ -80,11 +42,8 @@ def _fit_recent_messages_to_telegram_limit(messages, max_length: int = TELEGRAM_
     return list(fitted_messages)
 
 
-def _format_log_time(timestamp: str) -> str:
-    try:
-        return (datetime.fromisoformat(timestamp) + timedelta(hours=1)).strftime("%H:%M")
-    except ValueError:
-        return timestamp
+def _format_log_time(timestamp: datetime) -> str:
+    return (timestamp + timedelta(hours=1)).strftime("%H:%M")
 
 
 def _format_log_author(username: str, full_name: str) -> str:
@@ -145,33 +104,28 @@ async def process_what_they_say(message: types.Message, chat_list: list, bot: Bo
         await message.reply("В этом чате СМС/ММС отключены, подсматривать туда тоже нельзя.")
         return
 
-    recent_messages = deque(maxlen=10)
+    recent_messages = []
 
-    if not os.path.exists(LOG_FILE):
-        await message.reply("Пока нечего рассказать: лог сообщений пуст.")
-        return
+    def collect_recent():
+        # шард читается с конца: нужны только последние 10 сообщений
+        for record in message_log.iter_chat(target_chat_id, reverse=True):
+            text = record.text.strip().replace("\n", " / ")
+            if not text:
+                continue
+
+            formatted_message = (
+                f"{_format_log_time(record.timestamp)} "
+                f"{_format_log_author(record.username, record.full_name)}: {text}"
+            )
+            if recent_messages and recent_messages[-1] == formatted_message:
+                continue
+            recent_messages.append(formatted_message)
+            if len(recent_messages) >= 10:
+                break
+        recent_messages.reverse()
 
     try:
-        with open(LOG_FILE, "r", encoding="utf-8") as file:
-            for record in _iter_user_log_records(file):
-                parsed = _parse_user_log_line(record)
-                if not parsed:
-                    logging.warning(f"Не удалось распарсить запись лога:\n{record}")
-                    continue
-                if parsed["chat_id"] != target_chat_id:
-                    continue
-
-                text = parsed["text"].strip().replace("\n", " / ")
-                if not text:
-                    continue
-
-                formatted_message = (
-                    f"{_format_log_time(parsed['timestamp'])} "
-                    f"{_format_log_author(parsed['username'], parsed['full_name'])}: {text}"
-                )
-                if recent_messages and recent_messages[-1] == formatted_message:
-                    continue
-                recent_messages.append(formatted_message)
+        await asyncio.to_thread(collect_recent)
     except Exception as e:
         logging.error(f"Ошибка при чтении последних сообщений чата {target_chat_id}: {e}")
         await message.reply("Не удалось прочитать сообщения. Возможно, я хуисос")
@@ -185,41 +139,34 @@ async def process_what_they_say(message: types.Message, chat_list: list, bot: Bo
     fitted_messages = _fit_recent_messages_to_telegram_limit(recent_messages)
     await message.reply("\n".join(fitted_messages))
 
+# Хранилище списка чатов с отключёнными смс (множество пишется списком)
+sms_disabled_store = JsonStateStore(SMS_DISABLED_CHATS_FILE, lambda: list(sms_disabled_chats), indent=4)
+
 # ✅ Функция загрузки списка чатов с отключёнными смс
 def load_sms_disabled_chats():
     """
     Загружает чаты с отключенными СМС из файла.
     Модифицирует глобальное множество `sms_disabled_chats` на месте, чтобы все модули видели изменения.
     """
-    if os.path.exists(SMS_DISABLED_CHATS_FILE):
-        try:
-            with open(SMS_DISABLED_CHATS_FILE, "r", encoding="utf-8") as file:
-                data = json.load(file)
-                # Проверяем, что из файла загрузился именно список
-                if isinstance(data, list):
-                    # ИСПРАВЛЕНИЕ: Очищаем и обновляем существующий объект, а не создаем новый
-                    sms_disabled_chats.clear()
-                    sms_disabled_chats.update(data)
-                    logging.info(f"Загружено {len(sms_disabled_chats)} чатов с отключёнными смс.")
-                else:
-                    sms_disabled_chats.clear()
-                    logging.warning(f"Файл {SMS_DISABLED_CHATS_FILE} содержит не список, а {type(data)}. Настройки сброшены.")
-        except Exception as e:
-            logging.error(f"Ошибка при загрузке списка отключённых смс: {e}")
-            sms_disabled_chats.clear()
+    try:
+        data = sms_disabled_store.read([])
+    except Exception as e:
+        logging.error(f"Ошибка при загрузке списка отключённых смс: {e}")
+        sms_disabled_chats.clear()
+        return
+    # Проверяем, что из файла загрузился именно список
+    if isinstance(data, list):
+        # Очищаем и обновляем существующий объект, а не создаем новый
+        sms_disabled_chats.clear()
+        sms_disabled_chats.update(data)
+        logging.info(f"Загружено {len(sms_disabled_chats)} чатов с отключёнными смс.")
     else:
-        # Если файла нет, просто убедимся, что множество пустое
         sms_disabled_chats.clear()
+        logging.warning(f"Файл {SMS_DISABLED_CHATS_FILE} содержит не список, а {type(data)}. Настройки сброшены.")
 
-# ✅ Функция сохранения списка чатов с отключёнными смс
+# ✅ Функция сохранения списка чатов с отключёнными смс (запись отложенная)
 def save_sms_disabled_chats():
-    try:
-        with open(SMS_DISABLED_CHATS_FILE, "w", encoding="utf-8") as file:
-            # Преобразуем множество в список для сохранения в JSON
-            json.dump(list(sms_disabled_chats), file, ensure_ascii=False, indent=4)
-        logging.info("Список чатов с отключёнными смс сохранён.")
-    except Exception as e:
-        logging.error(f"Ошибка при сохранении списка отключённых смс: {e}")
+    sms_disabled_store.mark_dirty()
 
 # ✅ Загружаем список отключённых чатов при старте бота
 load_sms_disabled_chats()
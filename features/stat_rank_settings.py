@@ -1,9 +1,9 @@
-import os
-import json
 import logging
-from datetime import date
 from aiogram import types
-from config import STATS_FILE, message_stats, bot
+from config import message_stats, bot
+from core.display_names import display_names
+from core.json_store import JsonStateStore
+from core.message_counters import message_counters
 from prompts import RANKS
 
 # Файл для хранения настроек уведомлений о рангах
@@ -12,138 +12,47 @@ RANK_NOTIFICATIONS_FILE = "rank_notifications_settings.json"
 # Множество чатов, где уведомления о рангах ОТКЛЮЧЕНЫ
 rank_notifications_disabled_chats = set()
 
+# Хранилище настроек уведомлений (множество пишется списком)
+rank_notifications_store = JsonStateStore(
+    RANK_NOTIFICATIONS_FILE, lambda: {"disabled_chats": list(rank_notifications_disabled_chats)}, indent=4
+)
+
 def load_rank_notifications_settings():
     """Загрузка настроек уведомлений о рангах"""
     global rank_notifications_disabled_chats
-    if os.path.exists(RANK_NOTIFICATIONS_FILE):
-        try:
-            with open(RANK_NOTIFICATIONS_FILE, "r", encoding="utf-8") as file:
-                data = json.load(file)
-                # ИСПРАВЛЕНИЕ: Очищаем и обновляем множество, а не переназначаем.
-                rank_notifications_disabled_chats.clear()
-                rank_notifications_disabled_chats.update(data.get("disabled_chats", []))
-                logging.info(f"🔕 Загружены настройки уведомлений о рангах для {len(rank_notifications_disabled_chats)} чатов.")
-        except Exception as e:
-            logging.error(f"Ошибка при загрузке настроек уведомлений о рангах: {e}")
-            rank_notifications_disabled_chats.clear()
-    else:
+    try:
+        data = rank_notifications_store.read({})
+        # Очищаем и обновляем множество, а не переназначаем.
+        rank_notifications_disabled_chats.clear()
+        rank_notifications_disabled_chats.update(data.get("disabled_chats", []))
+        if data:
+            logging.info(f"🔕 Загружены настройки уведомлений о рангах для {len(rank_notifications_disabled_chats)} чатов.")
+    except Exception as e:
+        logging.error(f"Ошибка при загрузке настроек уведомлений о рангах: {e}")
         rank_notifications_disabled_chats.clear()
 
 def save_rank_notifications_settings():
-    """Сохранение настроек уведомлений о рангах"""
-    try:
-        with open(RANK_NOTIFICATIONS_FILE, "w", encoding="utf-8") as file:
-            json.dump({
-                "disabled_chats": list(rank_notifications_disabled_chats)
-            }, file, ensure_ascii=False, indent=4)
-        logging.info("💾 Настройки уведомлений о рангах сохранены.")
-    except Exception as e:
-        logging.error(f"Ошибка при сохранении настроек уведомлений о рангах: {e}")
+    """Сохранение настроек уведомлений о рангах (запись отложенная)"""
+    rank_notifications_store.mark_dirty()
 
 # Загружаем настройки при импорте модуля
 load_rank_notifications_settings()
 
-# Функция загрузки статистики
-def load_stats():
-    global message_stats
-    if os.path.exists(STATS_FILE):
-        try:
-            with open(STATS_FILE, "r", encoding="utf-8") as file:
-                # ИСПРАВЛЕНИЕ: Очищаем и обновляем словарь, а не переназначаем.
-                message_stats.clear()
-                message_stats.update(json.load(file))
-                logging.info(f"📊 Загружено {len(message_stats)} чатов в статистику.")
-        except Exception as e:
-            logging.error(f"Ошибка при загрузке статистики: {e}")
-            message_stats.clear()
-    else:
-        message_stats.clear()
-
-# Функция сохранения статистики
-def save_stats():
-    try:
-        with open(STATS_FILE, "w", encoding="utf-8") as file:
-            json.dump(message_stats, file, ensure_ascii=False, indent=4)
-    except Exception as e:
-        logging.error(f"Ошибка при сохранении статистики: {e}")
-
-# Загружаем статистику при запуске
-load_stats()
+# Загружаем статистику при запуске (дальше пишет core.message_counters пачками)
+message_counters.load()
 
 # Функция для обновления статистики с сохранением предыдущих данных
 async def track_message_statistics(message: types.Message):
     chat_id = str(message.chat.id)
     user_id = str(message.from_user.id)
-    
-    # Get current date
-    current_date = date.today()
-    current_date_str = current_date.isoformat()
-    
-    # Сохраняем предыдущее значение total, если оно есть
-    previous_total = 0
-    if chat_id in message_stats and user_id in message_stats[chat_id]:
-        previous_total = message_stats[chat_id][user_id].get("total", 0)
-    
-    # Initialize stats structure if missing
-    if chat_id not in message_stats:
-        message_stats[chat_id] = {}
-    if user_id not in message_stats[chat_id]:
-        message_stats[chat_id][user_id] = {
-            "total": previous_total, # Используем предыдущее значение
-            "daily": 0, 
-            "weekly": 0,
-            "last_daily_reset": current_date_str,
-            "last_weekly_reset": current_date_str
-        }
-    
-    user_stats = message_stats[chat_id][user_id]
-    
-    # Проверяем, что total не меньше предыдущего значения
-    if user_stats.get("total", 0) < previous_total:
-        user_stats["total"] = previous_total
-    
-    # Handle date conversion safely
-    try:
-        last_daily_reset = date.fromisoformat(user_stats.get("last_daily_reset", current_date_str))
-    except (TypeError, ValueError):
-        last_daily_reset = current_date
-        user_stats["last_daily_reset"] = current_date_str
-    
-    try:
-        last_weekly_reset = date.fromisoformat(user_stats.get("last_weekly_reset", current_date_str))
-    except (TypeError, ValueError):
-        last_weekly_reset = current_date
-        user_stats["last_weekly_reset"] = current_date_str
-    
-    # Check and reset daily stats
-    if current_date > last_daily_reset:
-        user_stats["daily"] = 0
-        user_stats["last_daily_reset"] = current_date_str
-    
-    # Check and reset weekly stats
-    days_since_reset = (current_date - last_weekly_reset).days
-    if days_since_reset >= 7:
-        user_stats["weekly"] = 0
-        user_stats["last_weekly_reset"] = current_date_str
-    
-    # Increment counters
-    user_stats["total"] = user_stats.get("total", 0) + 1
-    user_stats["daily"] = user_stats.get("daily", 0) + 1
-    user_stats["weekly"] = user_stats.get("weekly", 0) + 1
+    user_stats = message_counters.increment(chat_id, user_id)
     
     # Check for rank promotion
-    new_rank = None
-    for count, rank in sorted(RANKS.items()):
-        if user_stats["total"] == count:
-            new_rank = rank
-            break
+    new_rank = RANKS.get(user_stats["total"])
     
     # Отправляем уведомление только если они включены для этого чата
     if new_rank and chat_id not in rank_notifications_disabled_chats:
         await message.reply(f"🎉 Паздравляю, ты получил ранг **{new_rank}**!")
-    
-    # Save statistics
-    save_stats()
 
 async def get_user_statistics(chat_id: str, user_id: str) -> tuple[str, bool]:
     """
@@ -186,21 +95,9 @@ async def get_valid_users(chat_id: str) -> dict:
     return valid_users
 
 async def get_user_display_name(chat_id: int, user_id: int) -> str:
-    """Получение отображаемого имени пользователя"""
-    try:
-        chat_member = await bot.get_chat_member(chat_id, user_id)
-        user = chat_member.user
-        
-        if user.first_name and user.last_name:
-            return f"{user.first_name} {user.last_name}"
-        elif user.first_name:
-            return user.first_name
-        elif user.username:
-            return f"@{user.username}"
-        return f"Пользователь {user_id}"
-    except Exception as e:
-        logging.error(f"Ошибка при получении информации о пользователе {user_id} в чате {chat_id}: {e}")
-        return f"Пользователь {user_id}"
+    """Получение отображаемого имени пользователя (кэш core.display_names или Telegram)"""
+    names = await display_names.resolve_many(bot, chat_id, [user_id])
+    return names[user_id]
 
 def get_user_rank(message_count: int) -> str:
     """Определение ранга пользователя по количеству сообщений"""
@@ -214,9 +111,11 @@ async def format_top_users(chat_id: str, valid_users: dict) -> tuple[list[str],
     total_chat_messages = sum(stats.get("total", 0) for stats in valid_users.values())
     sorted_users = sorted(valid_users.items(), key=lambda x: x[1].get("total", 0), reverse=True)[:15]
     
+    # имена всех 15 разом: промахи кэша — параллельными запросами
+    names = await display_names.resolve_many(bot, int(chat_id), [int(user_id) for user_id, _ in sorted_users])
     top_users = []
     for i, (user_id, stats) in enumerate(sorted_users, start=1):
-        display_name = await get_user_display_name(int(chat_id), int(user_id))
+        display_name = names[int(user_id)]
         user_rank = get_user_rank(stats.get("total", 0))
         top_users.append(f"{i}. {display_name} - {stats.get('total', 0)} (<i>{user_rank}</i>)")
     
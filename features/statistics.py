@@ -1,5 +1,6 @@
+import asyncio
 import sqlite3
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Dict, Any, Optional, Callable, Awaitable
 import logging
 
@@ -7,10 +8,20 @@ from aiogram import BaseMiddleware
 from aiogram.types import Message
 
 from config import DB_FILE, ADMIN_ID
+from core.bounded import TTLDict
+from core.db_writer import stats_writer
+
+# Сырые строки message_stats / model_stats старше этого удаляются (compact_raw_stats);
+# отчёты читают почасовые сводки message_rollup / model_rollup, которые не чистятся.
+RAW_RETENTION_DAYS = 90
+HOUR_FORMAT = "%Y-%m-%d %H"  # ключ часа в сводках
 
 # --- Rate limit для ЛС ---
-private_message_timestamps: Dict[int, datetime] = {}
 PRIVATE_MESSAGE_COOLDOWN = timedelta(hours=1)
+# запись старше кулдауна уже ничего не запрещает — она и живёт ровно столько
+private_message_timestamps: TTLDict = TTLDict(
+    PRIVATE_MESSAGE_COOLDOWN.total_seconds(), name="private_message_timestamps"
+)
 
 class PrivateRateLimitMiddleware(BaseMiddleware):
     async def __call__(self, handler, event: Message, data):
@@ -29,6 +40,8 @@ class PrivateRateLimitMiddleware(BaseMiddleware):
 
 def init_db():
     conn = sqlite3.connect(DB_FILE)
+    # WAL: отчёты читают, пока core.db_writer пишет
+    conn.execute("PRAGMA journal_mode=WAL")
     cursor = conn.cursor()
 
     cursor.execute('''
@@ -56,26 +69,138 @@ def init_db():
         )
     ''')
 
+    # Справочники: последнее известное имя участника и название/активность группы.
+    # Обновляются при записи (log_message), отчёты не ищут их по message_stats.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id BIGINT PRIMARY KEY,
+            user_name TEXT,
+            user_username TEXT
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS chats (
+            chat_id BIGINT PRIMARY KEY,
+            chat_title TEXT,
+            last_message_at TIMESTAMP
+        )
+    ''')
+
+    # Покрывающие индексы под отчёты "стотистика" и проактивный режим
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_message_stats_private_ts "
+        "ON message_stats (is_private, message_timestamp, chat_id, user_id)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_message_stats_chat_ts ON message_stats (chat_id, message_timestamp)"
+    )
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_model_stats_ts_chat ON model_stats (timestamp, chat_id)")
+
+    # Миграция старой БД: заполняем справочники из уже накопленных сообщений
+    version = cursor.execute("PRAGMA user_version").fetchone()[0]
+    if version < 1:
+        cursor.execute('''
+            INSERT OR REPLACE INTO users (user_id, user_name, user_username)
+            SELECT user_id, user_name, user_username FROM message_stats
+            WHERE id IN (SELECT MAX(id) FROM message_stats GROUP BY user_id)
+        ''')
+        cursor.execute('''
+            INSERT OR REPLACE INTO chats (chat_id, chat_title, last_message_at)
+            SELECT m.chat_id, m.chat_title, last.ts
+            FROM (SELECT chat_id, MAX(id) AS id, MAX(message_timestamp) AS ts
+                  FROM message_stats WHERE is_private = 0 GROUP BY chat_id) AS last
+            JOIN message_stats AS m ON m.id = last.id
+        ''')
+        cursor.execute("PRAGMA user_version = 1")
+
+    # Почасовые сводки: пишутся вместе с сырыми строками, отчёты читают только их
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS message_rollup (
+            chat_id BIGINT NOT NULL,
+            hour TEXT NOT NULL,
+            message_type TEXT NOT NULL,
+            is_private BOOLEAN NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (chat_id, hour, message_type)
+        ) WITHOUT ROWID
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS model_rollup (
+            model_name TEXT NOT NULL,
+            chat_id BIGINT NOT NULL,  -- 0: чат неизвестен
+            hour TEXT NOT NULL,       -- UTC, как model_stats.timestamp
+            count INTEGER NOT NULL,
+            PRIMARY KEY (model_name, chat_id, hour)
+        ) WITHOUT ROWID
+    ''')
+
+    # Минутные окна телеметрии моделей (core.model_telemetry): счётчики и гистограммы в JSON
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS model_telemetry (
+            window_start TIMESTAMP NOT NULL,  -- UTC
+            provider TEXT NOT NULL,
+            model TEXT NOT NULL,
+            key_idx INTEGER NOT NULL,
+            data TEXT NOT NULL
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_model_telemetry_window ON model_telemetry (window_start)")
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_message_rollup_hour ON message_rollup (is_private, hour)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_model_rollup_hour ON model_rollup (hour)")
+
+    if version < 2:
+        cursor.execute('''
+            INSERT OR REPLACE INTO message_rollup (chat_id, hour, message_type, is_private, count)
+            SELECT chat_id, strftime('%Y-%m-%d %H', message_timestamp), message_type, MAX(is_private), COUNT(*)
+            FROM message_stats GROUP BY 1, 2, 3
+        ''')
+        cursor.execute('''
+            INSERT OR REPLACE INTO model_rollup (model_name, chat_id, hour, count)
+            SELECT COALESCE(model_name, ''), COALESCE(chat_id, 0), strftime('%Y-%m-%d %H', timestamp), COUNT(*)
+            FROM model_stats GROUP BY 1, 2, 3
+        ''')
+        cursor.execute("PRAGMA user_version = 2")
+
     conn.commit()
     conn.close()
 
+def compact_raw_stats(retention_days: int = RAW_RETENTION_DAYS):
+    """Удаляет сырые строки старше retention_days (через писателя, сводки не трогает)."""
+    cutoff = datetime.now() - timedelta(days=retention_days)
+    cutoff_utc = (datetime.now(timezone.utc) - timedelta(days=retention_days)).strftime("%Y-%m-%d %H:%M:%S")
+    stats_writer.submit("DELETE FROM message_stats WHERE message_timestamp < ?", (cutoff,))
+    stats_writer.submit("DELETE FROM model_stats WHERE timestamp < ?", (cutoff_utc,))
+    stats_writer.submit("DELETE FROM model_telemetry WHERE window_start < ?", (cutoff_utc,))
+
+async def retention_loop(retention_days: int = RAW_RETENTION_DAYS):
+    """Раз в сутки чистит старые сырые строки (фоновая задача из main.py)."""
+    while True:
+        compact_raw_stats(retention_days)
+        await asyncio.sleep(24 * 3600)
+
 # --- Логирование использования нейросетей (Gemini) ---
 
 def log_model_request(chat_id: Optional[int], user_id: Optional[int], model_name: str, request_type: str):
     """
     Функция для записи статистики использования моделей нейросетей.
-    Вызывается из config.py.
+    Только ставит строку в очередь core.db_writer — запись пачкой в фоне.
     """
     try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        cursor.execute(
-            """INSERT INTO model_stats (chat_id, user_id, model_name, request_type) 
-               VALUES (?, ?, ?, ?)""",
-            (chat_id, user_id, model_name, request_type)
+        # UTC — как прежний DEFAULT CURRENT_TIMESTAMP
+        timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        stats_writer.submit(
+            """INSERT INTO model_stats (timestamp, chat_id, user_id, model_name, request_type) 
+               VALUES (?, ?, ?, ?, ?)""",
+            (timestamp, chat_id, user_id, model_name, request_type)
+        )
+        stats_writer.submit(
+            """INSERT INTO model_rollup (model_name, chat_id, hour, count) VALUES (?, ?, ?, 1)
+               ON CONFLICT(model_name, chat_id, hour) DO UPDATE SET count = count + 1""",
+            (model_name or "", chat_id or 0, timestamp[:13])
         )
-        conn.commit()
-        conn.close()
     except Exception as e:
         logging.error(f"Error logging model request: {e}")
 
@@ -83,40 +208,39 @@ def log_model_request(chat_id: Optional[int], user_id: Optional[int], model_name
 
 async def log_message(chat_id: int, user_id: int, message_type: str, is_private: bool,
                       chat_title: Optional[str], user_name: str, user_username: Optional[str]):
+    # без ожидания: строки запишет core.db_writer вместе с соседними
     try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        cursor.execute(
+        now = datetime.now()
+        stats_writer.submit(
             """INSERT INTO message_stats 
                (chat_id, user_id, message_timestamp, message_type, is_private, chat_title, user_name, user_username) 
                VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-            (chat_id, user_id, datetime.now(), message_type, is_private, chat_title, user_name, user_username)
+            (chat_id, user_id, now, message_type, is_private, chat_title, user_name, user_username)
+        )
+        stats_writer.submit(
+            """INSERT INTO message_rollup (chat_id, hour, message_type, is_private, count) VALUES (?, ?, ?, ?, 1)
+               ON CONFLICT(chat_id, hour, message_type) DO UPDATE SET count = count + 1""",
+            (chat_id, now.strftime(HOUR_FORMAT), message_type, is_private)
+        )
+        stats_writer.submit(
+            """INSERT INTO users (user_id, user_name, user_username) VALUES (?, ?, ?)
+               ON CONFLICT(user_id) DO UPDATE SET
+                   user_name = excluded.user_name, user_username = excluded.user_username""",
+            (user_id, user_name, user_username)
         )
-        conn.commit()
-        conn.close()
+        if not is_private:
+            stats_writer.submit(
+                """INSERT INTO chats (chat_id, chat_title, last_message_at) VALUES (?, ?, ?)
+                   ON CONFLICT(chat_id) DO UPDATE SET
+                       chat_title = excluded.chat_title, last_message_at = excluded.last_message_at""",
+                (chat_id, chat_title, now)
+            )
     except Exception as e:
         logging.error(f"Error logging message: {e}")
 
-# --- ВСПОМОГАТЕЛЬНОЕ: получение последнего имени пользователя ---
-
-def get_last_known_user_display(conn, user_id: int) -> str:
-    cursor = conn.cursor()
-    cursor.execute(
-        """
-        SELECT user_name, user_username
-        FROM message_stats
-        WHERE user_id = ?
-        ORDER BY message_timestamp DESC
-        LIMIT 1
-        """,
-        (user_id,)
-    )
-    row = cursor.fetchone()
-
-    if not row:
-        return f"User {user_id}"
+# --- ВСПОМОГАТЕЛЬНОЕ: отображаемое имя пользователя ---
 
-    name, username = row
+def format_user_display(user_id: int, name: Optional[str], username: Optional[str]) -> str:
     if username:
         return f"{name} (@{username})" if name else f"@{username}"
     if name:
@@ -124,101 +248,128 @@ def get_last_known_user_display(conn, user_id: int) -> str:
     return f"User {user_id}"
 
 # --- Получение статистики ---
+#
+# Окно [since, сейчас] = полные часы из сводок + хвост первого, неполного часа
+# из сырых строк (он всегда моложе RAW_RETENTION_DAYS). Без окна — только сводки.
+
+def _message_counts(cursor, is_private: bool, since: Optional[datetime]) -> Dict[int, int]:
+    """chat_id -> число сообщений (в ЛС chat_id совпадает с user_id)."""
+    if since is None:
+        cursor.execute(
+            "SELECT chat_id, SUM(count) FROM message_rollup WHERE is_private = ? GROUP BY chat_id",
+            (is_private,)
+        )
+        return dict(cursor.fetchall())
+    next_hour = since.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    cursor.execute("""
+        SELECT chat_id, SUM(total) FROM (
+            SELECT chat_id, SUM(count) AS total FROM message_rollup
+            WHERE is_private = ? AND hour >= ? GROUP BY chat_id
+            UNION ALL
+            SELECT chat_id, COUNT(*) FROM message_stats
+            WHERE is_private = ? AND message_timestamp >= ? AND message_timestamp < ? GROUP BY chat_id
+        ) GROUP BY chat_id
+    """, (is_private, next_hour.strftime(HOUR_FORMAT), is_private, since, next_hour))
+    return dict(cursor.fetchall())
+
+def _model_counts(cursor, since: Optional[datetime]) -> Dict[int, int]:
+    """chat_id (0 — неизвестен) -> число запросов к моделям. since — в UTC."""
+    if since is None:
+        cursor.execute("SELECT chat_id, SUM(count) FROM model_rollup GROUP BY chat_id")
+        return dict(cursor.fetchall())
+    next_hour = since.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    cursor.execute("""
+        SELECT chat_id, SUM(total) FROM (
+            SELECT chat_id, SUM(count) AS total FROM model_rollup
+            WHERE hour >= ? GROUP BY chat_id
+            UNION ALL
+            SELECT COALESCE(chat_id, 0), COUNT(*) FROM model_stats
+            WHERE timestamp >= ? AND timestamp < ? GROUP BY 1
+        ) GROUP BY chat_id
+    """, (
+        next_hour.strftime(HOUR_FORMAT),
+        since.strftime("%Y-%m-%d %H:%M:%S"),
+        next_hour.strftime("%Y-%m-%d %H:%M:%S"),
+    ))
+    return dict(cursor.fetchall())
 
 def get_stats(period_hours: Optional[int] = None) -> Dict[str, Dict]:
     conn = sqlite3.connect(DB_FILE)
     cursor = conn.cursor()
 
-    params = []
-    time_filter = ""
+    since = since_utc = None
     if period_hours is not None:
-        time_filter = "AND message_timestamp >= ?"
-        params.append(datetime.now() - timedelta(hours=period_hours))
-
-    # --- Группы ---
-    cursor.execute(f"""
-        SELECT COALESCE(chat_title, chat_id), COUNT(*)
-        FROM message_stats
-        WHERE is_private = 0 {time_filter}
-        GROUP BY COALESCE(chat_title, chat_id)
-        ORDER BY COUNT(*) DESC
-    """, params)
-
-    group_stats = {str(row[0]): row[1] for row in cursor.fetchall()}
-
-    # --- ЛС ---
-    cursor.execute(f"""
-        SELECT user_id, COUNT(*)
-        FROM message_stats
-        WHERE is_private = 1 {time_filter}
-        GROUP BY user_id
-        ORDER BY COUNT(*) DESC
-    """, params)
+        since = datetime.now() - timedelta(hours=period_hours)
+        since_utc = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(hours=period_hours)
+
+    group_counts = _message_counts(cursor, False, since)
+    private_counts = _message_counts(cursor, True, since)
+    model_counts = _model_counts(cursor, since_utc)
+    titles = dict(cursor.execute("SELECT chat_id, chat_title FROM chats"))
+
+    # --- Группы (названия — из справочника chats) ---
+    group_stats = {}
+    for chat_id, count in sorted(group_counts.items(), key=lambda item: item[1], reverse=True):
+        title = str(titles.get(chat_id) or chat_id)
+        group_stats[title] = group_stats.get(title, 0) + count
+
+    # --- ЛС (имена — из справочника users) ---
+    names = {}
+    if private_counts:
+        placeholders = ",".join("?" * len(private_counts))
+        cursor.execute(
+            f"SELECT user_id, user_name, user_username FROM users WHERE user_id IN ({placeholders})",
+            list(private_counts)
+        )
+        names = {user_id: (name, username) for user_id, name, username in cursor.fetchall()}
 
     private_stats = {}
-    for user_id, count in cursor.fetchall():
-        display = get_last_known_user_display(conn, user_id)
-        private_stats[display] = count
+    for user_id, count in sorted(private_counts.items(), key=lambda item: item[1], reverse=True):
+        name, username = names.get(user_id, (None, None))
+        private_stats[format_user_display(user_id, name, username)] = count
 
     # --- Статистика модели ---
-    model_time_filter = ""
-    model_params = []
-    if period_hours:
-        model_time_filter = "WHERE timestamp >= ?"
-        model_params.append(datetime.now() - timedelta(hours=period_hours))
-
-    cursor.execute(f"""
-        SELECT chat_id, COUNT(*)
-        FROM model_stats
-        {model_time_filter}
-        GROUP BY chat_id
-        ORDER BY COUNT(*) DESC
-    """, model_params)
-
     model_usage = {}
-    for chat_id, count in cursor.fetchall():
+    for chat_id, count in sorted(model_counts.items(), key=lambda item: item[1], reverse=True):
         if not chat_id:
             key = "Неизвестный чат / API"
         else:
-            cursor.execute(
-                "SELECT chat_title FROM message_stats WHERE chat_id = ? LIMIT 1",
-                (chat_id,)
-            )
-            res = cursor.fetchone()
-            key = res[0] if res and res[0] else f"ID: {chat_id}"
+            key = titles.get(chat_id) or f"ID: {chat_id}"
         model_usage[key] = count
 
     conn.close()
     return {
         "groups": group_stats,
         "private": private_stats,
-        "model_usage": model_usage
+        "model_usage": model_usage,
+        "writer": stats_writer.metrics()
     }
 
 async def get_total_messages():
-    return get_stats()
+    return await asyncio.to_thread(get_stats)
 
 async def get_messages_last_24_hours():
-    return get_stats(period_hours=24)
+    return await asyncio.to_thread(get_stats, 24)
 
 async def get_messages_last_hour():
-    return get_stats(period_hours=1)
+    return await asyncio.to_thread(get_stats, 1)
 
-async def get_activity_by_hour(period_hours: Optional[int] = None) -> Dict[int, int]:
+def _activity_by_hour(period_hours: Optional[int] = None) -> Dict[int, int]:
     conn = sqlite3.connect(DB_FILE)
     cursor = conn.cursor()
 
     params = []
     time_filter = ""
     if period_hours is not None:
-        time_filter = "WHERE message_timestamp >= ?"
-        params.append(datetime.now() - timedelta(hours=period_hours))
+        # с точностью до часа: сводки почасовые
+        time_filter = "WHERE hour >= ?"
+        params.append((datetime.now() - timedelta(hours=period_hours)).strftime(HOUR_FORMAT))
 
     cursor.execute(f"""
-        SELECT strftime('%H', message_timestamp), COUNT(*)
-        FROM message_stats
+        SELECT substr(hour, 12, 2), SUM(count)
+        FROM message_rollup
         {time_filter}
-        GROUP BY strftime('%H', message_timestamp)
+        GROUP BY substr(hour, 12, 2)
     """, params)
 
     data = {hour: 0 for hour in range(24)}
@@ -227,3 +378,6 @@ async def get_activity_by_hour(period_hours: Optional[int] = None) -> Dict[int,
 
     conn.close()
     return data
+
+async def get_activity_by_hour(period_hours: Optional[int] = None) -> Dict[int, int]:
+    return await asyncio.to_thread(_activity_by_hour, period_hours)
@@ -6,7 +6,6 @@ import logging
 import os
 import random
 import time
-import json
 import html
 import re
 from typing import Dict, Optional, Union
@@ -23,6 +22,8 @@ from aiogram.types import (
 
 # Импорт вашего бота из конфига
 from config import bot
+from core.bounded import TTLDict
+from core.json_store import JsonStateStore
 
 # ================== НАСТРОЙКИ ==================
 BOT_USERNAME = "expertyebaniebot"
@@ -47,8 +48,18 @@ BLANK_PNG_B64 = (
     "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mP8/x8AAwMCAO+ip1sAAAAASUVORK5CYII="
 )
 
+SESSION_TTL = 6 * 3600  # заброшенная игра забывается через 6 часов
+
+
+def _on_session_expired(cid: str, sess: dict):
+    task = sess.get("bump_task")
+    if task and isinstance(task, asyncio.Task) and not task.done():
+        task.cancel()
+    logging.info(f"[crocodile] session expired chat={cid}")
+
+
 # chat_id(str) -> session dict
-game_sessions: dict[str, dict] = {}
+game_sessions: TTLDict = TTLDict(SESSION_TTL, name="crocodile_sessions", on_evict=_on_session_expired)
 
 # chat_id(str) -> { user_id(str): {"pts": int, "name": str} }
 _scores: Dict[str, Dict[str, dict]] = {}
@@ -103,14 +114,13 @@ def _normalize_guess(s: str) -> str:
     return " ".join(s.strip().lower().split())
 
 
+_scores_store = JsonStateStore(SCORES_FILE, lambda: _scores, indent=2)
+
+
 def _scores_load():
     global _scores
     try:
-        if os.path.exists(SCORES_FILE):
-            with open(SCORES_FILE, "r", encoding="utf-8") as f:
-                raw = json.load(f)
-        else:
-            raw = {}
+        raw = _scores_store.read({})
         normalized: Dict[str, Dict[str, dict]] = {}
         for cid, table in (raw or {}).items():
             normalized[str(cid)] = {}
@@ -131,11 +141,8 @@ def _scores_load():
 
 
 def _scores_save():
-    try:
-        with open(SCORES_FILE, "w", encoding="utf-8") as f:
-            json.dump(_scores, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        logging.error(f"[scores] save failed: {e}", exc_info=True)
+    # запись отложенная: очки за серию угадываний уходят на диск одной записью
+    _scores_store.mark_dirty()
 
 
 def add_point(chat_id: str, user_id: int, user_name: str = ""):
@@ -16,9 +16,12 @@ from config import (
 from prompts import actions
 from features.stat_rank_settings import get_user_statistics, generate_chat_stats_report
 from features.lexicon_settings import (
-    process_my_lexicon, process_chat_lexicon, process_user_lexicon
+    process_my_lexicon, process_chat_lexicon, process_user_lexicon, process_lexicon_rebuild
 )
 import features.statistics as bot_statistics
+from core import bounded
+from core.model_health import format_report as format_health_report, model_health
+from core.model_telemetry import format_report, model_telemetry
 
 router = Router(name="stats_lexicon")
 
@@ -49,6 +52,13 @@ def format_stats_message(stats: Dict[str, Dict], title: str) -> str:
     else:
         parts.append("\n_Нет активности в личных сообщениях._")
 
+    writer = stats.get("writer")
+    if writer:
+        parts.append(
+            f"\n🗄 Очередь записи: {writer['depth']}, "
+            f"последняя пачка {writer['last_flush_ms']} мс (макс. {writer['max_flush_ms']} мс)"
+        )
+
     return "\n".join(parts)
 
 @router.message(F.text.lower() == "стотистика", F.from_user.id == ADMIN_ID)
@@ -69,6 +79,16 @@ async def cmd_stats_1h(message: Message):
     reply_text = format_stats_message(stats_data, "Статистика за час")
     await message.answer(reply_text, parse_mode="Markdown")
 
+@router.message(F.text.lower() == "телеметрия", F.from_user.id == ADMIN_ID)
+async def cmd_model_telemetry(message: Message):
+    report = format_report(model_telemetry.snapshot())
+    health = format_health_report(model_health.snapshot())
+    await message.answer(f"{report}\n\n{health}" if health else report)
+
+@router.message(F.text.lower() == "память", F.from_user.id == ADMIN_ID)
+async def cmd_runtime_memory(message: Message):
+    await message.answer(bounded.format_report(bounded.report()))
+
 @router.message(F.text.lower() == "моя статистика")
 async def show_personal_stats(message: types.Message):
     random_action = random.choice(actions)
@@ -100,7 +120,12 @@ async def handle_chat_lexicon(message: types.Message):
     await message.bot.send_chat_action(chat_id=message.chat.id, action=random_action)
     response_text = await process_chat_lexicon(message)
     await message.reply(response_text)
-    
+
+# ВАЖНО: до "лексикон <имя>", иначе команда уйдёт в поиск пользователя "пересобрать"
+@router.message(F.text.lower() == "лексикон пересобрать", F.from_user.id == ADMIN_ID)
+async def handle_lexicon_rebuild(message: types.Message):
+    await process_lexicon_rebuild(message)
+
 @router.message(lambda message: message.text and message.text.lower().startswith("лексикон "))
 async def handle_user_lexicon(message: types.Message):
     random_action = random.choice(actions)
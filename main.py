@@ -10,11 +10,19 @@ from aiogram.client.session.aiohttp import AiohttpSession
 
 from core.loader import bot, dp
 from core.logging_setup import logger  # noqa: F401 (инициализирует логирование)
+from core.ai_clients import openrouter_ai, siliconflow_ai
 from core.middlewares import IncomingMessageLogMiddleware
+from core.db_writer import stats_writer
+from core.message_counters import message_counters
+from core.model_telemetry import model_telemetry
+from core.message_log import message_log
+from core.lexicon_index import lexicon_index
+from core import json_store
 from features.content_filter import ContentFilterMiddleware, load_antispam_settings
 from features.statistics import PrivateRateLimitMiddleware
 import features.statistics as bot_statistics
 
+from AI import gigachat_client
 from AI.dnd import dnd_router
 from AI.quiz import schedule_daily_quiz
 from AI.birthday_calendar import birthday_scheduler
@@ -37,11 +45,29 @@ for r in ROUTERS:
 
 
 async def main():
+    # JSON-состояние (chat_settings.json и др.) пишется отложенно через этот цикл
+    json_store.bind_loop()
+
     # --- антиспам ---
     load_antispam_settings()
 
     # --- статистика ---
     bot_statistics.init_db()
+    asyncio.create_task(bot_statistics.retention_loop())
+    # телеметрия моделей: минутные окна -> statistics.db
+    asyncio.create_task(model_telemetry.run())
+    # токены GigaChat обновляются заранее, запросы не ждут OAuth
+    asyncio.create_task(gigachat_client.run_token_refresher())
+    # счётчики рангов пишутся на диск пачками (и ещё раз — при остановке, см. ниже)
+    asyncio.create_task(message_counters.run())
+    # счётчики лексикона: раз в сутки выбрасываются редкие фразы
+    asyncio.create_task(lexicon_index.compact_loop())
+
+    # --- лог сообщений: разовая раскладка старого user_messages.log по шардам чатов ---
+    # ВАЖНО: до старта polling, иначе новые сообщения лягут в шарды раньше старых
+    await asyncio.to_thread(message_log.migrate_legacy)
+    # прошлые месяцы — в сжатый архив (дальше сегменты закрываются сами при записи)
+    await asyncio.to_thread(message_log.archive_old)
 
     # --- планировщики викторин ---
     chat_ids = ['-1001707530786', '-1001781970364']
@@ -84,7 +110,16 @@ async def main():
 
     # стартуем polling (БЛОКИРУЮЩИЙ)
     print("MAIN BOT ID:", id(bot))
-    await dp.start_polling(bot, skip_updates=True)
+    try:
+        await dp.start_polling(bot, skip_updates=True)
+    finally:
+        await message_counters.flush()
+        await json_store.flush_all()
+        await gigachat_client.close_clients()
+        await openrouter_ai.aclose()
+        await siliconflow_ai.aclose()
+        model_telemetry.rotate()
+        await asyncio.to_thread(stats_writer.flush, 5)
 
 
 if __name__ == "__main__":
@@ -1,3 +1,4 @@
+import asyncio
 import random
 import logging
 import os
@@ -5,7 +6,7 @@ import re
 import httpx
 from aiogram.types import BufferedInputFile, Message
 from config import chat_settings
-import config
+from core.message_log import message_log
 
 # Кэш шаблонов для производительности
 _templates_cache = []
@@ -47,36 +48,25 @@ def get_context_text(chat_id: int, reply_text: str = None) -> str:
     if reply_text:
         return reply_text
 
-    log_path = config.LOG_FILE
-    if not os.path.exists(log_path):
+    if not os.path.exists(message_log.shard_path(chat_id)):
         return "Когда логи пусты, как мой кошелек"
 
     try:
         messages = []
-        chat_id_str = str(chat_id)
-        
-        with open(log_path, "r", encoding="utf-8") as f:
-            # Читаем хвост файла, но обрабатываем аккуратно
-            lines = f.readlines()
-            # Берем последние 1000 строк для большего выбора
-            target_lines = lines[-1000:] if len(lines) > 1000 else lines
-            
-            for line in reversed(target_lines):
-                # Проверяем наличие Chat ID в строке
-                if chat_id_str in line:
-                    # Универсальная регулярка, как в history_engine
-                    # Ищем текст после последнего закрытия квадратной скобки или двоеточия
-                    match = re.search(r"\]:\s*(.*)$", line)
-                    if match:
-                        txt = match.group(1).strip()
-                        # Игнорируем команды, короткие фразы и системные сообщения
-                        if txt and not txt.startswith("/") and len(txt) > 3:
-                            # Убираем сообщения, где упоминается сам мем
-                            if not any(x in txt.lower() for x in ["мем", "meme"]):
-                                messages.append(txt)
-                
-                if len(messages) >= 50: 
-                    break
+
+        # Берем последние 1000 сообщений чата для большего выбора (шард читается с конца)
+        for scanned, record in enumerate(message_log.iter_chat(chat_id, reverse=True)):
+            if scanned >= 1000:
+                break
+            txt = record.text.strip()
+            # Игнорируем команды, короткие фразы и системные сообщения
+            if txt and not txt.startswith("/") and len(txt) > 3:
+                # Убираем сообщения, где упоминается сам мем
+                if not any(x in txt.lower() for x in ["мем", "meme"]):
+                    messages.append(txt)
+
+            if len(messages) >= 50:
+                break
         
         if messages:
             return random.choice(messages)
@@ -88,7 +78,7 @@ def get_context_text(chat_id: int, reply_text: str = None) -> str:
 
 async def create_meme_image(chat_id: int, reply_text: str = None) -> BufferedInputFile | None:
     """Формирует URL мема, скачивает его и возвращает файл"""
-    source_text = get_context_text(chat_id, reply_text)
+    source_text = await asyncio.to_thread(get_context_text, chat_id, reply_text)
     templates = await get_all_templates()
     template = random.choice(templates)
     tid = template.get("id", "drake")
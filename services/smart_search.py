@@ -1,113 +1,193 @@
+import asyncio
+import hashlib
 import logging
+import os
+import weakref
 import numpy as np
 from core.ai_clients import gemini_client
+from core.bounded import LRUDict
+from core.state import EMBEDDINGS_DIR
 from config import model  # Используем настройку из конфига
 
 # Если в config.py нет переменной EMBEDDING_MODEL, используем дефолтную
 EMBEDDING_MODEL_NAME = 'models/text-embedding-004'
 
-def get_embedding(text: str):
-    """
-    Превращает текст в вектор чисел.
-    """
-    try:
-        # Используем genai напрямую, так как обертка model может не поддерживать embed_content
-        result = gemini_client.models.embed_content(
-            model=EMBEDDING_MODEL_NAME,
-            contents=text,
-            config={"task_type": "RETRIEVAL_DOCUMENT", "title": "User Message"},
-        )
-        return result.embeddings[0].values
-    except Exception as e:
-        logging.error(f"Ошибка получения эмбеддинга: {e}")
-        return None
+EMBED_BATCH = 100       # сообщений в одном запросе embed_content (лимит batchEmbedContents)
+MIN_SCORE = 0.35        # совсем непохожее не тащим в промпт
+MAX_ENTRIES = 32        # матриц (чат, участник) в памяти; давно не нужные вытесняются
+
+
+def message_hash(text: str) -> int:
+    """Ключ эмбеддинга: 64-битный хэш текста сообщения."""
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _embed_documents(texts: list) -> np.ndarray:
+    """Эмбеддинги пачки сообщений одним запросом: матрица float32, строки нормированы."""
+    result = gemini_client.models.embed_content(
+        model=EMBEDDING_MODEL_NAME,
+        contents=texts,
+        config={"task_type": "RETRIEVAL_DOCUMENT"},
+    )
+    return _normalize(np.array([e.values for e in result.embeddings], dtype=np.float32))
+
 
-def cosine_similarity(v1, v2):
+def _embed_query(text: str) -> np.ndarray:
+    result = gemini_client.models.embed_content(
+        model=EMBEDDING_MODEL_NAME,
+        contents=text,
+        config={"task_type": "RETRIEVAL_QUERY"},
+    )
+    return _normalize(np.array(result.embeddings[0].values, dtype=np.float32))
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class EmbeddingStore:
     """
-    Считает, насколько похожи два вектора (от -1 до 1).
+    Эмбеддинги сообщений по (чат, участник): непрерывная матрица float32 с
+    нормированными строками + массив хэшей сообщений. Лежит на диске
+    (embeddings/<chat_id>/<ключ участника>.npz), в памяти — последние MAX_ENTRIES
+    использованных. Досчитываются только сообщения, которых ещё нет, пачками в фоне;
+    дописывание одного ключа идёт по очереди (asyncio.Lock на ключ).
     """
-    if v1 is None or v2 is None:
-        return 0.0
-    # Превращаем в numpy массивы
-    v1 = np.array(v1)
-    v2 = np.array(v2)
-    
-    norm1 = np.linalg.norm(v1)
-    norm2 = np.linalg.norm(v2)
-    
-    if norm1 == 0 or norm2 == 0:
-        return 0.0
-        
-    return np.dot(v1, v2) / (norm1 * norm2)
-
-async def find_relevant_context(query_text: str, candidate_messages: list, top_k: int = 3):
+
+    def __init__(self, root: str = EMBEDDINGS_DIR):
+        self.root = root
+        self._entries: LRUDict = LRUDict(MAX_ENTRIES, name="smart_search_embeddings")
+        self._tasks: dict[tuple, asyncio.Task] = {}
+        self._locks: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+
+    def _lock(self, key: tuple) -> asyncio.Lock:
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        return lock
+
+    def _path(self, key: tuple) -> str:
+        chat_id, user_key = key
+        name = hashlib.sha1(user_key.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.root, chat_id, f"{name}.npz")
+
+    def _load(self, key: tuple) -> tuple[np.ndarray, np.ndarray]:
+        path = self._path(key)
+        if os.path.exists(path):
+            try:
+                with np.load(path) as data:
+                    return data["hashes"], data["vectors"]
+            except Exception as e:
+                logging.error(f"[smart_search] битый файл эмбеддингов {path}: {e}")
+        return np.empty(0, dtype=np.uint64), np.empty((0, 0), dtype=np.float32)
+
+    def _save(self, key: tuple, hashes: np.ndarray, vectors: np.ndarray):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, hashes=hashes, vectors=vectors)
+        os.replace(tmp_path, path)
+
+    async def entry(self, key: tuple) -> tuple[np.ndarray, np.ndarray]:
+        cached = self._entries.get(key)
+        if cached is not None:
+            return cached
+        loaded = await asyncio.to_thread(self._load, key)
+        # пока читали файл, add_batch мог положить более свежую матрицу — она главнее
+        return self._entries.setdefault(key, loaded)
+
+    async def add_batch(self, key: tuple, texts: list):
+        """Эмбеддит пачку сообщений, дописывает в матрицу и сохраняет на диск."""
+        async with self._lock(key):
+            hashes, matrix = await self.entry(key)
+            known = set(hashes.tolist())
+            texts = [t for t in texts if message_hash(t) not in known]
+            if not texts:
+                return
+            vectors = await asyncio.to_thread(_embed_documents, texts)
+            new_hashes = np.array([message_hash(t) for t in texts], dtype=np.uint64)
+            if matrix.size:
+                matrix = np.vstack([matrix, vectors])
+            else:
+                matrix = vectors
+            hashes = np.concatenate([hashes, new_hashes])
+            self._entries[key] = (hashes, matrix)
+            await asyncio.to_thread(self._save, key, hashes, matrix)
+
+    async def _fill(self, key: tuple, texts: list):
+        try:
+            for i in range(0, len(texts), EMBED_BATCH):
+                await self.add_batch(key, texts[i:i + EMBED_BATCH])
+        except Exception as e:
+            logging.warning(f"[smart_search] фоновый расчёт эмбеддингов прерван: {e}")
+        finally:
+            self._tasks.pop(key, None)
+
+    def schedule(self, key: tuple, texts: list):
+        """Досчитывает эмбеддинги в фоне (не больше одной задачи на ключ)."""
+        if texts and key not in self._tasks:
+            self._tasks[key] = asyncio.create_task(self._fill(key, texts))
+
+
+embedding_store = EmbeddingStore()
+
+
+async def find_relevant_context(query_text: str, candidate_messages: list, top_k: int = 3,
+                                chat_id=None, user_key: str = ""):
     """
     Ищет в списке сообщений (candidate_messages) те, что по смыслу близки к query_text.
-    
+
+    Эмбеддинги сообщений берутся из embedding_store (chat_id, user_key), поиск —
+    одно умножение матрицы на вектор запроса по всей истории. На ответ тратится
+    один запрос к API (вектор запроса); новые сообщения эмбеддятся в фоне.
+
     :param query_text: Текст входящего сообщения (на что отвечаем)
     :param candidate_messages: Список строк (история сообщений пародируемого)
     :param top_k: Сколько примеров вернуть
+    :param chat_id, user_key: чей это корпус — ключ хранилища эмбеддингов
     """
     if not candidate_messages or not query_text:
         return []
 
-    # 1. Получаем вектор запроса
+    key = (str(chat_id), user_key)
+    by_hash = {}
+    for msg in candidate_messages:
+        if msg and msg.strip():
+            by_hash[message_hash(msg)] = msg
+    if not by_hash:
+        return []
+
+    hashes, _matrix = await embedding_store.entry(key)
+    known = set(hashes.tolist())
+    # свежие — первыми: они важнее и посчитаются раньше
+    missing = [msg for h, msg in reversed(by_hash.items()) if h not in known]
+    if missing and len(known) == 0:
+        # первый раз: ждём одну пачку, иначе отвечать будет не из чего
+        try:
+            await embedding_store.add_batch(key, missing[:EMBED_BATCH])
+        except Exception as e:
+            logging.error(f"Не удалось получить эмбеддинги сообщений: {e}")
+            return []
+        missing = missing[EMBED_BATCH:]
+    embedding_store.schedule(key, missing)
+
     try:
-        query_embedding = gemini_client.models.embed_content(
-            model=EMBEDDING_MODEL_NAME,
-            contents=query_text,
-            config={"task_type": "RETRIEVAL_QUERY"},
-        ).embeddings[0].values
+        query_vector = await asyncio.to_thread(_embed_query, query_text)
     except Exception as e:
         logging.error(f"Не удалось получить вектор запроса: {e}")
         return []
 
-    # 2. Оптимизация: чтобы не тратить квоты, берем не всю историю, 
-    # а последние 100 сообщений + 50 случайных из глубины, если история большая
-    # Но для качества лучше прогнать хотя бы 100-200 кандидатов.
-    candidates_to_check = candidate_messages[-200:] # Берем последние 200 для контекста
-    
-    # 3. Получаем эмбеддинги для кандидатов (Batching)
-    # API Gemini позволяет отправлять батчи, но для простоты пройдемся циклом или батчем
-    # Если сообщений много, это может занять время.
-    
-    scored_messages = []
-    
-    # Группируем запросы (Batching) для ускорения, если библиотека поддерживает, 
-    # но пока сделаем простой перебор для надежности
-    
-    # Ограничиваем количество запросов к API
-    limit = 30 
-    search_pool = candidates_to_check[-limit:] # Берем только последние 30 для скорости реал-тайма
-    
-    try:
-        # Получаем эмбеддинги пачкой (поддерживается в новых версиях SDK)
-        batch_embeddings = [
-            e.values
-            for e in gemini_client.models.embed_content(
-                model=EMBEDDING_MODEL_NAME,
-                contents=search_pool,
-                config={"task_type": "RETRIEVAL_DOCUMENT"},
-            ).embeddings
-        ]
-        
-        for i, msg in enumerate(search_pool):
-            score = cosine_similarity(query_embedding, batch_embeddings[i])
-            scored_messages.append((score, msg))
-            
-    except Exception as e:
-        logging.warning(f"Batch embedding failed, fallback to single: {e}")
-        # Если батч не прошел, пробуем по одному (медленнее)
-        for msg in search_pool:
-            emb = get_embedding(msg)
-            score = cosine_similarity(query_embedding, emb)
-            scored_messages.append((score, msg))
-
-    # Сортируем по похожести (от большего к меньшему)
-    scored_messages.sort(key=lambda x: x[0], reverse=True)
-    
-    # Возвращаем только тексты топ-K
-    # Фильтруем совсем непохожие (порог 0.4 например), чтобы не тянуть мусор
-    result = [msg for score, msg in scored_messages[:top_k] if score > 0.35]
-    
-    return result
+    hashes, matrix = await embedding_store.entry(key)
+    if not matrix.size:
+        return []
+    # косинус = скалярное произведение нормированных векторов; чужие/удалённые строки отсекаем
+    scores = matrix @ query_vector
+    scores[~np.isin(hashes, np.fromiter(by_hash, dtype=np.uint64, count=len(by_hash)))] = -np.inf
+
+    k = min(top_k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+    return [by_hash[int(hashes[i])] for i in top if scores[i] > MIN_SCORE]
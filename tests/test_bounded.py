@@ -0,0 +1,81 @@
+from collections import deque
+
+from core import bounded
+from core.bounded import LRUDict, TTLDict
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_evicts_least_recently_used():
+    evicted = []
+    cache = LRUDict(3, on_evict=lambda k, v: evicted.append(k))
+    for key in "abc":
+        cache[key] = key.upper()
+    assert cache["a"] == "A"      # "a" теперь свежий
+    cache["d"] = "D"
+    assert list(cache) == ["c", "a", "d"] and evicted == ["b"]
+    assert cache.evicted == 1
+    assert cache.setdefault("e", []) == [] and "c" not in cache
+
+
+def test_ttl_expires_without_scanning_and_refreshes_on_access():
+    clock = FakeClock()
+    expired = []
+    cache = TTLDict(10, refresh_on_access=True, clock=clock, on_evict=lambda k, v: expired.append(k))
+    cache["a"] = 1
+    cache["b"] = 2
+    clock.now = 8
+    assert cache["a"] == 1        # "a" продлён до 18
+    clock.now = 12
+    assert "b" not in cache and cache.get("a") == 1
+    assert expired == ["b"] and cache.expired == 1
+    clock.now = 40
+    assert len(cache) == 0 and expired == ["b", "a"]
+
+    # del не зовёт on_evict, устаревший узел кучи не снимает новую запись
+    cache["c"] = 3
+    del cache["c"]
+    cache["c"] = 4
+    clock.now = 45
+    assert cache["c"] == 4 and expired == ["b", "a"]
+
+
+def test_iteration_does_not_refresh_or_reorder():
+    clock = FakeClock()
+    cache = TTLDict(10, max_size=2, refresh_on_access=True, clock=clock)
+    cache["a"] = 1
+    cache["b"] = 2
+    clock.now = 8
+    assert list(cache) == ["a", "b"]
+    assert cache.items() == [("a", 1), ("b", 2)] and cache.values() == [1, 2]
+    cache["c"] = 3                # перебор не освежил "a" — вытесняется он
+    assert list(cache) == ["b", "c"]
+    clock.now = 12
+    assert cache.items() == [("c", 3)]
+
+
+def test_ttl_heap_stays_bounded_under_hot_key_refresh():
+    clock = FakeClock()
+    cache = TTLDict(100, refresh_on_access=True, clock=clock)
+    cache["hot"] = 1
+    for i in range(10_000):
+        clock.now = i * 0.001
+        cache["hot"]
+    assert len(cache._heap) <= 2 * len(cache) + 65
+
+
+def test_report_lists_named_containers_with_size():
+    clock = FakeClock()
+    cache = TTLDict(60, max_size=10, name="test_report_cache", clock=clock)
+    for i in range(5):
+        cache[str(i)] = deque((f"сообщение {j} " * 10 for j in range(12)), maxlen=12)
+    row = next(r for r in bounded.report() if r["name"] == "test_report_cache")
+    assert row["entries"] == 5 and row["max_size"] == 10 and row["ttl"] == 60
+    assert row["bytes"] > 5 * 12 * 100
+    assert "test_report_cache: 5 зап." in bounded.format_report([row])
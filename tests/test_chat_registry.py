@@ -0,0 +1,71 @@
+import asyncio
+import json
+
+from tests import test_smoke_imports  # noqa: F401  (env + моки)
+from core.chat_registry import ChatRegistry
+
+SPECIAL = -100
+
+
+def _registry(tmp_path, chats=None, save_delay=0.05):
+    return ChatRegistry(chats if chats is not None else [], path=str(tmp_path / "chats.json"),
+                        special_chat_id=SPECIAL, save_delay=save_delay)
+
+
+def test_load_sorts_special_first_and_drops_duplicates(tmp_path):
+    (tmp_path / "chats.json").write_text(json.dumps([
+        {"id": -1, "title": "Первый", "username": None},
+        {"id": SPECIAL, "title": "Особый", "username": None},
+        {"id": -1, "title": "Дубль", "username": None},
+        {"id": 5, "title": None, "username": None},
+    ]), encoding="utf-8")
+    shared = []
+    registry = _registry(tmp_path, shared)
+    registry.load()
+
+    assert [chat["id"] for chat in shared] == [SPECIAL, -1, 5]
+    assert registry.get(-1)["title"] == "Первый"
+    assert [chat["id"] for chat in registry.titled()] == [SPECIAL, -1]
+    assert registry.store.writes == 0
+
+
+def test_known_chat_is_a_noop_and_changes_are_detected(tmp_path):
+    shared = []
+    registry = _registry(tmp_path, shared)
+    assert registry.upsert(-1, "Чат", None) is True
+    assert registry.upsert(SPECIAL, "Особый", "") is True
+    writes = registry.store.writes
+    view = registry.titled()
+
+    assert registry.upsert(-1, "Чат", None) is False
+    assert registry.titled() is view   # вид не пересчитывается без изменений
+    assert registry.store.writes == writes
+
+    assert registry.upsert(-1, "Новое название", "chat") is True
+    assert [chat["id"] for chat in shared] == [SPECIAL, -1]
+    assert shared[1] == {"id": -1, "title": "Новое название", "username": "chat"}
+    saved = json.loads((tmp_path / "chats.json").read_text(encoding="utf-8"))
+    assert saved[1]["title"] == "Новое название"
+
+    assert registry.remove(-1) is True
+    assert registry.remove(-1) is False
+    assert -1 not in registry and len(shared) == 1
+
+
+def test_changes_inside_event_loop_are_coalesced_into_one_write(tmp_path):
+    registry = _registry(tmp_path)
+
+    async def scenario():
+        for i in range(50):
+            registry.upsert(-i - 1, f"Чат {i}")
+        assert registry.store.writes == 0
+        await asyncio.sleep(0.3)
+        assert registry.store.writes == 1
+        registry.upsert(-1, "Переименован")
+        await registry.flush()
+
+    asyncio.run(scenario())
+    saved = json.loads((tmp_path / "chats.json").read_text(encoding="utf-8"))
+    assert registry.store.writes == 2
+    assert len(saved) == 50 and saved[0]["title"] == "Переименован"
+    assert not (tmp_path / "chats.json.tmp").exists()
@@ -0,0 +1,63 @@
+import asyncio
+import json
+import sqlite3
+
+from core.chat_settings_db import SQLiteChatSettings
+
+
+def _rows(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return {chat_id: json.loads(data) for chat_id, data in conn.execute("SELECT chat_id, data FROM chat_settings")}
+    finally:
+        conn.close()
+
+
+def test_first_start_imports_json_and_reads_rows_lazily(tmp_path):
+    json_path = tmp_path / "chat_settings.json"
+    json_path.write_text(json.dumps({"-1": {"active_model": "gemini"}, "-2": {"dialog_enabled": True}}), encoding="utf-8")
+    settings = SQLiteChatSettings(str(tmp_path / "settings.db"))
+    settings.load(json_path=str(json_path))
+
+    assert len(settings) == 2 and settings.rows_read == 0
+    assert -1 in settings and "-2" in settings and "-3" not in settings
+    assert settings[-1] == {"active_model": "gemini"}
+    assert settings.get("-3") is None
+    assert settings.rows_read == 1
+
+    # повторный старт не импортирует JSON заново
+    json_path.write_text(json.dumps({"-9": {}}), encoding="utf-8")
+    again = SQLiteChatSettings(str(tmp_path / "settings.db"))
+    again.load(json_path=str(json_path))
+    assert sorted(again) == ["-1", "-2"]
+
+
+def test_toggle_rewrites_only_the_changed_row(tmp_path):
+    db_path = str(tmp_path / "settings.db")
+    settings = SQLiteChatSettings(db_path, interval=0.05)
+    settings.load()
+
+    async def scenario():
+        for i in range(10):
+            settings.setdefault(f"-{i}", {})["active_model"] = "gemini"
+        settings.mark_dirty()
+        await asyncio.sleep(0.2)
+        assert settings.rows_written == 10
+
+        settings["-3"]["dialog_enabled"] = False
+        settings.mark_dirty()
+        settings["-4"]["dialog_enabled"] = False   # изменение в том же интервале — та же запись
+        settings.mark_dirty()
+        del settings["-5"]
+        settings.mark_dirty()
+        await asyncio.sleep(0.2)
+
+        settings.mark_dirty()   # ничего не менялось — писать нечего
+        await settings.aflush()
+
+    asyncio.run(scenario())
+    assert settings.rows_written == 13 and settings.writes == 2
+    rows = _rows(db_path)
+    assert len(rows) == 9 and "-5" not in rows
+    assert rows["-3"] == {"active_model": "gemini", "dialog_enabled": False}
+    assert rows["-0"] == {"active_model": "gemini"}
@@ -0,0 +1,41 @@
+import sqlite3
+
+from core import db_writer
+
+
+def test_writer_batches_rows_and_flush_waits(tmp_path):
+    db_path = str(tmp_path / "statistics.db")
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE t (a INTEGER, b TEXT)")
+    conn.execute("CREATE TABLE u (a INTEGER)")
+    conn.close()
+
+    writer = db_writer.SQLiteWriter(db_path, batch_rows=50, batch_interval=0.05)
+    for i in range(120):
+        writer.submit("INSERT INTO t (a, b) VALUES (?, ?)", (i, f"строка {i}"))
+        if i % 40 == 0:
+            writer.submit("INSERT INTO u (a) VALUES (?)", (i,))
+    assert writer.flush(timeout=5)
+
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT COUNT(*), SUM(a) FROM t").fetchone() == (120, sum(range(120)))
+    assert conn.execute("SELECT a FROM u ORDER BY a").fetchall() == [(0,), (40,), (80,)]
+    assert conn.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+
+    metrics = writer.metrics()
+    assert metrics["rows"] == 123 and metrics["depth"] == 0 and metrics["errors"] == 0
+    assert 3 <= metrics["batches"] < 123  # пачками, а не по строке
+
+
+def test_bad_batch_is_logged_and_writer_survives(tmp_path):
+    db_path = str(tmp_path / "statistics.db")
+    sqlite3.connect(db_path).execute("CREATE TABLE t (a INTEGER)").connection.close()
+
+    writer = db_writer.SQLiteWriter(db_path, batch_interval=0.01)
+    writer.submit("INSERT INTO missing (a) VALUES (?)", (1,))
+    assert writer.flush(timeout=5)
+    writer.submit("INSERT INTO t (a) VALUES (?)", (2,))
+    assert writer.flush(timeout=5)
+
+    assert writer.errors == 1
+    assert sqlite3.connect(db_path).execute("SELECT a FROM t").fetchall() == [(2,)]
@@ -0,0 +1,61 @@
+import asyncio
+from types import SimpleNamespace
+
+from core import display_names as dn
+
+
+def _user(user_id, first_name=None, last_name=None, username=None):
+    return SimpleNamespace(id=user_id, first_name=first_name, last_name=last_name, username=username)
+
+
+class FakeBot:
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+
+    async def get_chat_member(self, chat_id, user_id):
+        self.calls.append(user_id)
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(self.delay)
+        self.active -= 1
+        if user_id == 13:
+            raise RuntimeError("user not found")
+        return SimpleNamespace(user=_user(user_id, first_name=f"Юзер{user_id}"))
+
+
+def test_cached_names_skip_telegram_and_misses_are_fetched_concurrently():
+    cache = dn.DisplayNameCache()
+    cache.note_user(_user(1, "Вася", "Пупкин"))
+    cache.note_user(_user(2, username="petya"))
+    bot = FakeBot()
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        names = await cache.resolve_many(bot, -100, [1, 2, *range(10, 16)], concurrency=4)
+        return names, loop.time() - started
+
+    names, elapsed = asyncio.run(run())
+    assert names[1] == "Вася Пупкин" and names[2] == "@petya"
+    assert names[10] == "Юзер10" and names[13] == "Пользователь 13"
+    assert sorted(bot.calls) == list(range(10, 16))
+    assert bot.max_active == 4
+    assert elapsed < 6 * bot.delay  # две волны, а не шесть запросов подряд
+
+    bot.calls.clear()
+    asyncio.run(cache.resolve_many(bot, -100, [10, 11]))
+    assert bot.calls == []  # удачные ответы закэшированы
+
+
+def test_entries_expire_and_size_is_bounded():
+    now = [1000.0]
+    cache = dn.DisplayNameCache(ttl=60, max_size=2, clock=lambda: now[0])
+    cache.put(1, "раз")
+    cache.put(2, "два")
+    cache.put(3, "три")
+    assert cache.get(1) is None and cache.get(3) == "три"
+    now[0] += 61
+    assert cache.get(2) is None
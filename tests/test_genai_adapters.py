@@ -3,6 +3,8 @@
 Проверяют конверсию легаси-форматов старого SDK (google.generativeai)
 в формат нового (google-genai) без обращения к реальному API.
 """
+import asyncio
+
 from tests import test_smoke_imports  # noqa: F401  (env + моки)
 
 from google.genai import types as genai_types
@@ -14,6 +16,8 @@ from AI.wrapper import (
     _normalize_contents,
     _normalize_history,
 )
+from core.model_health import ModelHealth
+from core.rate_limiter import RateLimiter
 
 
 def test_legacy_blob_becomes_part():
@@ -90,6 +94,59 @@ def test_gemini_model_routes_to_client():
     assert calls["config"].temperature == 0.5
 
 
+def test_gemini_model_async_routes_to_aio_client():
+    """agenerate_content идёт в client.aio.models — без потока пула."""
+    calls = {}
+
+    class FakeAioModels:
+        async def generate_content(self, *, model, contents, config):
+            calls.update(model=model, contents=contents, config=config)
+            return "async response"
+
+    class FakeClient:
+        class aio:
+            models = FakeAioModels()
+
+    m = GeminiModel(FakeClient(), "gemini-2.5-flash")
+    result = asyncio.run(m.agenerate_content("текст", generation_config={"temperature": 0.3}))
+    assert result == "async response"
+    assert calls["contents"] == "текст"
+    assert calls["config"].temperature == 0.3
+
+
+def test_async_fallback_moves_to_next_key_without_sleeping(monkeypatch):
+    """429 на первом ключе: без пауз сразу следующий ключ, первый остывает."""
+    attempts = []
+
+    class FlakyModel:
+        def __init__(self, api_key):
+            self.api_key = api_key
+
+        async def agenerate_content(self, prompt, **kwargs):
+            attempts.append(self.api_key)
+            if self.api_key == "key_a":
+                raise RuntimeError("429 RESOURCE_EXHAUSTED")
+            return type("Response", (), {"text": "ок", "candidates": []})()
+
+    class FakeWrapper(ModelFallbackWrapper):
+        def _build_model(self, api_key, model_name):
+            return FlakyModel(api_key)
+
+    async def no_sleep(delay):
+        raise AssertionError("asyncio.sleep in fallback path")
+
+    health = ModelHealth()
+    monkeypatch.setattr("AI.wrapper.model_health", health)
+    monkeypatch.setattr("AI.wrapper.rate_limiter", RateLimiter())
+    monkeypatch.setattr("core.rate_limiter.asyncio.sleep", no_sleep)
+
+    wrapper = FakeWrapper(["gemini-flaky"], ["gemini-flaky"], keys_pool=["key_a", "key_b"])
+    response = asyncio.run(wrapper.agenerate_content("привет", require_text=True))
+    assert response.text == "ок"
+    assert attempts == ["key_a", "key_b"]
+    assert health.cooldown_left("gemini", "gemini-flaky", 0) > 0
+
+
 def test_require_text_treats_empty_response_as_failure(monkeypatch):
     """HTTP 200 без текста должен запускать fallback, а не считаться успехом."""
 
@@ -105,7 +162,7 @@ def test_require_text_treats_empty_response_as_failure(monkeypatch):
         def _build_model(self, api_key, model_name):
             return FakeGeminiModel()
 
-    monkeypatch.setattr("AI.wrapper._throttle_key", lambda api_key: None)
+    monkeypatch.setattr("AI.wrapper.rate_limiter", RateLimiter())
 
     wrapper = FakeWrapper(["gemini-empty"], ["gemini-empty"], keys_pool=["key"])
     try:
@@ -1,5 +1,7 @@
 """Tests for the current GigaChat conversation wrapper."""
 
+import asyncio
+import time
 from types import SimpleNamespace
 
 from tests import test_smoke_imports  # noqa: F401  (env + mocks)
@@ -21,17 +23,12 @@ def test_request_uses_new_endpoint_and_chat_payload(monkeypatch):
         def __init__(self, **kwargs):
             captured["client_kwargs"] = kwargs
 
-        def __enter__(self):
-            return self
-
-        def __exit__(self, exc_type, exc, tb):
-            return False
-
         def chat(self, payload):
             captured["payload"] = payload
             return _response(payload.model, "answer")
 
     monkeypatch.setattr(gc, "GigaChat", FakeGigaChat)
+    monkeypatch.setattr(gc, "_clients", {})
 
     wrapper = gc.GigaChatConversationWrapper(
         "fake-key",
@@ -47,6 +44,7 @@ def test_request_uses_new_endpoint_and_chat_payload(monkeypatch):
 
     assert result.text == "answer"
     assert captured["client_kwargs"]["base_url"] == "https://api.giga.chat/v1"
+    assert captured["client_kwargs"]["credentials"] == "fake-key"
     assert "temperature" not in captured["client_kwargs"]
     assert "max_tokens" not in captured["client_kwargs"]
 
@@ -64,12 +62,6 @@ def test_special_chat_falls_back_and_remembers_model_per_chat(monkeypatch):
         def __init__(self, **kwargs):
             pass
 
-        def __enter__(self):
-            return self
-
-        def __exit__(self, exc_type, exc, tb):
-            return False
-
         def chat(self, payload):
             attempted_models.append(payload.model)
             if payload.model == "GigaChat-3-Ultra":
@@ -77,6 +69,7 @@ def test_special_chat_falls_back_and_remembers_model_per_chat(monkeypatch):
             return _response(payload.model)
 
     monkeypatch.setattr(gc, "GigaChat", FakeGigaChat)
+    monkeypatch.setattr(gc, "_clients", {})
 
     wrapper = gc.GigaChatConversationWrapper(
         "fake-key",
@@ -110,3 +103,52 @@ def test_non_text_prompt_is_rejected_before_network(monkeypatch):
         assert "text prompts only" in str(exc)
     else:
         raise AssertionError("Expected TypeError for non-text prompt")
+
+
+def test_one_pooled_client_per_credential_for_sync_and_async(monkeypatch):
+    created = []
+
+    class FakeGigaChat:
+        def __init__(self, **kwargs):
+            created.append(kwargs["credentials"])
+
+        def chat(self, payload):
+            return _response(payload.model, "sync")
+
+        async def achat(self, payload):
+            return _response(payload.model, "async")
+
+    monkeypatch.setattr(gc, "GigaChat", FakeGigaChat)
+    monkeypatch.setattr(gc, "_clients", {})
+
+    wrapper = gc.GigaChatConversationWrapper("key-a", ["GigaChat-2"], ["GigaChat-2"])
+    other = gc.GigaChatConversationWrapper("key-a", ["GigaChat-2-Pro"], ["GigaChat-2-Pro"])
+    assert wrapper.generate_content("раз", chat_id=1).text == "sync"
+    assert wrapper.generate_content("два", chat_id=1).text == "sync"
+    assert asyncio.run(other.agenerate_content("три", chat_id=1)).text == "async"
+    assert created == ["key-a"]
+
+    gc.get_client("key-b")
+    assert created == ["key-a", "key-b"]
+
+
+def test_refresh_token_renews_only_near_expiry(monkeypatch):
+    issued = []
+
+    def fake_auth_sync(client, *, url, credentials, scope):
+        issued.append(credentials)
+        return SimpleNamespace(access_token=f"tok{len(issued)}", expires_at=(time.time() + 1800) * 1000)
+
+    monkeypatch.setattr(gc.gigachat_auth, "auth_sync", fake_auth_sync)
+    client = SimpleNamespace(
+        _access_token=SimpleNamespace(access_token="old", expires_at=(time.time() + 60) * 1000),
+        _settings=SimpleNamespace(auth_url="https://auth", credentials="cred", scope="GIGACHAT_API_PERS"),
+        _auth_client=object(),
+    )
+
+    delay = gc.refresh_token(client)           # expires in 60 s < TOKEN_REFRESH_LEAD
+    assert client._access_token.access_token == "tok1" and issued == ["cred"]
+    assert abs(delay - (1800 - gc.TOKEN_REFRESH_LEAD)) < 5
+
+    gc.refresh_token(client)                   # still fresh: no round-trip
+    assert issued == ["cred"]
@@ -3,7 +3,7 @@
 """
 from tests import test_smoke_imports  # noqa: F401  (env + моки)
 
-EXPECTED_TOTAL_HANDLERS = 101  # 94 + когда-говорили, рассуди, пиздиш, комикс + кракадил наоборот (msg+cb) + праздники
+EXPECTED_TOTAL_HANDLERS = 104  # 94 + когда-говорили, рассуди, пиздиш, комикс + кракадил наоборот (msg+cb) + праздники + лексикон пересобрать + телеметрия + память
 
 
 def _count_handlers(router):
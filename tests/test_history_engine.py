@@ -0,0 +1,105 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from core import history_engine, message_log
+from core.log_record import LogRecord
+
+
+def _line(dt, chat_id, user_id, text):
+    return f"{dt.isoformat()} - Chat {chat_id} (Чат) - User {user_id} (u{user_id}) [Юзер {user_id}]: {text}\n"
+
+
+DIALOG = [
+    (1, "кто пойдёт пить пиво вечером"),
+    (2, "я пойду"),
+    (2, "только после работы"),
+    (3, "а я нет"),
+    (1, "погода сегодня мерзкая"),
+    (3, "как всегда"),
+] + [(4, f"флуд номер {i}") for i in range(10)]
+
+
+def _make_engine(tmp_path, monkeypatch):
+    log = message_log.MessageLog(str(tmp_path / "messages"))
+    base = datetime(2026, 1, 1, 10, 0, 0, 1)
+
+    async def write():
+        for i, (user_id, text) in enumerate(DIALOG):
+            dt = base + timedelta(minutes=i)
+            await log.append(-100, dt, _line(dt, -100, user_id, text))
+
+    asyncio.run(write())
+    monkeypatch.setattr(history_engine, "message_log", log)
+    engine = history_engine.HistoryEngine()
+    log.subscribe(engine.on_message)
+    return log, engine
+
+
+def test_answer_is_continuation_by_same_author(tmp_path, monkeypatch):
+    _log, engine = _make_engine(tmp_path, monkeypatch)
+
+    assert engine.find_answer("а пиво вечером будет?", "-100", depth=3) == "я пойду только после работы"
+    assert engine.find_answer("погода мерзкая", "-100") == "как всегда"
+    assert engine.find_answer("квантовая хромодинамика", "-100") is None
+
+
+def test_index_picks_up_new_messages(tmp_path, monkeypatch):
+    log, engine = _make_engine(tmp_path, monkeypatch)
+    assert engine.find_answer("шашлык на даче", "-100") is None
+
+    base = datetime(2026, 1, 2, 10, 0, 0, 1)
+
+    async def write():
+        await log.append(-100, base, _line(base, -100, 1, "шашлык на даче в субботу"))
+        dt = base + timedelta(minutes=1)
+        await log.append(-100, dt, _line(dt, -100, 5, "беру мангал"))
+        for i in range(history_engine.SKIP_LAST):
+            dt = base + timedelta(minutes=i + 2)
+            await log.append(-100, dt, _line(dt, -100, 4, f"ещё флуд {i}"))
+
+    asyncio.run(write())
+
+    # индекс не занят поиском — подписчик дописал сообщения сразу, очередь пуста
+    assert engine._chats.peek("-100").pending == []
+    assert engine.find_answer("шашлык на даче", "-100") == "беру мангал"
+
+
+def test_long_single_author_run_is_linear():
+    history = history_engine._ChatHistory()
+    base = datetime(2026, 1, 1)
+    for i in range(20_000):
+        history.append(LogRecord(base + timedelta(seconds=i), "-100", "Чат", "7", "u7", "Юзер", f"сообщение {i}"))
+    assert history.run_length(0, 3) == 3
+    assert history.run_length(19_998, 3) == 2
+
+
+def test_index_cache_is_bounded(tmp_path, monkeypatch):
+    _log, engine = _make_engine(tmp_path, monkeypatch)
+    for i in range(history_engine.MAX_CHATS + 5):
+        engine.find_answer("пиво", str(i))
+    assert len(engine._chats) == history_engine.MAX_CHATS
+
+
+def test_messages_logged_during_build_are_kept_once(monkeypatch):
+    base = datetime(2026, 1, 1, 10, 0, 0)
+    old = [LogRecord(base + timedelta(minutes=i), "-100", "Чат", str(i % 3), "u", "Юзер", f"старое {i}")
+           for i in range(12)]
+    # две записи одной секунды: первую шард уже отдал, вторую — ещё нет
+    same_second = base + timedelta(hours=1)
+    seen = LogRecord(same_second, "-100", "Чат", "1", "u", "Юзер", "успел в шард")
+    missed = LogRecord(same_second, "-100", "Чат", "2", "u", "Юзер", "не успел в шард")
+    engine = history_engine.HistoryEngine()
+
+    class FakeLog:
+        def iter_chat(self, chat_id):
+            yield from old
+            engine.on_message(seen)     # подписчик срабатывает, пока индекс строится
+            engine.on_message(missed)
+            yield seen
+
+    monkeypatch.setattr(history_engine, "message_log", FakeLog())
+    engine.find_answer("что-нибудь", "-100")
+
+    texts = engine._chats.peek("-100").texts
+    assert texts[-2:] == ["успел в шард", "не успел в шард"]
+    assert texts.count("успел в шард") == 1
@@ -0,0 +1,109 @@
+import asyncio
+import json
+import threading
+
+from core import json_store
+from core.json_store import JsonStateStore
+
+
+def test_marks_inside_loop_coalesce_into_one_write_per_interval(tmp_path):
+    data = {}
+    store = JsonStateStore(tmp_path / "state.json", lambda: data, interval=0.05)
+
+    async def scenario():
+        for i in range(100):
+            data[str(i)] = i
+            store.mark_dirty()
+        assert store.writes == 0
+        await asyncio.sleep(0.3)
+        assert store.writes == 1
+        data["late"] = True
+        store.mark_dirty()
+        await json_store.flush_all()
+
+    asyncio.run(scenario())
+    assert store.marks == 101 and store.writes == 2
+    saved = json.loads((tmp_path / "state.json").read_text(encoding="utf-8"))
+    assert saved["99"] == 99 and saved["late"] is True
+    assert not (tmp_path / "state.json.tmp").exists()
+
+
+def test_marks_from_worker_threads_go_through_bound_loop(tmp_path):
+    data = {"n": 0}
+    store = JsonStateStore(tmp_path / "state.json", lambda: dict(data), interval=0.05)
+
+    async def scenario():
+        json_store.bind_loop()
+
+        def worker():
+            for _ in range(20):
+                data["n"] += 1
+                store.mark_dirty()
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+        await asyncio.sleep(0.3)
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        json_store._loop = None
+    assert store.writes == 1
+    assert json.loads((tmp_path / "state.json").read_text(encoding="utf-8")) == {"n": 20}
+
+
+def test_failed_write_is_retried_without_new_marks(tmp_path, monkeypatch):
+    target = tmp_path / "later" / "state.json"   # каталога ещё нет — первая запись падает
+    store = JsonStateStore(target, lambda: {"ok": True}, interval=0.01)
+    attempts = []
+    written = threading.Event()
+    persist = store._persist
+
+    def watched_persist(payload):
+        if attempts:
+            target.parent.mkdir(exist_ok=True)   # повторная попытка пройдёт
+        persist(payload)
+        attempts.append(store.writes)
+        if store.writes:
+            written.set()
+
+    monkeypatch.setattr(store, "_persist", watched_persist)
+
+    async def scenario():
+        json_store.bind_loop()
+        store.mark_dirty()   # единственное изменение — повтор обязан случиться сам
+        return await asyncio.to_thread(written.wait, 5)
+
+    try:
+        assert asyncio.run(scenario())
+    finally:
+        json_store._loop = None
+    assert attempts == [0, 1]
+    assert json.loads(target.read_text(encoding="utf-8")) == {"ok": True}
+
+
+def test_without_loop_writes_immediately(tmp_path):
+    data = [1, 2]
+    store = JsonStateStore(tmp_path / "state.json", lambda: data)
+    store.mark_dirty()
+    assert store.writes == 1
+    assert store.read() == [1, 2]
+
+
+def test_read_completes_interrupted_write_and_drops_torn_journal(tmp_path):
+    path = tmp_path / "state.json"
+    path.write_text('{"old": true}', encoding="utf-8")
+    store = JsonStateStore(path, dict)
+
+    # упали после fsync журнала, но до os.replace — журнал новее основного файла
+    (tmp_path / "state.json.tmp").write_text('{"new": true}', encoding="utf-8")
+    assert store.read() == {"new": True}
+    assert not (tmp_path / "state.json.tmp").exists()
+
+    # упали посреди записи журнала — основной файл остаётся как был
+    (tmp_path / "state.json.tmp").write_text('{"torn": ', encoding="utf-8")
+    assert store.read() == {"new": True}
+    assert not (tmp_path / "state.json.tmp").exists()
+    assert store.read("default") == {"new": True}
+    assert JsonStateStore(tmp_path / "missing.json", dict).read("default") == "default"
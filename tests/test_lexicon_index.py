@@ -0,0 +1,81 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from core import lexicon_index, message_log
+
+
+def _line(dt, chat_id, user_id, username, full_name, text):
+    return f"{dt.isoformat()} - Chat {chat_id} (Чат) - User {user_id} ({username}) [{full_name}]: {text}\n"
+
+
+def _make_index(tmp_path, monkeypatch, rows):
+    log = message_log.MessageLog(str(tmp_path / "messages"))
+    base = datetime(2026, 1, 1, 10, 0, 0, 1)
+
+    async def write():
+        for i, (chat_id, user_id, username, full_name, text) in enumerate(rows):
+            dt = base + timedelta(minutes=i)
+            await log.append(chat_id, dt, _line(dt, chat_id, user_id, username, full_name, text))
+
+    asyncio.run(write())
+    monkeypatch.setattr(lexicon_index, "message_log", log)
+    return log, lexicon_index.LexiconIndex(str(tmp_path / "lexicon.db"))
+
+
+ROWS = [
+    (-100, 1, "vasya", "Вася Пупкин", "пиво холодное пиво"),
+    (-100, 2, "petya", "Петя", "холодное пиво вкусное"),
+    (-100, 1, "vasya", "Вася Пупкин", "пиво"),
+    (-200, 3, "kolya", "Коля", "пиво пиво пиво пиво"),
+]
+
+
+def test_chat_and_user_counters_catch_up_from_log(tmp_path, monkeypatch):
+    _log, index = _make_index(tmp_path, monkeypatch, ROWS)
+
+    assert index.top(-100, 1, 2) == [("пиво", 4), ("холодное", 2)]
+    assert index.top(-100, 2, 1) == [("холодное пиво", 2)]
+    assert index.top(-100, 1, 1, ["1"]) == [("пиво", 3)]
+    assert index.find_users(-100, "petya") == ["2"]
+    assert index.find_users(-100, "вася пупкин") == ["1"]
+
+
+def test_new_messages_are_added_once(tmp_path, monkeypatch):
+    log, index = _make_index(tmp_path, monkeypatch, ROWS)
+    log.subscribe(index.on_message)
+    index.ensure_chat(-100)
+
+    dt = datetime(2026, 1, 2, 10, 0, 0, 1)
+    asyncio.run(log.append(-100, dt, _line(dt, -100, 2, "petya", "Петя", "пиво")))
+
+    assert index.top(-100, 1, 1) == [("пиво", 5)]
+    # новый процесс догоняет лог без повторного счёта
+    fresh = lexicon_index.LexiconIndex(str(tmp_path / "lexicon.db"))
+    assert fresh.top(-100, 1, 1) == [("пиво", 5)]
+
+
+def test_rebuild_recounts_from_log(tmp_path, monkeypatch):
+    _log, index = _make_index(tmp_path, monkeypatch, ROWS)
+    index.ensure_chat(-100)
+
+    assert index.rebuild() == (2, 4)
+    assert index.top(-100, 1, 1) == [("пиво", 4)]
+    assert index.top(-200, 1, 1) == [("пиво", 4)]
+
+
+def test_compact_drops_rare_phrases_and_keeps_words(tmp_path, monkeypatch):
+    _log, index = _make_index(tmp_path, monkeypatch, ROWS)
+    index.ensure_chat(-100)
+
+    removed = index.compact(keep_top=2)
+
+    assert removed > 0
+    # слова не трогаются, повторявшаяся биграмма остаётся
+    assert index.top(-100, 1, 2) == [("пиво", 4), ("холодное", 2)]
+    assert index.top(-100, 2, 5) == [("холодное пиво", 2)]
+    assert index.top(-100, 3, 5) == []
+    # слова не срезаются по keep_top: по ним строится отчёт
+    assert index.top(-100, 1, 10) == [("пиво", 4), ("холодное", 2), ("вкусное", 1)]
+    # хвост фраз за keep_top срезается
+    index.compact(min_count=1, keep_top=0)
+    assert index.top(-100, 2, 5) == [] and index.top(-100, 1, 1) == [("пиво", 4)]
@@ -0,0 +1,25 @@
+from datetime import datetime
+
+from core.log_record import LogRecord, chat_marker, format_log_line, parse_log_record, timestamp_key
+
+
+def test_format_and_parse_roundtrip():
+    dt = datetime(2026, 1, 1, 10, 0, 0, 1)
+    line = format_log_line(dt, -100, "Чат (тест)", 42, "vasya", "Вася [админ]", "многострочный\nтекст: да")
+
+    record = parse_log_record(line.encode("utf-8"))
+
+    assert isinstance(record, LogRecord)
+    assert (record.timestamp, record.chat_id, record.user_id) == (dt, "-100", "42")
+    assert record.username == "vasya"
+    assert record.text == "многострочный\nтекст: да"
+    assert parse_log_record(line).text == record.text
+    assert chat_marker(-100) in line.encode("utf-8")
+
+
+def test_parse_rejects_service_lines_and_keeps_second_precision_timestamps():
+    assert parse_log_record(b"2026-01-01T10:30:00.000001 - BROADCAST - hi\n") is None
+    record = parse_log_record(b"2026-01-01T10:30:00 - Chat 5 (X) - User 1 (u) [U]: hi\n")
+    assert record.timestamp == datetime(2026, 1, 1, 10, 30)
+    # сравнение префиксов по байтам согласовано с порядком времени
+    assert timestamp_key(datetime(2026, 1, 1, 10, 29, 59, 999)) < b"2026-01-01T10:30:00"
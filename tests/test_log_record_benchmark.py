@@ -0,0 +1,77 @@
+"""Бенчмарк чтения лога: синтетический шард на 1M строк через HourIndex.iter_window.
+
+Шард пишется ~100 МБ и читается десяток секунд, поэтому в обычном прогоне
+только проверка на SMOKE_LINES строк. Бенчмарк — по явному запросу:
+    RUN_BENCHMARKS=1 python -m pytest tests/test_log_record_benchmark.py --benchmark-only
+"""
+import importlib.util
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from core import message_log
+from core.log_record import format_log_line
+
+LINES = 1_000_000
+SMOKE_LINES = 3_000
+
+benchmark_only = pytest.mark.skipif(
+    not os.environ.get("RUN_BENCHMARKS") or importlib.util.find_spec("pytest_benchmark") is None,
+    reason="бенчмарк: RUN_BENCHMARKS=1 и pytest-benchmark",
+)
+
+
+def _write_log(path, total_lines):
+    base = datetime(2025, 1, 1, 0, 0, 0, 1)
+    with open(path, "w", encoding="utf-8") as f:
+        lines = 0
+        i = 0
+        while lines < total_lines:
+            dt = base + timedelta(seconds=i * 7)
+            chat_id = -100 if i % 4 else -200
+            text = f"сообщение {i} про пиво" if i % 50 else f"многострочное {i}\nпродолжение"
+            f.write(format_log_line(dt, chat_id, "Чат", i % 30, f"user{i % 30}", f"Юзер {i % 30}", text))
+            lines += 1 + text.count("\n")
+            i += 1
+    return str(path), base + timedelta(seconds=i * 7), i
+
+
+@pytest.fixture(scope="module")
+def big_log(tmp_path_factory):
+    path, end, _records = _write_log(tmp_path_factory.mktemp("bench") / "messages.log", LINES)
+    return path, end
+
+
+def _count(log_path, chat_id, since=None):
+    return sum(1 for _ in message_log.HourIndex(log_path).iter_window(chat_id, since))
+
+
+def test_smoke_window_counts(tmp_path):
+    log_path, end, records = _write_log(tmp_path / "messages.log", SMOKE_LINES)
+    other = (records + 3) // 4   # i % 4 == 0 -> чат -200
+    assert _count(log_path, -200) == other
+    assert _count(log_path, -100) == records - other
+    # последний час: 3600 / 7 секунд на запись, три четверти из них — чат -100
+    assert 350 < _count(log_path, -100, end - timedelta(hours=1)) < 400
+
+
+@benchmark_only
+def test_parse_whole_chat(benchmark, big_log):
+    log_path, _end = big_log
+    count = benchmark.pedantic(_count, args=(log_path, -100), rounds=1, iterations=1)
+    assert count > 700_000
+
+
+@benchmark_only
+def test_prefilter_other_chat(benchmark, big_log):
+    log_path, _end = big_log
+    count = benchmark.pedantic(_count, args=(log_path, -200), rounds=1, iterations=1)
+    assert 200_000 < count < 300_000
+
+
+@benchmark_only
+def test_seek_last_day(benchmark, big_log):
+    log_path, end = big_log
+    count = benchmark.pedantic(_count, args=(log_path, -100, end - timedelta(days=1)), rounds=3, iterations=1)
+    assert 0 < count < 20_000
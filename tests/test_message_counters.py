@@ -0,0 +1,86 @@
+import asyncio
+import json
+import sqlite3
+from datetime import date
+
+from core import message_counters
+
+
+def _counters(tmp_path, backend, stats=None):
+    return message_counters.MessageCounters(
+        {} if stats is None else stats, backend,
+        json_path=str(tmp_path / "message_stats.json"), db_path=str(tmp_path / "message_stats.db"),
+    )
+
+
+def test_json_backend_writes_in_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(message_counters, "FLUSH_EVERY", 3)
+    counters = _counters(tmp_path, "json")
+    path = tmp_path / "message_stats.json"
+
+    async def run():
+        counters.increment("-100", "1", date(2026, 1, 1))
+        counters.increment("-100", "1", date(2026, 1, 1))
+        assert not path.exists()  # меньше FLUSH_EVERY — диск не трогаем
+        counters.increment("-100", "2", date(2026, 1, 1))
+        await counters.flush()
+
+    asyncio.run(run())
+    saved = json.loads(path.read_text(encoding="utf-8"))
+    assert saved["-100"]["1"]["total"] == 2
+    assert saved["-100"]["2"]["total"] == 1
+    assert not (tmp_path / "message_stats.json.tmp").exists()
+
+    reloaded = _counters(tmp_path, "json")
+    reloaded.load()
+    assert reloaded.stats == saved
+
+
+def test_json_backend_retries_failed_write(tmp_path):
+    counters = message_counters.MessageCounters(
+        {}, "json", json_path=str(tmp_path / "later" / "message_stats.json"),   # каталога ещё нет
+    )
+
+    async def run():
+        counters.increment("-100", "1", date(2026, 1, 1))
+        await counters.flush()                   # запись падает
+        (tmp_path / "later").mkdir()
+        await counters.flush()                   # без новых изменений — повтор
+
+    asyncio.run(run())
+    saved = json.loads((tmp_path / "later" / "message_stats.json").read_text(encoding="utf-8"))
+    assert saved["-100"]["1"]["total"] == 1
+
+
+def test_daily_and_weekly_reset():
+    counters = message_counters.MessageCounters({}, "json")
+    counters.increment("-100", "1", date(2026, 1, 1))
+    counters.increment("-100", "1", date(2026, 1, 2))
+    stats = counters.increment("-100", "1", date(2026, 1, 8))
+    assert (stats["total"], stats["daily"], stats["weekly"]) == (3, 1, 1)
+    assert stats["last_weekly_reset"] == "2026-01-08"
+
+
+def test_sqlite_backend_imports_json_and_adds_deltas(tmp_path):
+    (tmp_path / "message_stats.json").write_text(json.dumps({"-100": {"1": {
+        "total": 99, "daily": 5, "weekly": 7,
+        "last_daily_reset": "2026-01-01", "last_weekly_reset": "2026-01-01",
+    }}}), encoding="utf-8")
+    counters = _counters(tmp_path, "sqlite")
+    counters.load()
+    assert counters.stats["-100"]["1"]["total"] == 99
+
+    async def run():
+        assert counters.increment("-100", "1", date(2026, 1, 1))["total"] == 100
+        counters.increment("-200", "3", date(2026, 1, 1))
+        await counters.flush()
+
+    asyncio.run(run())
+    rows = sqlite3.connect(tmp_path / "message_stats.db").execute(
+        "SELECT chat_id, user_id, total, daily FROM user_counters ORDER BY chat_id"
+    ).fetchall()
+    assert rows == [("-100", "1", 100, 6), ("-200", "3", 1, 1)]
+
+    reloaded = _counters(tmp_path, "sqlite")
+    reloaded.load()
+    assert reloaded.stats == counters.stats
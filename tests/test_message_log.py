@@ -0,0 +1,224 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from core import message_log
+
+
+def _line(dt, chat_id, text, user_id=1, username="vasya", full_name="Вася"):
+    return f"{dt.isoformat()} - Chat {chat_id} (Чат) - User {user_id} ({username}) [{full_name}]: {text}\n"
+
+
+def _write_log(path, lines):
+    with open(path, "w", encoding="utf-8") as f:
+        f.writelines(lines)
+
+
+def test_window_reader_seeks_to_hour_and_filters_chat(tmp_path):
+    log = tmp_path / "user_messages.log"
+    base = datetime(2026, 1, 1, 10, 0, 0, 1)
+    lines = []
+    for h in range(48):
+        dt = base + timedelta(hours=h)
+        lines.append(_line(dt, -100, f"сообщение {h}"))
+        lines.append(_line(dt, -200, f"чужое {h}"))
+    _write_log(log, lines)
+
+    index = message_log.HourIndex(str(log))
+    since = base + timedelta(hours=45)
+    records = list(index.iter_window(-100, since))
+
+    assert [r.text for r in records] == ["сообщение 45", "сообщение 46", "сообщение 47"]
+    assert index.offset_for(since) > 0
+    assert (tmp_path / "user_messages.log.idx").exists()
+
+
+def test_multiline_records_and_until(tmp_path):
+    log = tmp_path / "user_messages.log"
+    base = datetime(2026, 1, 1, 10, 0, 0, 1)
+    _write_log(log, [
+        _line(base, -100, "первая\nвторая строка"),
+        "2026-01-01T10:30:00.000001 - BROADCAST - рассылка\n",
+        _line(base + timedelta(hours=1), -100, "потом"),
+        _line(base + timedelta(hours=5), -100, "слишком поздно"),
+    ])
+
+    index = message_log.HourIndex(str(log))
+    records = list(index.iter_window(-100, base, until=base + timedelta(hours=2)))
+
+    assert [r.text for r in records] == ["первая\nвторая строка", "потом"]
+
+
+def test_index_catches_up_with_appended_records(tmp_path):
+    log = tmp_path / "user_messages.log"
+    base = datetime(2026, 1, 1, 10, 0, 0, 1)
+    _write_log(log, [_line(base, -100, "старое")])
+    message_log.HourIndex(str(log)).load()
+
+    later = base + timedelta(hours=3)
+    with open(log, "ab") as f:
+        offset = f.tell()
+        f.write(_line(later, -100, "новое").encode("utf-8"))
+
+    # новый экземпляр читает сайдкар и догоняет хвост
+    index = message_log.HourIndex(str(log))
+    assert index.offset_for(later) == offset
+    assert [r.text for r in index.iter_window(-100, later)] == ["новое"]
+
+
+def test_message_log_append_and_iter_chat(tmp_path):
+    log = message_log.MessageLog(str(tmp_path / "messages"))
+    base = datetime(2026, 1, 1, 10, 0, 0, 1)
+
+    async def write():
+        for i in range(5):
+            dt = base + timedelta(hours=i)
+            await log.append(-100, dt, _line(dt, -100, f"раз {i}"))
+            await log.append(-200, dt, _line(dt, -200, f"два {i}"))
+
+    asyncio.run(write())
+
+    assert sorted(log.chat_ids()) == ["-100", "-200"]
+    assert [r.text for r in log.iter_chat(-100)] == [f"раз {i}" for i in range(5)]
+    assert [r.text for r in log.iter_chat("-200", since=base + timedelta(hours=3))] == ["два 3", "два 4"]
+    assert [r.text for r in log.iter_chat(-100, reverse=True)][:2] == ["раз 4", "раз 3"]
+
+
+def test_migrate_legacy_splits_log_by_chat(tmp_path):
+    legacy = tmp_path / "user_messages.log"
+    base = datetime(2026, 1, 1, 10, 0, 0, 1)
+    _write_log(legacy, [
+        _line(base, -100, "старое\nмногострочное"),
+        "2026-01-01T10:30:00.000001 - BROADCAST - рассылка\n",
+        _line(base, 42, "личка"),
+    ])
+    log = message_log.MessageLog(str(tmp_path / "messages"))
+
+    # сообщение, успевшее прийти до миграции, должно оказаться после старых
+    later = base + timedelta(hours=1)
+    asyncio.run(log.append(-100, later, _line(later, -100, "новое")))
+
+    assert log.migrate_legacy(str(legacy)) == 2
+    assert log.migrate_legacy(str(legacy)) == 0
+    assert [r.text for r in log.iter_chat(-100)] == ["старое\nмногострочное", "новое"]
+    assert [r.text for r in log.iter_chat(42)] == ["личка"]
+
+
+def test_reverse_reader_matches_forward_and_stops_early(tmp_path):
+    log = tmp_path / "user_messages.log"
+    base = datetime(2026, 1, 1, 10, 0, 0, 1)
+    lines = []
+    for i in range(300):
+        dt = base + timedelta(minutes=i)
+        text = f"строка {i}\nпродолжение {i}" if i % 7 == 0 else f"строка {i}"
+        lines.append(_line(dt, -100 if i % 3 else -200, text))
+    _write_log(log, lines)
+
+    with open(log, "rb") as f:
+        forward = list(message_log.iter_raw_records(f))
+        # маленький блок — записи режутся границами блоков
+        backward = list(message_log.iter_raw_records_reverse(f, block_size=37))
+    assert backward == forward[::-1]
+
+    index = message_log.HourIndex(str(log))
+    newest = list(index.iter_window(-100, reverse=True))
+    assert [r.text for r in newest[:2]] == ["строка 299", "строка 298"]
+    since = base + timedelta(minutes=290)
+    assert [r.text for r in index.iter_window(-100, since, reverse=True)] == [
+        r.text for r in index.iter_window(-100, since)
+    ][::-1]
+
+
+def test_month_rollover_archives_compressed_segment(tmp_path):
+    root = tmp_path / "messages"
+    log = message_log.MessageLog(str(root))
+    jan = datetime(2026, 1, 31, 23, 0, 0, 1)
+    feb = datetime(2026, 2, 1, 0, 30, 0, 1)
+
+    async def write():
+        await log.append(-100, jan, _line(jan, -100, "январь\nдве строки"))
+        await log.append(-100, jan + timedelta(minutes=1), _line(jan + timedelta(minutes=1), -100, "январь 2"))
+        await log.append(-100, feb, _line(feb, -100, "февраль"))
+
+    asyncio.run(write())  # asyncio.run дожидается фонового сжатия
+
+    manifest = log.read_manifest(-100)
+    assert [(e["records"], e["start"][:7], e["end"][:7]) for e in manifest] == [(2, "2026-01", "2026-01")]
+    archive = root / "-100" / message_log.ARCHIVE_DIR
+    assert sorted(p.name for p in archive.iterdir()) == [manifest[0]["file"]]
+    assert manifest[0]["file"].endswith(".log.gz")
+
+    texts = ["январь\nдве строки", "январь 2", "февраль"]
+    assert [r.text for r in log.iter_chat(-100)] == texts
+    assert [r.text for r in log.iter_chat(-100, reverse=True)] == texts[::-1]
+    assert [r.text for r in log.iter_chat(-100, until=jan + timedelta(minutes=1))] == texts[:2]
+
+
+def test_reverse_reads_archived_segment_in_growing_windows(tmp_path, monkeypatch):
+    monkeypatch.setattr(message_log, "REVERSE_SEGMENT_WINDOW", 2)
+    log = message_log.MessageLog(str(tmp_path / "messages"))
+    jan = datetime(2026, 1, 1, 10, 0, 0, 1)
+    feb = datetime(2026, 2, 1, 10, 0, 0, 1)
+
+    async def write():
+        for i in range(11):
+            dt = jan + timedelta(minutes=i)
+            await log.append(-100, dt, _line(dt, -100, f"январь {i}"))
+        await log.append(-100, feb, _line(feb, -100, "февраль"))
+
+    asyncio.run(write())
+
+    read = []
+    iter_segment = log._iter_segment
+    monkeypatch.setattr(log, "_iter_segment", lambda *args: (read.append(r) or r for r in iter_segment(*args)))
+
+    newest = log.iter_chat(-100, reverse=True)
+    assert next(newest).text == "февраль"
+    assert read == []             # хватило активного сегмента — архив не открыт
+    assert [next(newest).text for _ in range(2)] == ["январь 10", "январь 9"]
+    assert len(read) == 11        # первый проход: весь сегмент, в памяти — окно из двух записей
+    rest = [r.text for r in newest]
+    assert rest == [f"январь {i}" for i in range(8, -1, -1)]
+    # окна 2, 4, 8: следующие проходы обрываются на уже отданных записях
+    assert len(read) == 11 + 9 + 5
+
+
+def test_segments_outside_window_are_not_opened(tmp_path, monkeypatch):
+    log = message_log.MessageLog(str(tmp_path / "messages"))
+
+    async def write():
+        for month in range(1, 5):
+            dt = datetime(2026, month, 10, 12, 0, 0, 1)
+            await log.append(-100, dt, _line(dt, -100, f"месяц {month}"))
+
+    asyncio.run(write())
+    assert len(log.read_manifest(-100)) == 3
+
+    opened = []
+    original = message_log._open_segment
+    monkeypatch.setattr(message_log, "_open_segment", lambda path: opened.append(path) or original(path))
+    since = datetime(2026, 3, 1)
+    assert [r.text for r in log.iter_chat(-100, since=since)] == ["месяц 3", "месяц 4"]
+    assert len(opened) == 1
+
+
+def test_archive_old_splits_past_months(tmp_path):
+    root = tmp_path / "messages"
+    (root / "-100").mkdir(parents=True)
+    lines = [
+        _line(datetime(2025, 11, 5, 10, 0, 0, 1), -100, "ноябрь"),
+        _line(datetime(2025, 12, 5, 10, 0, 0, 1), -100, "декабрь"),
+        _line(datetime(2025, 12, 6, 10, 0, 0, 1), -100, "декабрь 2"),
+        _line(datetime(2026, 1, 5, 10, 0, 0, 1), -100, "январь"),
+    ]
+    _write_log(root / "-100" / message_log.SHARD_FILE, lines)
+    log = message_log.MessageLog(str(root))
+    assert [r.text for r in log.iter_chat(-100)][-1] == "январь"  # индекс старого файла
+
+    assert log.archive_old() == 2
+    assert log.archive_old() == 0
+    assert [e["records"] for e in log.read_manifest(-100)] == [1, 2]
+    with open(root / "-100" / message_log.SHARD_FILE, encoding="utf-8") as f:
+        assert f.read() == lines[-1]
+    assert [r.text for r in log.iter_chat(-100)] == ["ноябрь", "декабрь", "декабрь 2", "январь"]
+    since = datetime(2026, 1, 5, 9)
+    assert [r.text for r in log.iter_chat(-100, since=since)] == ["январь"]
@@ -0,0 +1,82 @@
+"""Таблица здоровья пар модель/ключ и маршрутизация фоллбэка Gemini (без сети)."""
+from types import SimpleNamespace
+
+from tests import test_smoke_imports  # noqa: F401  (env + моки)
+
+import pytest
+
+from AI import wrapper
+from core import model_health as mh
+from core.rate_limiter import RateLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_retry_after_hint_sources():
+    class HeaderError(Exception):
+        response = SimpleNamespace(headers={"retry-after": "12"})
+
+    class DetailsError(Exception):
+        details = {"error": {"details": [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "37s"}]}}
+
+    assert mh.retry_after_hint(HeaderError("429")) == 12.0
+    assert mh.retry_after_hint(DetailsError("429 RESOURCE_EXHAUSTED")) == 37.0
+    assert mh.retry_after_hint(RuntimeError("Quota exceeded. Please retry in 4.5s.")) == 4.5
+    assert mh.retry_after_hint(RuntimeError("500 internal")) is None
+
+
+def test_cooldowns_hints_doubling_and_recovery():
+    clock = FakeClock()
+    health = mh.ModelHealth(clock=clock)
+    pairs = [("pro", 0), ("pro", 1), ("flash", 0)]
+
+    assert health.record_failure("gemini", "pro", 0, quota=True, retry_after=20) == 20
+    assert health.rank("gemini", pairs) == [("pro", 1), ("flash", 0)]
+    clock.now += 21
+    # без подсказки — QUOTA_COOLDOWN, удваиваясь с каждым 429 подряд
+    assert health.record_failure("gemini", "pro", 0, quota=True) == 2 * mh.QUOTA_COOLDOWN
+    clock.now += 2 * mh.QUOTA_COOLDOWN + 1
+    assert health.record_failure("gemini", "pro", 0, quota=True) == 4 * mh.QUOTA_COOLDOWN
+    assert health.record_failure("gemini", "flash", 0, quota=True, daily=True, retry_after=5, error="quota") == mh.DAILY_COOLDOWN
+    assert health.record_failure("gemini", "pro", 1, overload=True) == mh.OVERLOAD_COOLDOWN
+    assert health.rank("gemini", pairs) == []
+    assert "остывает ещё 3600с (quota)" in mh.format_report(health.snapshot())
+
+    # после остывания пара вернулась, но битая — в конец; со временем штраф забывается
+    clock.now += 4 * mh.QUOTA_COOLDOWN + 1
+    assert health.rank("gemini", pairs) == [("pro", 1), ("pro", 0)]
+    clock.now += 10 * mh.RECOVERY_HALF_LIFE
+    health.record_success("gemini", "pro", 0, 1.5)
+    assert health.rank("gemini", pairs)[0] == ("pro", 0)
+
+
+def test_exhausted_quotas_fail_fast_without_requests(monkeypatch):
+    health = mh.ModelHealth()
+    monkeypatch.setattr(wrapper, "model_health", health)
+    monkeypatch.setattr(wrapper, "rate_limiter", RateLimiter())
+    monkeypatch.setattr(wrapper.time, "sleep", lambda seconds: pytest.fail("sleep in fallback"))
+    calls = []
+
+    class Error429(Exception):
+        code = 429
+
+    def request(model_obj):
+        calls.append(model_obj.model_name)
+        raise Error429("quota")
+
+    gemini = wrapper.ModelFallbackWrapper(["pro", "flash"], ["pro", "flash"], keys_pool=["a", "b"])
+    monkeypatch.setattr(gemini, "_build_model", lambda api_key, model_name: SimpleNamespace(model_name=model_name))
+
+    with pytest.raises(RuntimeError, match="лимиты Gemini"):
+        gemini._run_with_fallback("generate_content", None, request)
+    assert len(calls) == 4          # каждая пара — один раз, без повторов
+
+    with pytest.raises(RuntimeError, match="лимиты Gemini"):
+        gemini._run_with_fallback("generate_content", None, request)
+    assert len(calls) == 4          # все пары остывают — ни одного запроса
@@ -26,17 +26,14 @@ def test_gemini_queues_have_no_dead_models():
     assert settings.MODEL_QUEUE_DEFAULT, "очередь по умолчанию пуста"
 
 
-def test_throttle_is_per_key(monkeypatch):
-    """Разные ключи не блокируют друг друга; один ключ — выдерживает паузу."""
-    from AI import wrapper
-    monkeypatch.setattr(wrapper, "PER_KEY_MIN_DELAY", 0.3)
-    wrapper._last_call_ts.clear()
+def test_rate_limiter_is_per_key_and_model():
+    """Разные ключи и модели не блокируют друг друга; пара ключ/модель — ждёт слот."""
+    from core.rate_limiter import RateLimiter
+    limiter = RateLimiter({"fast": (600, 10**6)}, default=(6, 10**6))
 
     t0 = time.monotonic()
-    wrapper._throttle_key("key_a")
-    wrapper._throttle_key("key_b")
-    assert time.monotonic() - t0 < 0.2, "разные ключи не должны ждать друг друга"
-
-    t1 = time.monotonic()
-    wrapper._throttle_key("key_a")  # повтор того же ключа — обязан подождать
-    assert time.monotonic() - t1 >= 0.25, "повторный вызов по ключу должен троттлиться"
+    limiter.acquire("key_a", "slow")
+    limiter.acquire("key_b", "slow")
+    limiter.acquire("key_a", "fast")
+    assert time.monotonic() - t0 < 0.2, "разные пары ключ/модель не должны ждать друг друга"
+    assert limiter.try_acquire("key_a", "slow") > 5, "квота 6 в минуту: следующий слот через ~10 с"
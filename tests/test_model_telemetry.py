@@ -0,0 +1,65 @@
+"""Телеметрия вызовов моделей: гистограммы, окна и запись в обёртках (без сети)."""
+from types import SimpleNamespace
+
+from tests import test_smoke_imports  # noqa: F401  (env + моки)
+
+from AI import wrapper
+from core import model_telemetry as mt
+from core.model_health import ModelHealth
+from core.rate_limiter import RateLimiter
+
+
+class FakeWriter:
+    def __init__(self):
+        self.rows = []
+
+    def submit(self, sql, params):
+        self.rows.append(params)
+
+
+def test_histogram_quantiles_and_window_rotation():
+    hist = mt.Histogram()
+    for ms in (40, 90, 90, 400, 3000):
+        hist.add(ms)
+    assert hist.quantile(0.5) == 100
+    assert hist.quantile(0.95) == 5000
+
+    writer = FakeWriter()
+    telemetry = mt.ModelTelemetry(writer=writer, keep_windows=2)
+    telemetry.record_single("groq", "llama", 0.2, prompt_chars=10, response_chars=5, prompt_tokens=3)
+    assert telemetry.rotate() == 1
+    telemetry.record_single("groq", "llama", 1.2, error="429RateLimitError")
+    snapshot = telemetry.snapshot()[("groq", "llama", -1)]
+    assert (snapshot.calls, snapshot.failed_calls, snapshot.attempts) == (1, 1, 2)
+    assert snapshot.failures == {"429RateLimitError": 1} and snapshot.prompt_tokens == 3
+    assert writer.rows[0][1:4] == ("groq", "llama", -1)
+    assert "groq llama" in mt.format_report(telemetry.snapshot())
+
+
+def test_gemini_fallback_records_depth_attempts_and_tokens(monkeypatch):
+    telemetry = mt.ModelTelemetry(writer=FakeWriter())
+    monkeypatch.setattr(wrapper, "model_telemetry", telemetry)
+    monkeypatch.setattr(wrapper, "rate_limiter", RateLimiter())
+    monkeypatch.setattr(wrapper, "model_health", ModelHealth())
+
+    class Error503(Exception):
+        code = 503
+
+    def request(model_obj):
+        if model_obj.model_name == "bad":
+            raise Error503("overloaded")
+        return SimpleNamespace(
+            text="ответ", candidates=[],
+            usage_metadata=SimpleNamespace(prompt_token_count=7, candidates_token_count=2),
+        )
+
+    gemini = wrapper.ModelFallbackWrapper(["bad", "good"], ["bad", "good"], keys_pool=["k"])
+    monkeypatch.setattr(gemini, "_build_model", lambda api_key, model_name: SimpleNamespace(model_name=model_name))
+    gemini._run_with_fallback("generate_content", None, request, prompt_chars=12)
+
+    snapshot = telemetry.snapshot()
+    good = snapshot[("gemini", "good", 0)]
+    assert (good.calls, good.attempts_per_call, good.fallback_depth) == (1, 2, 1)
+    assert good.retry_sleep_ms == 0  # 503 не повторяется с паузами — пара остывает
+    assert (good.prompt_chars, good.response_chars, good.prompt_tokens, good.completion_tokens) == (12, 5, 7, 2)
+    assert snapshot[("gemini", "bad", 0)].failures == {"503Error503": 1}
@@ -0,0 +1,95 @@
+"""OpenAICompatibleWrapper: общий httpx-клиент, повторы, SSE и синхронный адаптер (без сети)."""
+import asyncio
+import json
+
+from tests import test_smoke_imports  # noqa: F401  (env + моки)
+
+import httpx
+import pytest
+
+from AI import wrapper
+from AI.wrapper import OpenAICompatibleWrapper
+
+
+def _completion(text: str) -> dict:
+    return {
+        "choices": [{"message": {"content": text}}],
+        "usage": {"prompt_tokens": 3, "completion_tokens": 1},
+    }
+
+
+def test_retries_429_and_5xx_then_reuses_one_client(monkeypatch):
+    statuses = [429, 503]
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request)
+        if statuses:
+            return httpx.Response(statuses.pop(0), headers={"Retry-After": "0"})
+        return httpx.Response(200, json=_completion("ответ"))
+
+    sleeps = []
+
+    async def fake_sleep(delay):
+        sleeps.append(delay)
+
+    monkeypatch.setattr(wrapper.asyncio, "sleep", fake_sleep)
+    ai = OpenAICompatibleWrapper("secret", "https://api.example.com/v1/", "m", transport=httpx.MockTransport(handler))
+
+    async def scenario():
+        first = await ai.agenerate_text("привет", max_tokens=5)
+        second = await ai.agenerate_text("ещё")
+        assert len(ai._clients) == 1      # один keep-alive клиент на цикл
+        await ai.aclose()
+        return first, second
+
+    assert asyncio.run(scenario()) == ("ответ", "ответ")
+    assert len(seen) == 4 and len(sleeps) == 2
+    assert all(0 <= delay <= wrapper.OPENAI_COMPAT_RETRY_MAX_DELAY for delay in sleeps)
+    assert str(seen[0].url) == "https://api.example.com/v1/chat/completions"
+    assert seen[0].headers["Authorization"] == "Bearer secret"
+    assert json.loads(seen[0].content)["max_tokens"] == 5
+
+
+def test_client_errors_are_not_retried(monkeypatch):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(400, json={"error": "bad request"})
+
+    ai = OpenAICompatibleWrapper("k", "https://api.example.com/v1", "m", transport=httpx.MockTransport(handler))
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(ai.agenerate_text("x"))
+    assert len(calls) == 1
+
+
+def test_sse_stream_yields_deltas():
+    body = (
+        'data: {"choices": [{"delta": {"role": "assistant"}}]}\n\n'
+        'data: {"choices": [{"delta": {"content": "при"}}]}\n\n'
+        ': keep-alive\n\n'
+        'data: {"choices": [{"delta": {"content": "вет"}}]}\n\n'
+        'data: [DONE]\n\n'
+    )
+
+    def handler(request):
+        assert json.loads(request.content)["stream"] is True
+        return httpx.Response(200, text=body, headers={"Content-Type": "text/event-stream"})
+
+    ai = OpenAICompatibleWrapper("k", "https://api.example.com/v1", "m", transport=httpx.MockTransport(handler))
+
+    async def collect():
+        return [chunk async for chunk in ai.astream_text("привет")]
+
+    assert asyncio.run(collect()) == ["при", "вет"]
+
+
+def test_sync_adapter_runs_on_background_loop():
+    def handler(request):
+        return httpx.Response(200, json=_completion("синхронно"))
+
+    ai = OpenAICompatibleWrapper("k", "https://api.example.com/v1", "m", transport=httpx.MockTransport(handler))
+    assert ai.generate_text("a") == "синхронно"
+    assert ai.generate_text("b") == "синхронно"
+    assert list(ai._clients) == [wrapper._background_loop()]
@@ -0,0 +1,82 @@
+"""Токен-бакеты RPM/TPM и выбор пары по ожиданию в фоллбэке Gemini (без сети)."""
+import asyncio
+from types import SimpleNamespace
+
+from tests import test_smoke_imports  # noqa: F401  (env + моки)
+
+from AI import wrapper
+from core import rate_limiter as rl
+from core.model_health import ModelHealth
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_throughput_approaches_published_rpm():
+    clock = FakeClock()
+    limiter = rl.RateLimiter({"m": (30, 10**9)}, clock=clock)
+    admitted = 0
+    while clock.now < 600:          # 10 минут, опрос каждые 100 мс
+        if limiter.try_acquire("k", "m") == 0:
+            admitted += 1
+        clock.now += 0.1
+    # 30 в минуту × 10 минут + стартовый залп (BURST_SECONDS квоты)
+    assert 300 <= admitted <= 300 + 30 * rl.BURST_SECONDS / 60 + 1
+
+
+def test_tokens_bucket_waits_and_settles_on_actual_usage():
+    clock = FakeClock()
+    limiter = rl.RateLimiter({"m": (600, 6000)}, clock=clock)   # 100 токенов в секунду, ёмкость 1000
+    assert limiter.try_acquire("k", "m", tokens=800) == 0
+    assert limiter.wait_time("k", "m", tokens=800) == 6.0       # не хватает 600 токенов
+    limiter.settle("k", "m", estimated=800, actual=200)          # ответ оказался дешевле
+    assert limiter.try_acquire("k", "m", tokens=800) == 0
+    # запрос крупнее ёмкости проходит при полном бакете
+    clock.now += 60
+    assert limiter.try_acquire("k", "m", tokens=5000) == 0
+    assert limiter.wait_time("k", "m", tokens=1) > 40
+
+
+def test_aacquire_waits_with_asyncio_sleep(monkeypatch):
+    limiter = rl.RateLimiter({"m": (6000, 10**9)})
+    sleeps = []
+    real_sleep = asyncio.sleep
+
+    async def tracked_sleep(delay):
+        sleeps.append(delay)
+        await real_sleep(delay)
+
+    monkeypatch.setattr(rl.asyncio, "sleep", tracked_sleep)
+
+    async def scenario():
+        for _ in range(20):     # ёмкость — 1000 запросов на 10 с; ждать не придётся
+            await limiter.aacquire("k", "m")
+        limiter._buckets[("k", "m")][0].tokens = 0
+        return await limiter.aacquire("k", "m")
+
+    waited = asyncio.run(scenario())
+    assert sleeps and 0 < waited < 0.1
+
+
+def test_fallback_picks_free_key_instead_of_sleeping(monkeypatch):
+    clock = FakeClock()
+    limiter = rl.RateLimiter(default=(6, 10**9), clock=clock)
+    monkeypatch.setattr(wrapper, "rate_limiter", limiter)
+    monkeypatch.setattr(wrapper, "model_health", ModelHealth())
+    monkeypatch.setattr(rl.time, "sleep", lambda seconds: (_ for _ in ()).throw(AssertionError("sleep")))
+    limiter.try_acquire("busy", "m")     # слот ключа "busy" занят на 10 с
+    used = []
+
+    def request(model_obj):
+        used.append(model_obj.api_key)
+        return SimpleNamespace(text="ок", candidates=[])
+
+    gemini = wrapper.ModelFallbackWrapper(["m"], ["m"], keys_pool=["busy", "free"])
+    monkeypatch.setattr(gemini, "_build_model", lambda api_key, model_name: SimpleNamespace(api_key=api_key))
+    gemini._run_with_fallback("generate_content", None, request)
+    assert used == ["free"]
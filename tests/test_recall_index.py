@@ -0,0 +1,89 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import sqlite3
+
+from tests import test_smoke_imports  # noqa: F401  (env + моки)
+
+from core import message_log, recall_index
+
+
+def _line(dt, chat_id, text, name="Вася"):
+    return f"{dt.isoformat()} - Chat {chat_id} (Чат) - User 1 (vasya) [{name}]: {text}\n"
+
+
+def _make_index(tmp_path, monkeypatch, texts_by_chat):
+    log = message_log.MessageLog(str(tmp_path / "messages"))
+    base = datetime(2026, 1, 1, 10, 0, 0, 1)
+
+    async def write():
+        for chat_id, texts in texts_by_chat.items():
+            for i, text in enumerate(texts):
+                dt = base + timedelta(minutes=i)
+                await log.append(chat_id, dt, _line(dt, chat_id, text))
+
+    asyncio.run(write())
+    monkeypatch.setattr(recall_index, "message_log", log)
+    return log, recall_index.RecallIndex(str(tmp_path / "recall.db"))
+
+
+def test_build_match_query_uses_prefixes():
+    assert recall_index.build_match_query("про сериалы") == '"про"* OR "сериа"*'
+    assert recall_index.build_match_query("кино и я") == '"кино"* OR "и" OR "я"'
+    assert recall_index.build_match_query("?!") is None
+
+
+def test_short_stem_matches_longer_word_forms(tmp_path, monkeypatch):
+    _log, index = _make_index(tmp_path, monkeypatch, {
+        -100: ["пошли в кинотеатр", "доволен кином", "кино", "пиво"],
+    })
+    index.ensure_chat(-100)
+
+    texts = {text for _seq, text in index.candidates(-100, "кино", 10)}
+    assert texts == {"пошли в кинотеатр", "доволен кином", "кино"}
+
+
+def test_candidates_are_scoped_to_chat_and_match_word_forms(tmp_path, monkeypatch):
+    _log, index = _make_index(tmp_path, monkeypatch, {
+        -100: ["смотрели сериал вчера", "погода дрянь", "сериалы это скучно"],
+        -200: ["сериал в другом чате"],
+    })
+    index.ensure_chat(-100)
+    index.ensure_chat(-200)
+
+    texts = {text for _seq, text in index.candidates(-100, "сериалы", 10)}
+    assert texts == {"смотрели сериал вчера", "сериалы это скучно"}
+    assert index.message_count(-100) == 3
+
+
+def test_window_and_incremental_updates_from_write_path(tmp_path, monkeypatch):
+    log, index = _make_index(tmp_path, monkeypatch, {-100: [f"сообщение {i}" for i in range(10)]})
+    log.subscribe(index.on_message)
+    index.ensure_chat(-100)
+
+    dt = datetime(2026, 1, 2, 10, 0, 0, 1)
+    asyncio.run(log.append(-100, dt, _line(dt, -100, "внезапно про котов")))
+    index.flush()
+
+    [(seq, text)] = index.candidates(-100, "котов", 10)
+    assert (seq, text) == (10, "внезапно про котов")
+    assert [m["text"] for m in index.window(-100, 8, 12)] == ["сообщение 8", "сообщение 9", "внезапно про котов"]
+
+    # новый процесс: догон не дублирует уже проиндексированное
+    fresh = recall_index.RecallIndex(str(tmp_path / "recall.db"))
+    fresh.ensure_chat(-100)
+    assert fresh.message_count(-100) == 11
+
+
+def test_recall_treats_index_failure_as_nothing_found(tmp_path, monkeypatch):
+    from AI import chat_recall
+
+    _log, index = _make_index(tmp_path, monkeypatch, {-100: [f"сериалы {i}" for i in range(20)]})
+
+    def broken(*_args, **_kwargs):
+        raise sqlite3.OperationalError("fts5: syntax error")
+
+    monkeypatch.setattr(index, "candidates", broken)
+    monkeypatch.setattr(chat_recall, "recall_index", index)
+
+    assert chat_recall._find_episodes("-100", "сериалы") == []
@@ -0,0 +1,85 @@
+"""Юнит-тесты хранилища эмбеддингов и векторного поиска smart_search (без сети)."""
+import asyncio
+
+import numpy as np
+
+from tests import test_smoke_imports  # noqa: F401  (env + моки)
+
+from services import smart_search as ss
+
+TOPICS = {"пиво": [1.0, 0.0, 0.0], "футбол": [0.0, 1.0, 0.0], "кот": [0.0, 0.0, 1.0]}
+
+
+def _vector(text):
+    return [sum(axis) for axis in zip(*(TOPICS[w] for w in TOPICS if w in text))] or [0.0, 0.0, 0.0]
+
+
+def _setup(tmp_path, monkeypatch):
+    calls = []
+
+    def fake_embed_documents(texts):
+        calls.append(list(texts))
+        return ss._normalize(np.array([_vector(t) for t in texts], dtype=np.float32))
+
+    monkeypatch.setattr(ss, "_embed_documents", fake_embed_documents)
+    monkeypatch.setattr(ss, "_embed_query", lambda text: ss._normalize(np.array(_vector(text), dtype=np.float32)))
+    monkeypatch.setattr(ss, "embedding_store", ss.EmbeddingStore(str(tmp_path / "embeddings")))
+    return calls
+
+
+def test_search_uses_cached_embeddings_and_embeds_only_new(tmp_path, monkeypatch):
+    calls = _setup(tmp_path, monkeypatch)
+    history = ["люблю пиво", "футбол вчера", "мой кот спит", "пиво и футбол"]
+
+    async def scenario():
+        first = await ss.find_relevant_context("где пиво", history, top_k=2, chat_id=-100, user_key="vasya")
+        second = await ss.find_relevant_context("кот", history + ["кот опять орёт"], top_k=2,
+                                                chat_id=-100, user_key="vasya")
+        await asyncio.gather(*ss.embedding_store._tasks.values())
+        return first, second
+
+    first, second = asyncio.run(scenario())
+
+    assert first == ["люблю пиво", "пиво и футбол"]
+    assert second == ["мой кот спит"]
+    assert calls == [list(reversed(history)), ["кот опять орёт"]]
+
+
+def test_store_persists_between_instances(tmp_path, monkeypatch):
+    calls = _setup(tmp_path, monkeypatch)
+    history = ["люблю пиво", "мой кот спит"]
+
+    asyncio.run(ss.find_relevant_context("пиво", history, chat_id=-100, user_key="vasya"))
+    monkeypatch.setattr(ss, "embedding_store", ss.EmbeddingStore(str(tmp_path / "embeddings")))
+    result = asyncio.run(ss.find_relevant_context("кот", history, top_k=1, chat_id=-100, user_key="vasya"))
+
+    assert result == ["мой кот спит"]
+    assert len(calls) == 1
+
+
+def test_concurrent_batches_for_one_key_embed_once(tmp_path, monkeypatch):
+    calls = _setup(tmp_path, monkeypatch)
+    store = ss.embedding_store
+    texts = ["люблю пиво", "мой кот спит"]
+
+    async def scenario():
+        await asyncio.gather(store.add_batch(("-100", "vasya"), texts), store.add_batch(("-100", "vasya"), texts))
+        return await store.entry(("-100", "vasya"))
+
+    hashes, matrix = asyncio.run(scenario())
+
+    assert calls == [texts]
+    assert len(hashes) == matrix.shape[0] == 2
+
+
+def test_entries_are_bounded(tmp_path, monkeypatch):
+    _setup(tmp_path, monkeypatch)
+    store = ss.embedding_store
+
+    async def scenario():
+        for i in range(ss.MAX_ENTRIES + 3):
+            await store.add_batch(("-100", f"user{i}"), ["пиво"])
+
+    asyncio.run(scenario())
+
+    assert len(store._entries) == ss.MAX_ENTRIES
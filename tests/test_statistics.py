@@ -0,0 +1,109 @@
+"""Отчёт "стотистика": справочники, индексы и миграция старой statistics.db."""
+import asyncio
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+from tests import test_smoke_imports  # noqa: F401  (env + моки)
+
+import features.statistics as bot_statistics
+from core.db_writer import SQLiteWriter
+
+
+def _setup(tmp_path, monkeypatch):
+    db_path = str(tmp_path / "statistics.db")
+    writer = SQLiteWriter(db_path, batch_interval=0.01)
+    monkeypatch.setattr(bot_statistics, "DB_FILE", db_path)
+    monkeypatch.setattr(bot_statistics, "stats_writer", writer)
+    return db_path, writer
+
+
+def test_migration_fills_dimension_and_rollup_tables(tmp_path, monkeypatch):
+    db_path, _writer = _setup(tmp_path, monkeypatch)
+    _create_old_db(db_path, [
+        (-100, 1, "2026-01-01 10:00:00", 0, "Старое название", "Вася", None),
+        (-100, 1, "2026-01-02 10:00:00", 0, "Новое название", "Вася", "vasya"),
+        (5, 5, "2026-01-03 10:00:00", 1, None, "Петя", None),
+    ])
+
+    bot_statistics.init_db()
+    bot_statistics.init_db()  # повторный запуск ничего не ломает
+
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT * FROM chats").fetchall() == [(-100, "Новое название", "2026-01-02 10:00:00")]
+    assert conn.execute("SELECT * FROM users ORDER BY user_id").fetchall() == [(1, "Вася", "vasya"), (5, "Петя", None)]
+    assert conn.execute("SELECT chat_id, hour, count FROM message_rollup ORDER BY hour").fetchall() == [
+        (-100, "2026-01-01 10", 1), (-100, "2026-01-02 10", 1), (5, "2026-01-03 10", 1),
+    ]
+    plan = " ".join(row[-1] for row in conn.execute(
+        "EXPLAIN QUERY PLAN SELECT chat_id, COUNT(*) FROM message_stats "
+        "WHERE is_private = 0 AND message_timestamp >= ? GROUP BY chat_id", (datetime(2026, 1, 1),)
+    ))
+    assert "idx_message_stats_private_ts" in plan
+
+
+def _create_old_db(db_path, rows):
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "CREATE TABLE message_stats (id INTEGER PRIMARY KEY AUTOINCREMENT, chat_id BIGINT NOT NULL, "
+        "user_id BIGINT NOT NULL, message_timestamp TIMESTAMP NOT NULL, message_type TEXT NOT NULL, "
+        "is_private BOOLEAN NOT NULL, chat_title TEXT, user_name TEXT, user_username TEXT)"
+    )
+    conn.executemany(
+        "INSERT INTO message_stats (chat_id, user_id, message_timestamp, message_type, is_private, "
+        "chat_title, user_name, user_username) VALUES (?, ?, ?, 'text', ?, ?, ?, ?)",
+        rows,
+    )
+    conn.commit()
+    conn.close()
+
+
+def test_report_uses_latest_names(tmp_path, monkeypatch):
+    _db_path, writer = _setup(tmp_path, monkeypatch)
+    bot_statistics.init_db()
+
+    async def write():
+        await bot_statistics.log_message(-100, 1, "text", False, "Чат", "Вася", None)
+        await bot_statistics.log_message(-100, 2, "text", False, "Чат переименован", "Петя", "petya")
+        await bot_statistics.log_message(7, 7, "text", True, None, "Коля", "kolya")
+        await bot_statistics.log_message(7, 7, "text", True, None, "Николай", "kolya")
+
+    asyncio.run(write())
+    bot_statistics.log_model_request(-100, 1, "gemini", "dialog")
+    bot_statistics.log_model_request(None, None, "gemini", "api")
+    assert writer.flush(timeout=5)
+
+    stats = bot_statistics.get_stats()
+    assert stats["groups"] == {"Чат переименован": 2}
+    assert stats["private"] == {"Николай (@kolya)": 2}
+    assert stats["model_usage"] == {"Чат переименован": 1, "Неизвестный чат / API": 1}
+
+
+def test_windows_combine_rollups_with_raw_edge_and_survive_compaction(tmp_path, monkeypatch):
+    db_path, writer = _setup(tmp_path, monkeypatch)
+    now = datetime.now()
+    ages = [timedelta(minutes=m) for m in (5, 50, 70, 130, 23 * 60 + 50, 25 * 60)] + [timedelta(days=200)]
+    _create_old_db(db_path, [
+        (-100, 1, (now - age).strftime("%Y-%m-%d %H:%M:%S.%f"), 0, "Чат", "Вася", None) for age in ages
+    ])
+    bot_statistics.init_db()
+
+    assert bot_statistics.get_stats(1)["groups"] == {"Чат": 2}
+    assert bot_statistics.get_stats(24)["groups"] == {"Чат": 5}
+    assert bot_statistics.get_stats()["groups"] == {"Чат": 7}
+
+    bot_statistics.compact_raw_stats(retention_days=30)
+    assert writer.flush(timeout=5)
+    assert sqlite3.connect(db_path).execute("SELECT COUNT(*) FROM message_stats").fetchone() == (6,)
+    assert bot_statistics.get_stats()["groups"] == {"Чат": 7}
+    assert bot_statistics.get_stats(24)["groups"] == {"Чат": 5}
+
+
+def test_model_usage_window_is_utc(tmp_path, monkeypatch):
+    _db_path, writer = _setup(tmp_path, monkeypatch)
+    bot_statistics.init_db()
+    bot_statistics.log_model_request(-100, 1, "gemini", "dialog")
+    assert writer.flush(timeout=5)
+
+    assert bot_statistics.get_stats(1)["model_usage"] == {"ID: -100": 1}
+    row = sqlite3.connect(_db_path).execute("SELECT timestamp FROM model_stats").fetchone()
+    assert row[0][:13] == datetime.now(timezone.utc).strftime("%Y-%m-%d %H")
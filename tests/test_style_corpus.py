@@ -0,0 +1,97 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from core import message_log, style_corpus
+
+
+def _line(dt, chat_id, username, full_name, text):
+    return f"{dt.isoformat()} - Chat {chat_id} (Чат) - User 1 ({username}) [{full_name}]: {text}\n"
+
+
+def test_corpus_is_loaded_once_and_kept_fresh(tmp_path, monkeypatch):
+    log = message_log.MessageLog(str(tmp_path / "messages"))
+    monkeypatch.setattr(style_corpus, "message_log", log)
+    monkeypatch.setattr(style_corpus, "STYLE_CORPUS_MAX_MESSAGES", 3)
+    cache = style_corpus.StyleCorpusCache()
+    log.subscribe(cache.on_message)
+    base = datetime(2026, 1, 1, 10, 0, 0, 1)
+
+    async def scenario():
+        for i in range(4):
+            dt = base + timedelta(minutes=i)
+            await log.append(-100, dt, _line(dt, -100, "vasya", "Вася", f"старое {i}"))
+            await log.append(-100, dt, _line(dt, -100, "petya", "Петя", f"чужое {i}"))
+
+        everything = await cache.load(-100, username="vasya")
+
+        scans = []
+        monkeypatch.setattr(cache, "_scan", lambda key: scans.append(key))
+        dt = base + timedelta(hours=1)
+        await log.append(-100, dt, _line(dt, -100, "vasya", "Вася", "новое"))
+        cached = await cache.get(-100, username="vasya")
+        return everything, cached, scans
+
+    everything, cached, scans = asyncio.run(scenario())
+
+    assert everything == [f"старое {i}" for i in range(4)]
+    assert cached == ["старое 2", "старое 3", "новое"]
+    assert scans == []
+
+
+def test_full_name_lookup_is_case_insensitive(tmp_path, monkeypatch):
+    log = message_log.MessageLog(str(tmp_path / "messages"))
+    monkeypatch.setattr(style_corpus, "message_log", log)
+    cache = style_corpus.StyleCorpusCache()
+    dt = datetime(2026, 1, 1, 10, 0, 0, 1)
+
+    async def scenario():
+        await log.append(-100, dt, _line(dt, -100, "NoUsername", "Вася Пупкин", "привет"))
+        return await cache.get(-100, full_name="вася пупкин")
+
+    assert asyncio.run(scenario()) == ["привет"]
+
+
+def test_empty_lookup_is_remembered_and_filled(tmp_path, monkeypatch):
+    log = message_log.MessageLog(str(tmp_path / "messages"))
+    monkeypatch.setattr(style_corpus, "message_log", log)
+    cache = style_corpus.StyleCorpusCache()
+    log.subscribe(cache.on_message)
+    scans = []
+    scan = cache._scan
+    monkeypatch.setattr(cache, "_scan", lambda key: scans.append(key) or scan(key))
+    dt = datetime(2026, 1, 1, 10, 0, 0, 1)
+
+    async def scenario():
+        await log.append(-100, dt, _line(dt, -100, "NoUsername", "Вася Пупкин", "привет"))
+        by_username = await cache.load(-100, username="Вася Пупкин")
+        by_name = await cache.load(-100, full_name="Вася Пупкин")
+        cache.forget(-100, username="Вася Пупкин")
+
+        silent = [await cache.get(-100, username="petya") for _ in range(3)]
+        later = dt + timedelta(minutes=1)
+        await log.append(-100, later, _line(later, -100, "petya", "Петя", "я тут"))
+        spoke = await cache.get(-100, username="petya")
+        return by_username, by_name, silent, spoke
+
+    by_username, by_name, silent, spoke = asyncio.run(scenario())
+
+    assert by_username == [] and by_name == ["привет"]
+    assert silent == [[], [], []] and spoke == ["я тут"]
+    # шард петиного корпуса прочитан один раз; промах по username убран после поиска по имени
+    assert [key[1:] for key in scans] == [("username", "Вася Пупкин"), ("full_name", "вася пупкин"),
+                                          ("username", "petya")]
+    assert list(cache._misses) == []
+    assert list(cache._corpora) == [("-100", "full_name", "вася пупкин"), ("-100", "username", "petya")]
+
+
+def test_concurrent_misses_share_one_scan(tmp_path, monkeypatch):
+    log = message_log.MessageLog(str(tmp_path / "messages"))
+    monkeypatch.setattr(style_corpus, "message_log", log)
+    cache = style_corpus.StyleCorpusCache()
+    dt = datetime(2026, 1, 1, 10, 0, 0, 1)
+
+    async def scenario():
+        await log.append(-100, dt, _line(dt, -100, "bob", "Боб", "привет"))
+        return await asyncio.gather(cache.get(-100, "bob"), cache.get(-100, "bob"), return_exceptions=True)
+
+    assert asyncio.run(scenario()) == [["привет"], ["привет"]]
@@ -20,7 +20,7 @@ def test_profile_generation_uses_groq_fallback_on_empty_primary_response(monkeyp
     captured = {}
 
     class EmptyGemini:
-        def generate_content(self, prompt, **kwargs):
+        async def agenerate_content(self, prompt, **kwargs):
             captured["gemini_kwargs"] = kwargs
             return SimpleNamespace(text="")
 
@@ -46,11 +46,11 @@ def test_profile_generation_supports_openrouter(monkeypatch):
     whoparody.chat_settings["12345"] = {"active_model": "openrouter"}
 
     class OpenRouter:
-        def generate_text(self, prompt):
+        async def agenerate_text(self, prompt):
             return "ответ openrouter"
 
     class GeminiMustNotRun:
-        def generate_content(self, *args, **kwargs):
+        async def agenerate_content(self, *args, **kwargs):
             raise AssertionError("Gemini should not be called for active_model=openrouter")
 
     monkeypatch.setattr(whoparody, "openrouter_ai", OpenRouter())
@@ -59,3 +59,20 @@ def test_profile_generation_supports_openrouter(monkeypatch):
     result = asyncio.run(whoparody.generate_with_active_model("тест", 12345))
 
     assert result == "ответ openrouter"
+
+
+def test_profile_generation_awaits_gigachat_async_path(monkeypatch):
+    from AI import whoparody
+
+    whoparody.chat_settings["12345"] = {"active_model": "gigachat"}
+
+    class GigaChat:
+        async def agenerate_content(self, prompt, chat_id=None):
+            return SimpleNamespace(text=f"гигачат: {prompt}")
+
+        def generate_content(self, *args, **kwargs):
+            raise AssertionError("sync GigaChat path should not be used")
+
+    monkeypatch.setattr(whoparody, "gigachat_model", GigaChat())
+
+    assert asyncio.run(whoparody.generate_with_active_model("тест", 12345)) == "гигачат: тест"